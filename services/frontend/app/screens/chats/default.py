@@ -1,5 +1,5 @@
 import streamlit as st
-from screens.chats.state import get_chat_client, get_chat_response
+from screens.chats.state import get_chat_client, get_chat_response_stream, trim_messages
 
 def chat_sidebar():
     with st.sidebar:
@@ -47,9 +47,15 @@ def chat_entry():
         st.session_state.messages.append(user_message)
         chat_message(user_message)
 
-        ai_message = get_chat_response(client, st.session_state.messages)
+        timings = {}
+        window, tokens_saved = trim_messages(st.session_state.messages)
+        with st.chat_message("assistant"):
+            ai_content = st.write_stream(get_chat_response_stream(client, window, timings))
+            st.caption(f"first token {timings.get('time_to_first_token', timings['total']):.2f}s · total {timings['total']:.2f}s · {tokens_saved} history tokens trimmed")
+
+        ai_message = {"role": "assistant", "content": ai_content}
         st.session_state.messages.append(ai_message)
-        chat_message(ai_message)
+        st.session_state.timings.append(timings)
 
 
 client = get_chat_client()
@@ -57,6 +63,9 @@ client = get_chat_client()
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+if "timings" not in st.session_state:
+    st.session_state.timings = []
+
 chat_sidebar()
 
 chat_header()
@@ -1,15 +1,56 @@
+import os
+import time
+from typing import Callable, Iterator
+import streamlit as st
 from azure.ai.projects import AIProjectClient
 from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import ChatRequestMessage
 from azure.identity import DefaultAzureCredential
 
-connstr = "eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1"
-project = AIProjectClient.from_connection_string(connstr, DefaultAzureCredential())
+connstr = os.environ.get(
+    "AIPROJECT_CONNECTION_STRING",
+    "eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1",
+)
 
+CONTEXT_WINDOW_TOKENS = int(os.environ.get("CONTEXT_WINDOW_TOKENS", "2000"))
+CONTEXT_RECENT_TURNS = int(os.environ.get("CONTEXT_RECENT_TURNS", "6"))
+
+# streamlit re-runs the page script on every interaction; cache_resource keeps one
+# project client and one chat client per server process instead of one per rerun
+@st.cache_resource
+def get_project_client() -> AIProjectClient:
+    return AIProjectClient.from_connection_string(connstr, DefaultAzureCredential())
+
+@st.cache_resource
 def get_chat_client() -> ChatCompletionsClient:
-    client = project.inference.get_chat_completions_client()
+    client = get_project_client().inference.get_chat_completions_client()
     return client
 
+@st.cache_resource
+def get_token_counter() -> Callable[[str], int]:
+    # same counter as the workshop's chunker and context window (workshop/scripts/
+    # chunking.py): cl100k_base, or 4 characters per token rounded up without tiktoken
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: -(-len(text) // 4)
+
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(tokenizer.encode_ordinary(text))
+
+def count_tokens(messages: list[dict]) -> int:
+    # tokens of each message plus the role markers around it
+    count = get_token_counter()
+    return sum(count(message["content"]) + 4 for message in messages)
+
+def trim_messages(messages: list[dict], max_tokens: int = CONTEXT_WINDOW_TOKENS, recent_turns: int = CONTEXT_RECENT_TURNS) -> tuple[list[dict], int]:
+    # the page keeps the whole history for display; only the most recent turns that
+    # fit the budget are sent, and the last (current) turn always is
+    window = messages[-max(recent_turns, 1):]
+    while len(window) > 1 and count_tokens(window) > max_tokens:
+        window = window[1:]
+    return window, count_tokens(messages) - count_tokens(window)
+
 def get_chat_response(client: ChatCompletionsClient, messages: list[ChatRequestMessage]):
     completion = client.complete(
         model="gpt-4o-mini", 
@@ -20,3 +61,26 @@ def get_chat_response(client: ChatCompletionsClient, messages: list[ChatRequestM
     )
     return completion.choices[0].message
 
+
+def get_chat_response_stream(client: ChatCompletionsClient, messages: list[ChatRequestMessage], timings: dict) -> Iterator[str]:
+    start = time.perf_counter()
+    response = client.complete(
+        model="gpt-4o-mini", 
+        messages=messages,
+        temperature=1,
+        frequency_penalty=0.5,
+        presence_penalty=0.5,
+        stream=True,
+    )
+    try:
+        for update in response:
+            if not update.choices:
+                continue
+            content = update.choices[0].delta.content
+            if content:
+                if 'time_to_first_token' not in timings:
+                    timings['time_to_first_token'] = time.perf_counter() - start
+                yield content
+    finally:
+        timings['total'] = time.perf_counter() - start
+        response.close()
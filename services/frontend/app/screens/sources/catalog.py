@@ -3,12 +3,12 @@ import pandas as pd
 import uuid
 import json
 from typing import Dict, List, Optional
-from pg.sources.state import SourceManager, get_source_type_options
+from screens.sources.state import get_source_manager, get_source_type_options
 
 def source_catalog():
     st.header("Browse Sources")
     
-    source_manager = SourceManager()
+    source_manager = get_source_manager()
     sources = source_manager.sources
     
     if not sources:
@@ -25,10 +25,10 @@ def source_catalog():
     '''
     add_source = st.button("Add Source")
     if add_source:
-        st.switch_page("pg/sources/display.py")
+        st.switch_page("screens/sources/display.py")
     '''
 
-    st.page_link("pg/sources/display.py", label="Add Source")
+    st.page_link("screens/sources/display.py", label="Add Source")
 
     edit_source = st.dataframe(
         filtered_df, 
@@ -38,7 +38,7 @@ def source_catalog():
 
     '''  
     if edit_source:
-       st.switch_page("pg/sources/display.py")
+       st.switch_page("screens/sources/display.py")
     '''
 
 source_catalog()
\ No newline at end of file
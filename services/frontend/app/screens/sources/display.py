@@ -2,10 +2,10 @@ import streamlit as st
 import uuid
 import json
 from typing import Dict, List, Optional
-from pg.sources.state import SourceManager, get_source_type_options
+from screens.sources.state import get_source_manager, get_source_type_options
 
 def source_display():
-    source_id = st.session_state.source_id
+    source_id = st.session_state.get("source_id")
     
     st.header("Source Display")
     
@@ -62,10 +62,10 @@ def source_display():
             **additional_config
         }
         
-        source_manager = SourceManager()
+        source_manager = get_source_manager()
 
         if source_id:
-            source_id = source_manager.update_source(source_data)
+            source_manager.update_source(source_id, source_data)
             st.success("Source updated successfully")
         else:
             source_id = source_manager.create_source(source_data)
@@ -1,12 +1,58 @@
+import os
+import time
 import uuid
 import json
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol
+import streamlit as st
 
-class SourceManager:
-    def __init__(self, storage_file='sources.json'):
+SOURCES_BACKEND = os.environ.get("SOURCES_BACKEND", "sqlite")
+SOURCES_DB = os.environ.get("SOURCES_DB", "sources.db")
+SOURCES_JSON = os.environ.get("SOURCES_JSON", "sources.json")
+# how stale the shared in-memory catalog may get before it checks for edits made by
+# other app processes
+SOURCES_REFRESH_SECONDS = float(os.environ.get("SOURCES_REFRESH_SECONDS", "2"))
+
+class SourceStore(Protocol):
+    def list_sources(self, type: Optional[str] = None, is_active: Optional[bool] = None) -> List[Dict]:
+        ...
+
+    def get_source(self, source_id: str) -> Optional[Dict]:
+        ...
+
+    def find_by_name(self, name: str) -> List[Dict]:
+        ...
+
+    def create_source(self, source_data: Dict) -> str:
+        ...
+
+    def update_source(self, source_id: str, updated_data: Dict) -> bool:
+        ...
+
+    def delete_source(self, source_id: str) -> bool:
+        ...
+
+    def version(self):
+        ...
+
+class JsonSourceStore:
+    # The original whole-file store, kept for small setups and as the import source for
+    # SQLite. Writes go to a temp file and are swapped in, so readers never see half a file.
+
+    def __init__(self, storage_file: str = SOURCES_JSON):
         self.storage_file = storage_file
+        self._mtime = self._stat()
         self.sources = self.load_sources()
 
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.storage_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
     def load_sources(self) -> List[Dict]:
         try:
             with open(self.storage_file, 'r') as f:
@@ -15,32 +61,287 @@ class SourceManager:
             return []
 
     def save_sources(self):
-        with open(self.storage_file, 'w') as f:
+        tmp_file = f"{self.storage_file}.tmp"
+        with open(tmp_file, 'w') as f:
             json.dump(self.sources, f, indent=2)
+        os.replace(tmp_file, self.storage_file)
+        self._mtime = self._stat()
 
-    def create_source(self, source_data: Dict):
-        # Add a unique identifier
+    def version(self) -> Optional[int]:
+        # the file's mtime; picks up edits written by another process on the way
+        mtime = self._stat()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self.sources = self.load_sources()
+        return mtime
+
+    def list_sources(self, type: Optional[str] = None, is_active: Optional[bool] = None) -> List[Dict]:
+        return [
+            source for source in self.sources
+            if (type is None or source.get('type') == type)
+            and (is_active is None or bool(source.get('is_active')) == is_active)
+        ]
+
+    def get_source(self, source_id: str) -> Optional[Dict]:
+        return next((source for source in self.sources if source['id'] == source_id), None)
+
+    def find_by_name(self, name: str) -> List[Dict]:
+        return [source for source in self.sources if source.get('name') == name]
+
+    def create_source(self, source_data: Dict) -> str:
         source_data['id'] = str(uuid.uuid4())
         self.sources.append(source_data)
         self.save_sources()
         return source_data['id']
 
-    def update_source(self, source_id: str, updated_data: Dict):
+    def update_source(self, source_id: str, updated_data: Dict) -> bool:
         for i, source in enumerate(self.sources):
             if source['id'] == source_id:
-                # Preserve the original ID
                 updated_data['id'] = source_id
                 self.sources[i] = updated_data
                 self.save_sources()
                 return True
         return False
 
-    def delete_source(self, source_id: str):
+    def delete_source(self, source_id: str) -> bool:
+        count = len(self.sources)
         self.sources = [source for source in self.sources if source['id'] != source_id]
         self.save_sources()
+        return len(self.sources) < count
+
+class SqliteSourceStore:
+    # One row per source: the indexed fields (id, name, type, is_active) are columns,
+    # the full record is a JSON document. WAL mode lets every app process read while
+    # one writes, and each write is a single IMMEDIATE transaction.
+
+    def __init__(self, db_file: str = SOURCES_DB, import_from: Optional[str] = SOURCES_JSON):
+        self.db_file = db_file
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                category TEXT,
+                type TEXT,
+                is_active INTEGER NOT NULL DEFAULT 1,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sources_name ON sources (name);
+            CREATE INDEX IF NOT EXISTS sources_type ON sources (type);
+            CREATE INDEX IF NOT EXISTS sources_is_active ON sources (is_active);
+            """
+        )
+        if import_from:
+            self._import_json(import_from)
+
+    def _import_json(self, storage_file: str):
+        if not Path(storage_file).exists():
+            return
+        with self._transaction() as db:
+            if db.execute("SELECT EXISTS (SELECT 1 FROM sources)").fetchone()[0]:
+                return
+            for source in JsonSourceStore(storage_file).sources:
+                db.execute(
+                    "INSERT OR IGNORE INTO sources (id, name, category, type, is_active, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._row(source['id'], source),
+                )
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so concurrent writers from other
+        # processes wait on busy_timeout instead of failing halfway through
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self._writes += 1
+
+    def _row(self, source_id: str, source_data: Dict) -> tuple:
+        return (
+            source_id,
+            source_data.get('name'),
+            source_data.get('category'),
+            source_data.get('type'),
+            int(bool(source_data.get('is_active', True))),
+            json.dumps({**source_data, 'id': source_id}),
+        )
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def list_sources(self, type: Optional[str] = None, is_active: Optional[bool] = None) -> List[Dict]:
+        clauses, params = [], []
+        if type is not None:
+            clauses.append("type = ?")
+            params.append(type)
+        if is_active is not None:
+            clauses.append("is_active = ?")
+            params.append(int(is_active))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT data FROM sources{where} ORDER BY rowid", tuple(params))
 
     def get_source(self, source_id: str) -> Optional[Dict]:
-        return next((source for source in self.sources if source['id'] == source_id), None)
+        sources = self._query("SELECT data FROM sources WHERE id = ?", (source_id,))
+        return sources[0] if sources else None
+
+    def find_by_name(self, name: str) -> List[Dict]:
+        return self._query("SELECT data FROM sources WHERE name = ? ORDER BY rowid", (name,))
+
+    def create_source(self, source_data: Dict) -> str:
+        source_data['id'] = str(uuid.uuid4())
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO sources (id, name, category, type, is_active, data) VALUES (?, ?, ?, ?, ?, ?)",
+                self._row(source_data['id'], source_data),
+            )
+        return source_data['id']
+
+    def update_source(self, source_id: str, updated_data: Dict) -> bool:
+        updated_data['id'] = source_id
+        source_id, name, category, type, is_active, data = self._row(source_id, updated_data)
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE sources SET name = ?, category = ?, type = ?, is_active = ?, data = ? WHERE id = ?",
+                (name, category, type, is_active, data, source_id),
+            )
+        return cursor.rowcount > 0
+
+    def delete_source(self, source_id: str) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+        return cursor.rowcount > 0
+
+    def version(self) -> tuple[int, int]:
+        # data_version moves when another connection commits; our own commits are counted
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0], self._writes
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class CachedSourceStore:
+    # Serves reads from an in-memory id -> source dict shared by every session in the
+    # process. The backing store is asked for its version at most once per
+    # refresh_seconds and reloaded only when that changed, so a page rerun normally
+    # does no I/O and edits from other workers show up within refresh_seconds.
+
+    def __init__(self, store: SourceStore, refresh_seconds: float = SOURCES_REFRESH_SECONDS):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._sources: Dict[str, Dict] = {}
+        self._version = None
+        self._checked_at = float("-inf")
+        self._lock = threading.RLock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            version = self.store.version()
+            if version != self._version:
+                self._sources = {source['id']: source for source in self.store.list_sources()}
+                self._version = version
+            self._checked_at = now
+
+    def list_sources(self, type: Optional[str] = None, is_active: Optional[bool] = None) -> List[Dict]:
+        self._refresh()
+        return [
+            dict(source) for source in self._sources.values()
+            if (type is None or source.get('type') == type)
+            and (is_active is None or bool(source.get('is_active')) == is_active)
+        ]
+
+    def get_source(self, source_id: str) -> Optional[Dict]:
+        self._refresh()
+        source = self._sources.get(source_id)
+        return dict(source) if source is not None else None
+
+    def find_by_name(self, name: str) -> List[Dict]:
+        self._refresh()
+        return [dict(source) for source in self._sources.values() if source.get('name') == name]
+
+    def _written(self, source_id: str, source: Optional[Dict]):
+        # our own write is visible at once; the version is left alone so the next check
+        # still reloads anything another process wrote in the meantime
+        with self._lock:
+            if source is None:
+                self._sources.pop(source_id, None)
+            else:
+                self._sources[source_id] = dict(source)
+
+    def create_source(self, source_data: Dict) -> str:
+        self._refresh()
+        source_id = self.store.create_source(source_data)
+        self._written(source_id, source_data)
+        return source_id
+
+    def update_source(self, source_id: str, updated_data: Dict) -> bool:
+        self._refresh()
+        updated = self.store.update_source(source_id, updated_data)
+        if updated:
+            self._written(source_id, updated_data)
+        return updated
+
+    def delete_source(self, source_id: str) -> bool:
+        self._refresh()
+        deleted = self.store.delete_source(source_id)
+        self._written(source_id, None)
+        return deleted
+
+    def version(self):
+        self._refresh()
+        return self._version
+
+def create_source_store(backend: str = SOURCES_BACKEND) -> SourceStore:
+    if backend == "sqlite":
+        return SqliteSourceStore()
+    if backend == "json":
+        return JsonSourceStore()
+    raise ValueError(f"Unknown sources backend {backend!r}, expected sqlite or json")
+
+class SourceManager:
+    def __init__(self, store: Optional[SourceStore] = None):
+        self.store = store or create_source_store()
+
+    @property
+    def sources(self) -> List[Dict]:
+        return self.store.list_sources()
+
+    def list_sources(self, type: Optional[str] = None, is_active: Optional[bool] = None) -> List[Dict]:
+        return self.store.list_sources(type=type, is_active=is_active)
+
+    def find_by_name(self, name: str) -> List[Dict]:
+        return self.store.find_by_name(name)
+
+    def create_source(self, source_data: Dict):
+        return self.store.create_source(source_data)
+
+    def update_source(self, source_id: str, updated_data: Dict):
+        return self.store.update_source(source_id, updated_data)
+
+    def delete_source(self, source_id: str):
+        return self.store.delete_source(source_id)
+
+    def get_source(self, source_id: str) -> Optional[Dict]:
+        return self.store.get_source(source_id)
+
+@st.cache_resource
+def get_source_manager() -> SourceManager:
+    # one manager per server process, shared by every session and rerun
+    return SourceManager(CachedSourceStore(create_source_store()))
 
 
 def get_source_types():
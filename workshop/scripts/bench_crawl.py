@@ -0,0 +1,180 @@
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from aiohttp import web
+import config
+from config import get_logger
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from fakes import FakeEmbeddingsClient, FakeSearchClient
+from crawl_web import Crawler, CrawlState, page_id, sync_web_crawl
+
+logger = get_logger(__name__)
+
+class FixtureSite:
+    # A local site of linked pages served with ETag validators and a fixed latency per
+    # request. It records the paths requested and the most requests in flight at once,
+    # which the checks below use for the per-host limit and robots.txt.
+
+    def __init__(self, pages: int, links_per_page: int, latency: float, seed: int):
+        rng = random.Random(seed)
+        self.latency = latency
+        self.bodies = {}
+        self.versions = {}
+        for i in range(pages):
+            # links spelled several ways (fragments, tracking parameters, relative paths)
+            # that all normalize to the same pages
+            links = [f"/page/{(i + 1) % pages}", f"../page/{(i + 1) % pages}#top", f"/page/{(i + 2) % pages}?utm_source=bench"]
+            links += [f"/page/{rng.randrange(pages)}" for _ in range(links_per_page)]
+            self.bodies[i] = (links, " ".join(f"word{rng.randint(0, 999)}" for _ in range(200)))
+            self.versions[i] = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.paths = set()
+
+    def reset_counters(self):
+        self.requests = self.not_modified = self.max_in_flight = 0
+        self.paths = set()
+
+    def change(self, pages: list[int]):
+        for i in pages:
+            self.versions[i] += 1
+
+    def remove(self, pages: list[int]):
+        # links to removed pages stay, so the crawl gets a 404 for each
+        for i in pages:
+            del self.bodies[i]
+
+    def render(self, i: int) -> str:
+        links, words = self.bodies[i]
+        anchors = "".join(f'<li><a href="{link}">link</a></li>' for link in links)
+        return (
+            f"<html><head><title>Page {i}</title><style>body {{ color: red }}</style></head><body>"
+            f"<nav><a href=\"/\">home</a></nav><h1>Page {i}</h1><p>{words}</p>"
+            f"<h2>Version</h2><p>Revision {self.versions[i]}.</p><ul>{anchors}</ul>"
+            f"<script>var tracking = 1;</script><a href=\"/private/{i}\">hidden</a></body></html>"
+        )
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.paths.add(request.path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            i = int(request.match_info.get("number", 0))
+            if i not in self.bodies:
+                raise web.HTTPNotFound()
+            body = self.render(i)
+            etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers={"ETag": etag})
+            return web.Response(text=body, content_type="text/html", headers={"ETag": etag})
+        finally:
+            self.in_flight -= 1
+
+    async def robots(self, request: web.Request) -> web.Response:
+        return web.Response(text="User-agent: *\nDisallow: /private/\n")
+
+    def serve(self) -> tuple[str, callable]:
+        # runs the site on its own loop thread; returns its URL and a stop function
+        app = web.Application()
+        app.add_routes([
+            web.get("/", self.page),
+            web.get("/page/{number}", self.page),
+            web.get("/private/{number}", self.page),
+            web.get("/robots.txt", self.robots),
+        ])
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port = runner.addresses[0][1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+        return f"http://127.0.0.1:{port}/", stop
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--links-per-page", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the site takes per request")
+    parser.add_argument("--depth", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--per-host", type=int, default=8)
+    parser.add_argument("--changed", type=int, default=20)
+    parser.add_argument("--removed", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_crawl-"))
+    site = FixtureSite(args.pages, args.links_per_page, args.latency, args.seed)
+    start_url, stop = site.serve()
+    # page 0 is also served as the start page, so it is left out of the changes
+    picks = random.Random(args.seed).sample(range(1, args.pages), args.changed + args.removed)
+    changed, removed = picks[:args.changed], picks[args.changed:]
+    try:
+        # zero-latency fakes: this measures the crawler, not the services
+        search_client = FakeSearchClient(latency=0)
+        config.get_embeddings_client.override(FakeEmbeddingsClient(latency=0, per_item_latency=0, dimensions=8))
+        config.get_search_client.override(search_client, "bench")
+        get_embedding_cache.override(EmbeddingCache(work_dir / "embeddings", dimensions=8))
+
+        runs = (("initial crawl", None), ("conditional re-crawl", None), ("re-crawl after changes", changed), ("re-crawl after removals", removed))
+        for label, pages in runs:
+            if label == "re-crawl after changes":
+                site.change(pages)
+            elif label == "re-crawl after removals":
+                site.remove(pages)
+            site.reset_counters()
+            state = CrawlState.load(work_dir / "state.json", start_url)
+            crawler = Crawler(start_url, args.depth, state, concurrency=args.concurrency, per_host=args.per_host, max_pages=args.pages * 2)
+
+            start = time.perf_counter()
+            summary = sync_web_crawl(crawler, index_name="bench")
+            logger.info(
+                f"{label} took {time.perf_counter() - start:.2f}s: {site.requests} requests, {site.not_modified} answered 304, "
+                f"{site.max_in_flight} in flight at most (limit {args.per_host}), {summary.changed} pages re-indexed"
+            )
+
+            check(site.max_in_flight <= args.per_host, f"{label}: {site.max_in_flight} requests in flight, the per-host limit is {args.per_host}")
+            check(not any(path.startswith("/private/") for path in site.paths), f"{label}: fetched paths that robots.txt disallows")
+            if label == "initial crawl":
+                check(summary.changed == args.pages + 1, f"{label}: {summary.changed} pages indexed, expected {args.pages + 1}")
+            elif label == "conditional re-crawl":
+                check(site.not_modified == site.requests, f"{label}: {site.requests - site.not_modified} requests were not answered 304")
+                check(summary.changed == 0 and summary.upserted == 0, f"{label}: unchanged pages were re-indexed")
+            elif label == "re-crawl after changes":
+                check(summary.changed == len(pages), f"{label}: {summary.changed} pages re-indexed, expected {len(pages)}")
+            else:
+                urls = {f"{start_url}page/{i}" for i in pages}
+                check(summary.crawl.gone == len(pages), f"{label}: {summary.crawl.gone} pages gone, expected {len(pages)}")
+                check(not urls & set(state.pages), f"{label}: removed pages are still in the crawl state")
+                check(
+                    not any(document["parentId"] in {page_id(url) for url in urls} for document in search_client.documents.values()),
+                    f"{label}: chunks of removed pages are still in the index",
+                )
+
+        logger.info("All crawl checks passed")
+    finally:
+        stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
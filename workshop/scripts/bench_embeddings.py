@@ -0,0 +1,51 @@
+import time
+import argparse
+import pandas as pd
+from config import ASSET_PATH, get_logger
+from embedding import embed_texts, DEFAULT_BATCH_SIZE, DEFAULT_MAX_BATCH_TOKENS, DEFAULT_CONCURRENCY
+from fakes import FakeEmbeddingsClient
+
+logger = get_logger(__name__)
+
+def load_texts(path: str, count: int) -> list[str]:
+    descriptions = pd.read_csv(path)["description"].tolist()
+    return [f"{descriptions[i % len(descriptions)]} #{i}" for i in range(count)]
+
+def sequential_embed(client, texts: list[str], model: str) -> list[list[float]]:
+    return [client.embed(input=text, model=model).data[0].embedding for text in texts]
+
+def run(name: str, fn) -> float:
+    start = time.perf_counter()
+    vectors = fn()
+    elapsed = time.perf_counter() - start
+    rate = len(vectors) / elapsed
+    logger.info(f"{name:<12} {len(vectors):>6} docs in {elapsed:7.2f}s  {rate:8.1f} docs/s")
+    return rate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-row and batched embedding against a local fake endpoint")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-batch-tokens", type=int, default=DEFAULT_MAX_BATCH_TOKENS)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    texts = load_texts(ASSET_PATH / "products.csv", args.docs)
+    model = "text-embedding-ada-002"
+
+    client = FakeEmbeddingsClient(latency=args.latency, throttle_rate=0.0)
+    baseline = run("sequential", lambda: sequential_embed(client, texts, model))
+
+    client = FakeEmbeddingsClient(latency=args.latency, throttle_rate=args.throttle_rate)
+    batched = run("batched", lambda: embed_texts(
+        client,
+        texts,
+        model=model,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        concurrency=args.concurrency,
+    ))
+
+    logger.info(f"Speedup: {batched / baseline:.1f}x ({client.calls} calls, {client.throttled} throttled)")
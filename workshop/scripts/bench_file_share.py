@@ -0,0 +1,66 @@
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+import config
+from config import get_logger
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from fakes import FakeEmbeddingsClient, FakeSearchClient
+from sync_file_share import FileShareState, TextExtractor, sync_file_share
+
+logger = get_logger(__name__)
+
+def make_share(root: Path, files: int, files_per_directory: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(files):
+        directory = root / f"team-{i // (files_per_directory * 10)}" / f"folder-{i // files_per_directory}"
+        if i % files_per_directory == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"note-{i}.md").write_text(f"# Note {i}\n\n" + " ".join(f"word{rng.randint(0, 999)}" for _ in range(40)) + ".\n")
+
+def change_share(root: Path, modified: int, touched: int, deleted: int, seed: int) -> None:
+    rng = random.Random(seed + 1)
+    paths = sorted(root.rglob("*.md"))
+    picks = rng.sample(paths, modified + touched + deleted)
+    for path in picks[:modified]:
+        path.write_text(path.read_text() + "\nAn edited line.\n")
+    for path in picks[modified:modified + touched]:
+        os.utime(path, ns=(time.time_ns(), time.time_ns()))
+    for path in picks[modified + touched:]:
+        path.unlink()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--files-per-directory", type=int, default=100)
+    parser.add_argument("--modified", type=int, default=20)
+    parser.add_argument("--touched", type=int, default=20)
+    parser.add_argument("--deleted", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_file_share-"))
+    try:
+        root = work_dir / "share"
+        start = time.perf_counter()
+        make_share(root, args.files, args.files_per_directory, args.seed)
+        logger.info(f"Created {args.files} files in {time.perf_counter() - start:.2f}s")
+
+        # zero-latency fakes: this measures the connector, not the services
+        config.get_embeddings_client.override(FakeEmbeddingsClient(latency=0, per_item_latency=0, dimensions=8))
+        config.get_search_client.override(FakeSearchClient(latency=0), "bench")
+        get_embedding_cache.override(EmbeddingCache(work_dir / "embeddings", dimensions=8))
+        extract = TextExtractor(lambda: None)
+
+        for run, label in ((0, "initial sync"), (1, "unchanged re-sync"), (2, "re-sync after changes")):
+            if run == 2:
+                change_share(root, args.modified, args.touched, args.deleted, args.seed)
+            state = FileShareState.load(work_dir / "state.json", str(root))
+            summary = sync_file_share(root, state, extract, index_name="bench", workers=args.workers)
+            logger.info(f"{label} took {summary.elapsed_seconds:.2f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,124 @@
+import time
+import random
+import argparse
+from types import SimpleNamespace
+from config import get_logger
+from layout import index_page
+
+logger = get_logger(__name__)
+
+def _span(offset: int, length: int) -> SimpleNamespace:
+    return SimpleNamespace(offset=offset, length=length)
+
+def _region(page_number: int) -> list[SimpleNamespace]:
+    return [SimpleNamespace(page_number=page_number, polygon=[0.0] * 8)]
+
+def synthetic_page(word_count: int, seed: int = 0, table_share: float = 0.3) -> tuple:
+    # a dense page shaped like an analyze result: lines of 6-14 words (some split over
+    # two spans), paragraphs of a few lines, and a share of lines laid out as table cells
+    rng = random.Random(seed)
+    words, lines, cells, paragraphs = [], [], [], []
+    offset = 0
+    while len(words) < word_count:
+        first = len(words)
+        for _ in range(min(rng.randint(6, 14), word_count - len(words))):
+            length = rng.randint(1, 10)
+            words.append(SimpleNamespace(
+                content="x" * length,
+                span=_span(offset, length),
+                polygon=[rng.uniform(0, 8.5) for _ in range(8)],
+                confidence=rng.uniform(0.8, 1.0),
+            ))
+            offset += length + 1
+        start = words[first].span.offset
+        end = offset - 1
+        if rng.random() < 0.1:
+            middle = words[(first + len(words)) // 2].span.offset
+            spans = [_span(start, middle - 1 - start), _span(middle, end - middle)]
+        else:
+            spans = [_span(start, end - start)]
+        lines.append(SimpleNamespace(content=" ".join(word.content for word in words[first:]), spans=spans, polygon=[0.0] * 8))
+        offset += 1
+
+    line_index = 0
+    while line_index < len(lines):
+        group = lines[line_index:line_index + rng.randint(2, 6)]
+        line_index += len(group)
+        span = _span(group[0].spans[0].offset, group[-1].spans[-1].offset + group[-1].spans[-1].length - group[0].spans[0].offset)
+        if rng.random() < table_share:
+            for line in group:
+                cells.append(SimpleNamespace(
+                    row_index=len(cells),
+                    column_index=0,
+                    spans=[_span(line.spans[0].offset, line.spans[-1].offset + line.spans[-1].length - line.spans[0].offset)],
+                    bounding_regions=_region(1),
+                ))
+        else:
+            paragraphs.append(SimpleNamespace(spans=[span], bounding_regions=_region(1)))
+
+    page = SimpleNamespace(page_number=1, width=8.5, height=11.0, unit="inch", words=words, lines=lines)
+    tables = [SimpleNamespace(cells=cells)]
+    return page, tables, paragraphs
+
+def _in_span(word, spans):
+    for span in spans:
+        if word.span.offset >= span.offset and (word.span.offset + word.span.length) <= (span.offset + span.length):
+            return True
+
+def naive_members(page, elements) -> list[list[int]]:
+    # the word-by-span scan from notebooks/extract.ipynb, kept as the baseline
+    return [
+        [word.span.offset for word in page.words if _in_span(word, element.spans)]
+        for element in elements
+    ]
+
+def indexed_members(layout, members, count: int) -> list[list[int]]:
+    return [layout.offsets[members(i)].tolist() for i in range(count)]
+
+def benchmark(word_count: int, repeat: int, seed: int) -> dict:
+    page, tables, paragraphs = synthetic_page(word_count, seed)
+    cells = tables[0].cells
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = (
+            naive_members(page, page.lines),
+            naive_members(page, cells),
+            naive_members(page, paragraphs),
+        )
+    naive_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        layout = index_page(page, tables, paragraphs)
+        actual = (
+            indexed_members(layout, layout.line_words, len(layout.lines)),
+            indexed_members(layout, layout.cell_words, len(layout.cells)),
+            indexed_members(layout, layout.paragraph_words, len(layout.paragraphs)),
+        )
+    indexed_seconds = (time.perf_counter() - start) / repeat
+
+    if actual != expected:
+        raise AssertionError(f"Indexed layout disagrees with the naive scan for {word_count} words")
+
+    return {
+        "words": word_count,
+        "lines": len(page.lines),
+        "cells": len(cells),
+        "paragraphs": len(paragraphs),
+        "naive_ms": naive_seconds * 1000,
+        "indexed_ms": indexed_seconds * 1000,
+        "speedup": naive_seconds / indexed_seconds,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.info(f"{'words':>6} {'lines':>6} {'cells':>6} {'paras':>6} {'naive ms':>10} {'indexed ms':>11} {'speedup':>8}")
+    for word_count in args.words:
+        row = benchmark(word_count, args.repeat, args.seed)
+        logger.info(f"{row['words']:>6} {row['lines']:>6} {row['cells']:>6} {row['paragraphs']:>6} {row['naive_ms']:>10.1f} {row['indexed_ms']:>11.2f} {row['speedup']:>7.0f}x")
@@ -0,0 +1,199 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import config
+import embedding_cache
+import query_search_index
+from config import ASSET_PATH, get_logger
+from embedding_cache import EmbeddingCache
+from fakes import FakeChatCompletionsClient, FakeEmbeddingsClient, FakeSearchClient
+from eval_runner import read_rows
+from retrieval import AzureSearchBackend
+from query_rewrite import query_rewriter
+from semantic_cache import semantic_cache
+from chat_with_products import chat_with_products
+from chat_with_products_async import chat_with_products_async
+from query_search_index_async import close_clients
+
+logger = get_logger(__name__)
+
+STAGES = ["context_window", "rewrite", "embed", "search", "compress", "render", "completion", "total"]
+
+def install_fakes(args) -> dict:
+    # every client comes from the memoized config factories, so pinning the fakes
+    # there is enough to run the real pipeline code without an Azure account
+    fakes = {
+        "completions": FakeChatCompletionsClient(
+            latency=args.completion_latency,
+            token_latency=args.token_latency,
+            answer_tokens=args.answer_tokens,
+            failure_rate=args.completion_failure_rate,
+            seed=args.seed,
+        ),
+        "embeddings": FakeEmbeddingsClient(latency=args.embedding_latency, throttle_rate=args.embedding_throttle_rate, seed=args.seed),
+        "search": FakeSearchClient(latency=args.search_latency, failure_rate=args.search_failure_rate, seed=args.seed),
+    }
+
+    products = pd.read_csv(ASSET_PATH / "products.csv").to_dict("records")
+    fakes["search"].documents = {
+        str(p["id"]): {"id": str(p["id"]), "title": p["name"], "content": p["description"]}
+        for p in products
+    }
+
+    config.get_chat_completions_client.override(fakes["completions"])
+    config.get_embeddings_client.override(fakes["embeddings"])
+    config.get_search_client.override(fakes["search"], "products")
+    query_search_index.get_retrieval_backend.override(AzureSearchBackend(fakes["search"]))
+
+    return fakes
+
+def load_conversations(path: str, count: int, history: bool) -> list[list[dict]]:
+    queries = [row["query"].strip() for row in read_rows(path)]
+    conversations = []
+    for i in range(count):
+        # a numbered suffix keeps queries distinct so the caches do not hide pipeline cost
+        query = f"{queries[i % len(queries)]} (#{i})"
+        messages = [{"role": "user", "content": query}]
+        if history:
+            previous = queries[(i + 1) % len(queries)]
+            messages = [
+                {"role": "user", "content": previous},
+                {"role": "assistant", "content": f"Here is what I found about {previous}"},
+                *messages,
+            ]
+        conversations.append(messages)
+    return conversations
+
+def reset_caches(cache_dir: str):
+    query_rewriter.clear()
+    semantic_cache.clear()
+    embedding_cache.get_embedding_cache.override(EmbeddingCache(tempfile.mkdtemp(dir=cache_dir)))
+
+def run_level(conversations: list[list[dict]], concurrency: int, semantic: bool) -> tuple[list[dict], int, float]:
+    def run(messages: list[dict]) -> dict | None:
+        context = {"semantic_cache": semantic}
+        try:
+            chat_with_products(messages, context)
+        except Exception as e:
+            logger.debug(f"Request failed: {e}")
+            return None
+        return context
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run, conversations))
+    elapsed = time.perf_counter() - start
+
+    contexts = [context for context in results if context is not None]
+    return contexts, len(results) - len(contexts), elapsed
+
+def run_level_async(conversations: list[list[dict]], concurrency: int, semantic: bool) -> tuple[list[dict], int, float]:
+    # the same pipeline through chat_with_products_async, on one event loop; the fakes
+    # pinned in install_fakes reach it through worker threads
+    async def run_all() -> list[dict | None]:
+        # the fakes block their worker thread for the simulated latency, so the default
+        # executor (sized on the CPU count) would cap concurrency below the level measured
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 4))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(messages: list[dict]) -> dict | None:
+            context = {"semantic_cache": semantic}
+            async with semaphore:
+                try:
+                    await chat_with_products_async(messages, context)
+                except Exception as e:
+                    logger.debug(f"Request failed: {e}")
+                    return None
+            return context
+
+        try:
+            return await asyncio.gather(*(run(messages) for messages in conversations))
+        finally:
+            await close_clients()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    contexts = [context for context in results if context is not None]
+    return contexts, len(results) - len(contexts), elapsed
+
+def summarize(concurrency: int, contexts: list[dict], failed: int, elapsed: float, completions: FakeChatCompletionsClient) -> dict:
+    row = {
+        "concurrency": concurrency,
+        "requests": len(contexts) + failed,
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "rps": len(contexts) / elapsed if elapsed else 0.0,
+        "prompt_tokens": completions.prompt_tokens,
+        "completion_tokens": completions.completion_tokens,
+    }
+    for stage in STAGES:
+        samples = [context["timings"][stage] for context in contexts if stage in context["timings"]]
+        for q in (50, 95, 99):
+            row[f"{stage}_p{q}_ms"] = float(np.percentile(samples, q)) * 1000 if samples else None
+    return row
+
+def log_row(row: dict):
+    requests = row["requests"] - row["failed"]
+    logger.info(
+        f"concurrency {row['concurrency']}: {requests}/{row['requests']} ok in {row['elapsed_s']:.2f}s, "
+        f"{row['rps']:.1f} req/s, {row['prompt_tokens']} prompt + {row['completion_tokens']} completion tokens "
+        f"({(row['prompt_tokens'] + row['completion_tokens']) / max(requests, 1):.0f}/request)"
+    )
+    logger.info(f"  {'stage':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in STAGES:
+        values = [row[f"{stage}_p{q}_ms"] for q in (50, 95, 99)]
+        if values[0] is not None:
+            logger.info(f"  {stage:<14} {values[0]:>9.1f} {values[1]:>9.1f} {values[2]:>9.1f}")
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency, throughput and token usage of chat_with_products against local fakes")
+    parser.add_argument("--data", default=str(ASSET_PATH / "chat_eval_data.jsonl"))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--history", action="store_true", help="send a prior turn so the query rewrite runs")
+    parser.add_argument("--semantic-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run chat_with_products_async instead")
+    parser.add_argument("--completion-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--completion-failure-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--search-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON lines")
+    args = parser.parse_args()
+
+    # the pipeline logs every response at INFO; keep the report readable
+    for name in ("chat_with_products", "chat_with_products_async", "query_search_index", "query_search_index_async", "query_rewrite", "embedding", "semantic_cache"):
+        get_logger(name).setLevel(logging.WARNING)
+
+    conversations = load_conversations(args.data, args.requests, args.history)
+    rows = []
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for concurrency in args.concurrency:
+            fakes = install_fakes(args)
+            reset_caches(cache_dir)
+            run = run_level_async if args.use_async else run_level
+            contexts, failed, elapsed = run(conversations, concurrency, args.semantic_cache)
+            row = summarize(concurrency, contexts, failed, elapsed, fakes["completions"])
+            log_row(row)
+            rows.append(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
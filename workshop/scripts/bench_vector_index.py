@@ -0,0 +1,130 @@
+import json
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+from config import LOCAL_INDEX_PATH, get_logger, get_index_config
+from vector_index import ExactIndex, HnswIndex, normalize_rows
+
+logger = get_logger(__name__)
+
+# the HNSW parameter ranges Azure AI Search accepts, so any setting the sweep reports
+# can go straight into index_config.json
+SERVICE_RANGES = {"m": (4, 10), "ef_construction": (100, 1000), "ef_search": (100, 1000)}
+
+def load_vectors(path) -> np.ndarray:
+    with open(path / "meta.json") as f:
+        meta = json.load(f)
+    return np.memmap(path / "vectors.f32", dtype=np.float32, mode="r", shape=(meta["count"], meta["dimensions"]))
+
+def synthetic_vectors(count: int, dimensions: int, clusters: int, seed: int) -> np.ndarray:
+    # clustered rather than uniform so neighbourhoods look like real embedding space
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    return normalize_rows(centers[rng.integers(0, clusters, count)] + 0.6 * rng.normal(size=(count, dimensions)))
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picks = np.asarray(vectors)[rng.integers(0, len(vectors), count)]
+    return normalize_rows(picks + 0.3 * rng.normal(size=picks.shape) / np.sqrt(picks.shape[1]))
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, m_values: list[int], ef_construction_values: list[int], ef_search_values: list[int]) -> list[dict]:
+    exact = ExactIndex(vectors)
+    truth = []
+    exact_latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        truth.append({i for i, _ in exact.search(query, k)})
+        exact_latencies.append(time.perf_counter() - start)
+
+    rows = [{
+        "index": "exact",
+        "m": None,
+        "ef_construction": None,
+        "ef_search": None,
+        "build_s": 0.0,
+        "recall": 1.0,
+        "p50_ms": percentile_ms(exact_latencies, 50),
+        "p99_ms": percentile_ms(exact_latencies, 99),
+    }]
+
+    for m in m_values:
+        for ef_construction in ef_construction_values:
+            start = time.perf_counter()
+            index = HnswIndex(vectors, m=m, ef_construction=ef_construction)
+            build_seconds = time.perf_counter() - start
+
+            for ef_search in ef_search_values:
+                hits = 0
+                latencies = []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    results = index.search(query, k, ef_search=ef_search)
+                    latencies.append(time.perf_counter() - start)
+                    hits += len(expected.intersection(i for i, _ in results))
+
+                rows.append({
+                    "index": "hnsw",
+                    "m": m,
+                    "ef_construction": ef_construction,
+                    "ef_search": ef_search,
+                    "build_s": build_seconds,
+                    "recall": hits / (k * len(queries)),
+                    "p50_ms": percentile_ms(latencies, 50),
+                    "p99_ms": percentile_ms(latencies, 99),
+                })
+
+    return rows
+
+def log_rows(rows: list[dict], k: int):
+    logger.info(f"{'index':<6} {'m':>4} {'efC':>6} {'efS':>6} {'build s':>8} {f'recall@{k}':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        logger.info(
+            f"{row['index']:<6} {row['m'] or '-':>4} {row['ef_construction'] or '-':>6} {row['ef_search'] or '-':>6} "
+            f"{row['build_s']:>8.2f} {row['recall']:>10.3f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}"
+        )
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+if __name__ == "__main__":
+    hnsw_config = get_index_config("products")["hnsw"]
+
+    parser = argparse.ArgumentParser(description="Recall@k and latency of HNSW settings against exact KNN")
+    parser.add_argument("--index-path", help=f"local index built by retrieval.py (e.g. {LOCAL_INDEX_PATH}); synthetic vectors when omitted")
+    parser.add_argument("--count", type=int, default=2000, help="synthetic vector count")
+    parser.add_argument("--dimensions", type=int, default=1536, help="synthetic vector dimensions")
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--m", type=int_list, default=sorted({4, 6, 8, 10, hnsw_config["m"]}))
+    parser.add_argument("--ef-construction", type=int_list, default=[100, 400])
+    parser.add_argument("--ef-search", type=int_list, default=sorted({100, 250, 500, hnsw_config["ef_search"]}))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON lines")
+    args = parser.parse_args()
+
+    for name, (low, high) in SERVICE_RANGES.items():
+        invalid = [value for value in getattr(args, name) if not low <= value <= high]
+        if invalid:
+            parser.error(f"--{name.replace('_', '-')} {invalid} outside the {low}-{high} Azure AI Search accepts")
+
+    if args.index_path:
+        vectors = load_vectors(Path(args.index_path))
+    else:
+        vectors = synthetic_vectors(args.count, args.dimensions, args.clusters, args.seed)
+
+    queries = make_queries(vectors, args.queries, args.seed)
+
+    logger.info(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries; configured products profile: {hnsw_config}")
+
+    rows = benchmark(vectors, queries, args.k, args.m, args.ef_construction, args.ef_search)
+    log_rows(rows, args.k)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
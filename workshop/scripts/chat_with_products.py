@@ -1,39 +1,141 @@
-import os
-from pathlib import Path
+import time
+from typing import Iterator
 from opentelemetry import trace
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
-from azure.ai.inference.prompts import PromptTemplate
-from config import ASSET_PATH, get_logger, enable_telemetry
-from query_search_index import get_product_documents
+from azure.ai.inference.models import ChatResponseMessage
+from prompts import render_grounded_prompt
+from config import get_logger, enable_telemetry, get_chat_completions_client
+from query_search_index import get_product_documents, get_search_query, embed_search_query
+from semantic_cache import semantic_cache, use_semantic_cache
+from context_window import fit_context_window
+from grounding import compress_grounding
+from chunking import get_token_counter
+from telemetry import stage, record_usage
 
 logger = get_logger(__name__)
 tracer = trace.get_tracer(__name__)
 
-project = AIProjectClient.from_connection_string(
-    conn_str="eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1",
-    credential=DefaultAzureCredential()
-)
+@tracer.start_as_current_span(name="chat_with_products")
+def chat_with_products(messages: list[dict], context: dict = None) -> dict:
+    if context is None:
+        context = {}
 
-completions = project.inference.get_chat_completions_client()
+    start = time.perf_counter()
+    timings = context.setdefault("timings", {})
 
-@tracer.start_as_current_span(name="chat_with_products")
-def chat_with_products(messages: list[dict]) -> dict:
-    documents = get_product_documents(messages, {})
+    messages = fit_context_window(messages, context)
+
+    with stage("rewrite", timings):
+        search_query = get_search_query(messages)
+
+    with stage("embed", timings):
+        search_query_embedding = embed_search_query(search_query)
+
+    cacheable = use_semantic_cache(messages, context)
+    cached = semantic_cache.lookup(search_query_embedding) if cacheable else None
+    if cached is not None:
+        logger.info(f"Semantic cache hit for {search_query!r} (matched {cached.query!r}, {semantic_cache.stats()})")
+        context["grounding_data"] = cached.documents
+        timings["total"] = time.perf_counter() - start
+        return { "message": ChatResponseMessage(role="assistant", content=cached.answer), "context": context }
 
-    grounded_chat_prompt = PromptTemplate.from_prompty(Path(ASSET_PATH)/"grounded_chat.prompty")
+    documents = get_product_documents(messages, context, search_query, search_query_embedding)
+    documents = compress_grounding(documents, search_query, context)
 
-    system_message = grounded_chat_prompt.create_messages(documents=documents)
+    system_message, grounded_chat_prompt = render_grounded_prompt(documents, timings)
 
-    response = completions.complete(
-        model="gpt-4o-mini",
-        messages=system_message + messages,
-        **grounded_chat_prompt.parameters,
-    )
+    with stage("completion", timings, model="gpt-4o-mini"):
+        response = get_chat_completions_client().complete(
+            model="gpt-4o-mini",
+            messages=system_message + messages,
+            **grounded_chat_prompt.parameters,
+        )
+        record_usage(response.usage)
 
     logger.info(f"Chat response: {response.choices[0].message}")
 
-    return { "message": response.choices[0].message }
+    if cacheable:
+        semantic_cache.store(search_query, search_query_embedding, response.choices[0].message.content, documents)
+
+    context["grounding_data"] = documents
+    if response.usage is not None:
+        context["usage"] = {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+        }
+    timings["total"] = time.perf_counter() - start
+
+    return { "message": response.choices[0].message, "context": context }
+
+def chat_with_products_stream(messages: list[dict], context: dict = None) -> Iterator[str]:
+    if context is None:
+        context = {}
+
+    with tracer.start_as_current_span("chat_with_products_stream") as span:
+        start = time.perf_counter()
+        timings = context.setdefault("timings", {})
+
+        messages = fit_context_window(messages, context)
+
+        with stage("rewrite", timings):
+            search_query = get_search_query(messages)
+
+        with stage("embed", timings):
+            search_query_embedding = embed_search_query(search_query)
+
+        cacheable = use_semantic_cache(messages, context)
+        cached = semantic_cache.lookup(search_query_embedding) if cacheable else None
+        if cached is not None:
+            context["grounding_data"] = cached.documents
+            timings["time_to_first_token"] = timings["total"] = time.perf_counter() - start
+            span.set_attribute("semantic_cache.hit", True)
+            yield cached.answer
+            return
+
+        documents = get_product_documents(messages, context, search_query, search_query_embedding)
+        documents = compress_grounding(documents, search_query, context)
+        context["grounding_data"] = documents
+
+        system_message, grounded_chat_prompt = render_grounded_prompt(documents, timings)
+
+        # the completion stage covers the request up to the response headers; reading
+        # the stream is measured by time_to_first_token and total on the outer span
+        completion_start = time.perf_counter()
+        with stage("completion", timings, model="gpt-4o-mini", stream=True):
+            response = get_chat_completions_client().complete(
+                model="gpt-4o-mini",
+                messages=system_message + messages,
+                stream=True,
+                **grounded_chat_prompt.parameters,
+            )
+
+        answer = []
+        usage = None
+        try:
+            for update in response:
+                # services that report usage on a stream send it with the last update
+                usage = getattr(update, "usage", None) or usage
+                if not update.choices:
+                    continue
+                content = update.choices[0].delta.content
+                if content:
+                    if "time_to_first_token" not in timings:
+                        timings["time_to_first_token"] = time.perf_counter() - start
+                        timings["completion_time_to_first_token"] = time.perf_counter() - completion_start
+                    answer.append(content)
+                    yield content
+            if cacheable:
+                semantic_cache.store(search_query, search_query_embedding, "".join(answer), documents)
+        finally:
+            response.close()
+            timings["total"] = time.perf_counter() - start
+            if usage is not None:
+                span.set_attributes({"gen_ai.usage.input_tokens": usage.prompt_tokens, "gen_ai.usage.output_tokens": usage.completion_tokens})
+            else:
+                # not the semantic-convention attribute: this is a count of the streamed
+                # text, not usage reported by the service
+                span.set_attribute("chat.output_tokens_estimated", get_token_counter()("".join(answer)))
+            span.set_attributes({f"timings.{name}": value for name, value in timings.items()})
+            logger.info(f"Chat stream timings: {timings}")
 
 if __name__ == "__main__":
     enable_telemetry(log_to_project=True)
@@ -0,0 +1,102 @@
+import time
+import asyncio
+from opentelemetry import trace
+from azure.ai.inference.models import ChatResponseMessage
+from config import get_logger, enable_telemetry
+from query_search_index_async import (
+    close_clients,
+    embed_search_query_async,
+    get_clients,
+    get_product_documents_async,
+    get_search_query_async,
+)
+from semantic_cache import semantic_cache, use_semantic_cache
+from prompts import render_grounded_prompt
+from context_window import fit_context_window
+from grounding import compress_grounding
+from telemetry import stage, record_usage
+
+logger = get_logger(__name__)
+tracer = trace.get_tracer(__name__)
+
+@tracer.start_as_current_span(name="chat_with_products_async")
+async def chat_with_products_async(messages: list[dict], context: dict = None) -> dict:
+    if context is None:
+        context = {}
+
+    start = time.perf_counter()
+    timings = context.setdefault("timings", {})
+
+    clients = await get_clients()
+
+    # the rolling summary may call the model synchronously, so keep it off the event loop
+    messages = await asyncio.to_thread(fit_context_window, messages, context)
+
+    search_query = search_query_embedding = None
+    cacheable = use_semantic_cache(messages, context)
+    if cacheable:
+        # a single turn is not rewritten, so there is no rewrite for the search to overlap
+        # with and the query can be embedded up front for the cache lookup
+        search_query = await get_search_query_async(messages, timings)
+        with stage("embed", timings):
+            search_query_embedding = await embed_search_query_async(search_query)
+
+        cached = semantic_cache.lookup(search_query_embedding)
+        if cached is not None:
+            logger.info(f"Semantic cache hit for {search_query!r} (matched {cached.query!r}, {semantic_cache.stats()})")
+            context["grounding_data"] = cached.documents
+            timings["total"] = time.perf_counter() - start
+            return { "message": ChatResponseMessage(role="assistant", content=cached.answer), "context": context }
+
+    documents = await get_product_documents_async(messages, context, search_query, search_query_embedding)
+    search_query = context["thoughts"][-1]["description"]
+    documents = compress_grounding(documents, search_query, context)
+
+    system_message, grounded_chat_prompt = render_grounded_prompt(documents, timings)
+
+    with stage("completion", timings, model="gpt-4o-mini"):
+        response = await clients.completions_client.complete(
+            model="gpt-4o-mini",
+            messages=system_message + messages,
+            **grounded_chat_prompt.parameters,
+        )
+        record_usage(response.usage)
+
+    logger.info(f"Chat response: {response.choices[0].message}")
+
+    if cacheable:
+        semantic_cache.store(search_query, search_query_embedding, response.choices[0].message.content, documents)
+
+    context["grounding_data"] = documents
+    if response.usage is not None:
+        context["usage"] = {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+        }
+    timings["total"] = time.perf_counter() - start
+
+    return { "message": response.choices[0].message, "context": context }
+
+async def chat_with_products_many(conversations: list[list[dict]], concurrency: int = 100) -> list[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(messages: list[dict]) -> dict:
+        async with semaphore:
+            return await chat_with_products_async(messages)
+
+    return await asyncio.gather(*(run(messages) for messages in conversations))
+
+if __name__ == "__main__":
+    enable_telemetry(log_to_project=True)
+
+    async def main():
+        try:
+            await chat_with_products_many([
+                [{"role": "user", "content": "I need a new tent for 4 people, what would you recommend?"}],
+                [{"role": "user", "content": "Which hiking boots are waterproof?"}],
+                [{"role": "user", "content": "What backpack should I take on a week-long trek?"}],
+            ])
+        finally:
+            await close_clients()
+
+    asyncio.run(main())
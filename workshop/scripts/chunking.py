@@ -0,0 +1,303 @@
+import io
+import re
+from collections import deque
+from itertools import islice
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+from config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, TOKEN_ENCODING, get_logger, memoize
+
+logger = get_logger(__name__)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_TABLE_ROW = re.compile(r"^\s*\|")
+_TABLE_DIVIDER = re.compile(r"^\s*\|?\s*:?-{3,}")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_COMMENT = re.compile(r"^\s*<!--.*-->\s*$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\S+\s*")
+_LINE_END = re.compile(r"\r?\n")
+
+# between two blocks in a chunk
+_SEPARATOR = "\n\n"
+
+def _estimate_tokens(text: str) -> int:
+    # 4 characters per token, rounded up so that the estimates of the pieces of a text
+    # never add up to less than the estimate of the whole
+    return -(-len(text) // 4)
+
+@memoize
+def get_token_counter(encoding: str = TOKEN_ENCODING) -> Callable[[str], int]:
+    # the embedding models count with cl100k_base; without tiktoken installed the
+    # 4-characters-per-token estimate is used, which only affects how full chunks get
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed, token counts are estimated")
+        return _estimate_tokens
+
+    tokenizer = tiktoken.get_encoding(encoding)
+    return lambda text: len(tokenizer.encode_ordinary(text))
+
+@dataclass
+class Block:
+    kind: str
+    text: str
+    offset: int
+    # for tables: the header and divider rows, repeated at the top of every piece
+    header: str = ""
+
+@dataclass
+class Chunk:
+    text: str
+    heading: str
+    offset: int
+    length: int
+    index: int
+    tokens: int
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[tuple[Block, list[str]]]:
+    # Groups lines (with their line endings) into headings, tables, fenced code and
+    # paragraphs in one pass, tracking character offsets into the source. Yields each
+    # block with the heading path in effect for it; comments such as Document
+    # Intelligence page markers and blank lines are dropped.
+    headings: list[str] = []
+    kind = None
+    buffer: list[str] = []
+    start = 0
+    offset = 0
+
+    def block() -> Block:
+        text = "".join(buffer).rstrip("\r\n")
+        header = ""
+        if kind == "table" and len(buffer) > 1 and _TABLE_DIVIDER.match(buffer[1]):
+            header = buffer[0] + buffer[1].rstrip("\r\n")
+        return Block(kind, text, start, header)
+
+    for line in lines:
+        if kind == "code":
+            buffer.append(line)
+            if _FENCE.match(line):
+                yield block(), headings
+                kind, buffer = None, []
+            offset += len(line)
+            continue
+
+        stripped = line.strip()
+        if kind is not None and (
+            not stripped
+            or (kind == "table") != bool(_TABLE_ROW.match(line))
+            or _HEADING.match(line)
+            or _FENCE.match(line)
+        ):
+            yield block(), headings
+            kind, buffer = None, []
+
+        heading = _HEADING.match(line)
+        if heading:
+            level = len(heading.group(1))
+            headings = headings[:level - 1] + [""] * max(0, level - 1 - len(headings)) + [heading.group(2)]
+        elif stripped and not _COMMENT.match(line):
+            if kind is None:
+                kind = "table" if _TABLE_ROW.match(line) else "code" if _FENCE.match(line) else "paragraph"
+                start = offset
+            buffer.append(line)
+
+        offset += len(line)
+
+    if kind is not None:
+        yield block(), headings
+
+def _spans(text: str, separator: re.Pattern) -> Iterator[tuple[int, int]]:
+    start = 0
+    for match in separator.finditer(text):
+        if match.start() > start:
+            yield start, match.start()
+        start = match.end()
+    if start < len(text):
+        yield start, len(text)
+
+class MarkdownChunker:
+    # Packs blocks into chunks of at most max_tokens, never across a heading, and starts
+    # each chunk with up to overlap_tokens of the previous one's trailing blocks. Blocks
+    # that are too large on their own are split on their structure: tables by rows
+    # (repeating the header), code by lines, paragraphs by sentences and then words.
+    # Every piece is tokenized once, so the whole pass is linear in the input.
+
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        count_tokens: Callable[[str], int] = None,
+    ):
+        if overlap_tokens >= max_tokens:
+            raise ValueError(f"overlap_tokens ({overlap_tokens}) must be smaller than max_tokens ({max_tokens})")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens or get_token_counter()
+
+    def _pieces(self, block: Block) -> Iterator[tuple[str, int, int, int, str]]:
+        # (text, start, end, tokens, joiner) of the block, or of its parts if it is too
+        # large; joiner goes between two consecutive parts of the same block
+        tokens = self.count_tokens(block.text)
+        if tokens <= self.max_tokens:
+            yield block.text, block.offset, block.offset + len(block.text), tokens, _SEPARATOR
+            return
+
+        if block.kind == "table":
+            header_tokens = self.count_tokens(block.header) if block.header else 0
+            rows = list(_spans(block.text, _LINE_END))
+            rows = rows[2:] if block.header else rows
+            yield from self._pack(block, rows, header_tokens, "\n", _SEPARATOR)
+        elif block.kind == "code":
+            yield from self._pack(block, list(_spans(block.text, _LINE_END)), 0, "\n", "\n")
+        else:
+            for start, end in _spans(block.text, _SENTENCE_END):
+                sentence = block.text[start:end]
+                tokens = self.count_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    yield sentence, block.offset + start, block.offset + end, tokens, " "
+                    continue
+                words = [(start + match.start(), start + match.end()) for match in _WORD.finditer(sentence)]
+                yield from self._pack(block, words, 0, "", " ")
+
+    def _pack(self, block: Block, spans: list[tuple[int, int]], header_tokens: int, separator: str, joiner: str) -> Iterator[tuple[str, int, int, int, str]]:
+        # contiguous runs of spans (rows, lines, words) of up to max_tokens each
+        budget = self.max_tokens - header_tokens
+        run: list[tuple[int, int, int]] = []
+        used = 0
+
+        def piece(n: int):
+            start, end = run[0][0], run[n - 1][1]
+            text = block.text[start:end]
+            if block.header:
+                text = block.header + "\n" + text
+            return text, block.offset + start, block.offset + end, self.count_tokens(text), joiner
+
+        def flush():
+            # the spans' counts may add up to less than the run's, so the run is counted
+            # again and trailing spans are held back for the next one until it fits
+            nonlocal run, used
+            n = len(run)
+            result = piece(n)
+            while result[3] > self.max_tokens and n > 1:
+                n -= 1
+                result = piece(n)
+            run = run[n:]
+            used = sum(tokens for _, _, tokens in run)
+            return result
+
+        for start, end in spans:
+            tokens = self.count_tokens(block.text[start:end] + separator)
+            while run and used + tokens > budget:
+                yield flush()
+            run.append((start, end, tokens))
+            used += tokens
+
+        while run:
+            yield flush()
+
+    def chunks(self, markdown: str | Iterable[str]) -> Iterator[Chunk]:
+        lines = io.StringIO(markdown) if isinstance(markdown, str) else markdown
+        separator_tokens = self.count_tokens(_SEPARATOR)
+
+        index = 0
+        heading = None
+        units: deque = deque()
+        used = 0
+        # units at the front that were carried over from the previous chunk
+        carried = 0
+        fresh = False
+
+        def build(n: int) -> Chunk:
+            parts = []
+            previous = None
+            for text, _, _, _, joiner, block_number in islice(units, n):
+                if previous is not None:
+                    parts.append(joiner if block_number == previous else _SEPARATOR)
+                parts.append(text)
+                previous = block_number
+            text = "".join(parts)
+            start = units[0][1]
+            end = max(unit[2] for unit in islice(units, n))
+            return Chunk(
+                text=text,
+                heading=" > ".join(part for part in heading if part),
+                offset=start,
+                length=end - start,
+                index=index,
+                tokens=self.count_tokens(text),
+            )
+
+        def emit() -> Iterator[Chunk]:
+            # Piece counts do not always add up to the count of their join, so the chunk
+            # is counted again and, when over max_tokens, trailing units are held back
+            # (and the overlap dropped if it has to be) to be packed into the next one.
+            nonlocal index, used, carried, fresh
+            n = len(units)
+            chunk = build(n)
+            while chunk.tokens > self.max_tokens and n > carried + 1:
+                n -= 1
+                chunk = build(n)
+            if chunk.tokens > self.max_tokens and carried:
+                for _ in range(carried):
+                    units.popleft()
+                n -= carried
+                carried = 0
+                chunk = build(n)
+                while chunk.tokens > self.max_tokens and n > 1:
+                    n -= 1
+                    chunk = build(n)
+
+            held_back = [units.pop() for _ in range(len(units) - n)][::-1]
+            yield chunk
+            index += 1
+            fresh = False
+            carry_over()
+            for unit in held_back:
+                yield from push(unit)
+
+        def carry_over():
+            # keep the trailing units that fit in the overlap, and always drop at least
+            # one so the next chunk makes progress
+            nonlocal used, carried
+            kept = 0
+            keep = 0
+            for unit in reversed(units):
+                if keep + 1 >= len(units) or kept + unit[3] + separator_tokens > self.overlap_tokens:
+                    break
+                kept += unit[3] + separator_tokens
+                keep += 1
+            while len(units) > keep:
+                units.popleft()
+            used = kept
+            carried = keep
+
+        def push(unit) -> Iterator[Chunk]:
+            nonlocal used, carried, fresh
+            cost = unit[3] + separator_tokens
+            while fresh and used + cost > self.max_tokens:
+                yield from emit()
+            if used + cost > self.max_tokens:
+                # only carried-over units are left and they leave no room
+                units.clear()
+                used = carried = 0
+            units.append(unit)
+            used += cost
+            fresh = True
+
+        for block_number, (block, headings) in enumerate(iter_blocks(lines)):
+            if heading is not None and headings != heading:
+                while fresh:
+                    yield from emit()
+                units.clear()
+                used = carried = 0
+            heading = list(headings)
+
+            for piece in self._pieces(block):
+                yield from push((*piece, block_number))
+
+        while fresh:
+            yield from emit()
+
+def chunk_markdown(markdown: str | Iterable[str], max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    return MarkdownChunker(max_tokens, overlap_tokens).chunks(markdown)
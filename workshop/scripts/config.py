@@ -1,17 +1,101 @@
 import os
 import sys
+import json
 import pathlib
 import logging
+import functools
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import DefaultAzureCredential
 from azure.ai.projects import AIProjectClient
-from azure.ai.inference.tracing import AIInferenceInstrumentor
-from azure.monitor.opentelemetry import configure_azure_monitor
+from azure.ai.projects.models import AuthenticationType, ConnectionType
+from azure.ai.inference import ChatCompletionsClient, EmbeddingsClient
+from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
+AIPROJECT_CONNECTION_STRING = os.environ.get(
+    "AIPROJECT_CONNECTION_STRING",
+    "eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1",
+)
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+
+# "otlp", "prometheus" or "console"; unset exports only to the project, if at all
+TELEMETRY_EXPORTER = os.environ.get("TELEMETRY_EXPORTER")
+TELEMETRY_SAMPLING_RATIO = float(os.environ.get("TELEMETRY_SAMPLING_RATIO", "1.0"))
+TELEMETRY_RECORD_CONTENT = os.environ.get("TELEMETRY_RECORD_CONTENT", "true").lower() == "true"
+PROMETHEUS_PORT = int(os.environ.get("PROMETHEUS_PORT", "9464"))
+
+# throttling (429), service errors (500, 503) and the gateway errors (502, 504) the
+# Azure endpoints return while scaling or failing over; all worth retrying with backoff
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
 ASSET_PATH = pathlib.Path(__file__).parent / "assets"
 
+MANIFEST_PATH = ASSET_PATH / "products.manifest.json"
+
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "azure")
+LOCAL_INDEX_PATH = pathlib.Path(os.environ.get("LOCAL_INDEX_PATH", pathlib.Path(__file__).parent / ".cache" / "local_index"))
+
+# the local backend searches exactly up to this many vectors (a single matrix product
+# beats walking a graph in Python at catalog sizes) and builds an HNSW graph above it;
+# its graph settings are its own, not the Azure index profile's
+LOCAL_EXACT_MAX_VECTORS = int(os.environ.get("LOCAL_EXACT_MAX_VECTORS", "10000"))
+LOCAL_HNSW_M = int(os.environ.get("LOCAL_HNSW_M", "16"))
+LOCAL_HNSW_EF_CONSTRUCTION = int(os.environ.get("LOCAL_HNSW_EF_CONSTRUCTION", "100"))
+LOCAL_HNSW_EF_SEARCH = int(os.environ.get("LOCAL_HNSW_EF_SEARCH", "64"))
+
+EMBEDDING_CACHE_PATH = pathlib.Path(os.environ.get("EMBEDDING_CACHE_PATH", pathlib.Path(__file__).parent / ".cache" / "embeddings"))
+
+# token budget for the conversation part of a prompt, and how many turns are kept
+# verbatim before older ones are folded into a summary
+CONTEXT_WINDOW_TOKENS = int(os.environ.get("CONTEXT_WINDOW_TOKENS", "2000"))
+CONTEXT_RECENT_TURNS = int(os.environ.get("CONTEXT_RECENT_TURNS", "6"))
+
+# grounding documents are deduplicated, filtered on search score (absolute, and relative
+# to the best hit), trimmed per document and packed into this many prompt tokens
+GROUNDING_TOKEN_BUDGET = int(os.environ.get("GROUNDING_TOKEN_BUDGET", "1000"))
+GROUNDING_DOCUMENT_TOKENS = int(os.environ.get("GROUNDING_DOCUMENT_TOKENS", "250"))
+GROUNDING_MIN_SCORE = float(os.environ.get("GROUNDING_MIN_SCORE", "0.0"))
+GROUNDING_MIN_RELATIVE_SCORE = float(os.environ.get("GROUNDING_MIN_RELATIVE_SCORE", "0.25"))
+GROUNDING_DEDUPE_SIMILARITY = float(os.environ.get("GROUNDING_DEDUPE_SIMILARITY", "0.9"))
+
+# documents are split on headings, tables and paragraphs into chunks of at most
+# CHUNK_TOKENS tokens, with about CHUNK_OVERLAP_TOKENS carried over between neighbours
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "cl100k_base")
+
+DATASETS_PATH = pathlib.Path(__file__).parent.parent / "datasets"
+ANALYSIS_CACHE_PATH = pathlib.Path(os.environ.get("ANALYSIS_CACHE_PATH", pathlib.Path(__file__).parent / ".cache" / "analysis"))
+
+# repository sources configured in the frontend, and where connectors keep their sync state
+FRONTEND_PATH = pathlib.Path(__file__).parent.parent.parent / "services" / "frontend"
+SOURCES_DB = pathlib.Path(os.environ.get("SOURCES_DB", FRONTEND_PATH / "sources.db"))
+SOURCES_JSON = pathlib.Path(os.environ.get("SOURCES_JSON", FRONTEND_PATH / "sources.json"))
+CONNECTOR_STATE_PATH = pathlib.Path(os.environ.get("CONNECTOR_STATE_PATH", pathlib.Path(__file__).parent / ".cache" / "connectors"))
+DOCUMENTS_INDEX = os.environ.get("DOCUMENTS_INDEX", "documents")
+
+EVAL_CACHE_PATH = pathlib.Path(os.environ.get("EVAL_CACHE_PATH", pathlib.Path(__file__).parent / ".cache" / "eval"))
+
+INDEX_CONFIG_PATH = pathlib.Path(os.environ.get("INDEX_CONFIG_PATH", ASSET_PATH / "index_config.json"))
+
+DEFAULT_INDEX_CONFIG = {
+    "vector_profile": "hnswProfile",
+    "metric": "cosine",
+    "hnsw": {
+        "m": 4,
+        "ef_construction": 400,
+        "ef_search": 500,
+    },
+}
+
 logger = logging.getLogger("app")
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler(sys.stdout))
@@ -19,18 +103,211 @@ logger.addHandler(logging.StreamHandler(sys.stdout))
 def get_logger(module_name):
     return logger.getChild(module_name)
 
-def enable_telemetry(log_to_project: bool = False):
-    AIInferenceInstrumentor().instrument()
+def get_index_config(index_name: str) -> dict:
+    try:
+        with open(INDEX_CONFIG_PATH) as f:
+            index_config = json.load(f).get(index_name, {})
+    except FileNotFoundError:
+        index_config = {}
+
+    return {
+        **DEFAULT_INDEX_CONFIG,
+        **index_config,
+        "hnsw": {**DEFAULT_INDEX_CONFIG["hnsw"], **index_config.get("hnsw", {})},
+    }
+
+def memoize(factory):
+    # process-wide, thread-safe memoization for client factories: the first caller
+    # builds the client, everyone after that gets the same instance
+    instances = {}
+    overridden = set()
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def get(*args):
+        try:
+            return instances[args]
+        except KeyError:
+            pass
+        with lock:
+            if args not in instances:
+                instances[args] = factory(*args)
+            return instances[args]
+
+    def override(instance, *args):
+        # pins the instance returned for these arguments, e.g. a local fake in benchmarks
+        with lock:
+            instances[args] = instance
+            overridden.add(args)
+
+    def cache_clear():
+        with lock:
+            instances.clear()
+            overridden.clear()
+
+    get.cache_clear = cache_clear
+    get.override = override
+    get.is_overridden = lambda *args: args in overridden
+    return get
+
+@memoize
+def get_credential():
+    # one credential per process, so its in-memory token cache is shared by every client
+    return DefaultAzureCredential()
+
+@memoize
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _transport():
+    return RequestsTransport(session=get_http_session(), session_owner=False)
 
-    os.environ["AZURE_TRACING_GEN_AI_CONTENT_RECORDING_ENABLED"] = "true"
+@memoize
+def get_project_client():
+    return AIProjectClient.from_connection_string(
+        conn_str=AIPROJECT_CONNECTION_STRING,
+        credential=get_credential(),
+        transport=_transport(),
+    )
+
+@memoize
+def get_connection(connection_type: str):
+    return get_project_client().connections.get_default(
+        connection_type=connection_type,
+        include_credentials=True
+    )
+
+def _inference_client_options() -> dict:
+    # chat completions and embeddings share the default AI Services connection, so
+    # it is looked up once instead of once per client
+    connection = get_connection(ConnectionType.AZURE_AI_SERVICES)
+    options = {"endpoint": f"{connection.endpoint_url}/models", "transport": _transport()}
+
+    if connection.authentication_type == AuthenticationType.API_KEY:
+        return {**options, "credential": AzureKeyCredential(connection.key)}
+    return {
+        **options,
+        "credential": get_credential(),
+        "credential_scopes": ["https://cognitiveservices.azure.com/.default"],
+    }
+
+@memoize
+def get_chat_completions_client():
+    return ChatCompletionsClient(**_inference_client_options())
+
+@memoize
+def get_embeddings_client():
+    return EmbeddingsClient(**_inference_client_options())
+
+@memoize
+def get_search_index_client():
+    search_connection = get_connection(ConnectionType.AZURE_AI_SEARCH)
+    return SearchIndexClient(
+        endpoint=search_connection.endpoint_url,
+        credential=AzureKeyCredential(key=search_connection.key),
+        transport=_transport(),
+    )
+
+@memoize
+def get_search_client(index_name: str = "products"):
+    search_connection = get_connection(ConnectionType.AZURE_AI_SEARCH)
+    return SearchClient(
+        endpoint=search_connection.endpoint_url,
+        credential=AzureKeyCredential(key=search_connection.key),
+        index_name=index_name,
+        transport=_transport(),
+    )
+
+@memoize
+def get_document_intelligence_client():
+    # only the PDF ingestion needs Document Intelligence, so its SDK is imported here
+    # rather than making every script depend on it
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+
+    connection = get_connection(ConnectionType.AZURE_AI_SERVICES)
+    if connection.authentication_type == AuthenticationType.API_KEY:
+        credential = AzureKeyCredential(connection.key)
+    else:
+        credential = get_credential()
+
+    return DocumentIntelligenceClient(
+        endpoint=connection.endpoint_url,
+        credential=credential,
+        transport=_transport(),
+    )
+
+def _local_exporters(exporter: str | None) -> tuple[list, list]:
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+    if exporter is None:
+        return [], []
+
+    if exporter == "otlp":
+        # endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+
+        return [BatchSpanProcessor(OTLPSpanExporter())], [PeriodicExportingMetricReader(OTLPMetricExporter())]
+
+    if exporter == "prometheus":
+        from opentelemetry.exporter.prometheus import PrometheusMetricReader
+        from prometheus_client import start_http_server
+
+        start_http_server(PROMETHEUS_PORT)
+        logger.info(f"Prometheus metrics on http://localhost:{PROMETHEUS_PORT}/metrics")
+        return [], [PrometheusMetricReader()]
+
+    if exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter
+
+        return [BatchSpanProcessor(ConsoleSpanExporter())], [PeriodicExportingMetricReader(ConsoleMetricExporter())]
+
+    raise ValueError(f"Unknown telemetry exporter {exporter!r}, expected otlp, prometheus or console")
+
+def enable_telemetry(
+    log_to_project: bool = False,
+    exporter: str | None = TELEMETRY_EXPORTER,
+    sampling_ratio: float = TELEMETRY_SAMPLING_RATIO,
+    record_content: bool = TELEMETRY_RECORD_CONTENT,
+):
+    # telemetry exporters are heavy to import and only needed by entry points that
+    # turn tracing on, so they are imported here rather than with the module
+    from azure.ai.inference.tracing import AIInferenceInstrumentor
+    from azure.monitor.opentelemetry import configure_azure_monitor
+    from opentelemetry import metrics, trace
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    # recording prompts and completions on spans is the expensive part of tracing
+    AIInferenceInstrumentor().instrument(enable_content_recording=record_content)
+
+    span_processors, metric_readers = _local_exporters(exporter)
 
     if log_to_project:
-        project = AIProjectClient.from_connection_string(
-            conn_str=os.environ["AIPROJECT_CONNECTION_STRING"],
-            credential=DefaultAzureCredential()
-        )
+        project = get_project_client()
         telemetry_conn_str = project.telemetry.get_connection_string()
-        configure_azure_monitor(connection_string=telemetry_conn_str)
+        configure_azure_monitor(
+            connection_string=telemetry_conn_str,
+            sampling_ratio=sampling_ratio,
+            span_processors=span_processors,
+            metric_readers=metric_readers,
+        )
 
         tracing_link = f"https://ai.azure.com/tracing?wsid=/subscriptions/{project.scope['subscription_id']}/resourceGroups/{project.scope['resource_group_name']}/providers/Microsoft.MachineLearningServices/workspaces/{project.scope['project_name']}"
         logger.info(f"Telemetry enabled. View traces at {tracing_link}")
+    elif exporter is not None:
+        # parent-based so a sampled request keeps all of its stage spans
+        tracer_provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(sampling_ratio)))
+        for span_processor in span_processors:
+            tracer_provider.add_span_processor(span_processor)
+        trace.set_tracer_provider(tracer_provider)
+        metrics.set_meter_provider(MeterProvider(metric_readers=metric_readers))
+
+        logger.info(f"Telemetry enabled. Exporting to {exporter} with sampling ratio {sampling_ratio}")
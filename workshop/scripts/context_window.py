@@ -0,0 +1,152 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Callable
+from config import CONTEXT_WINDOW_TOKENS, CONTEXT_RECENT_TURNS, get_logger, get_chat_completions_client
+from chunking import get_token_counter
+from prompts import get_prompt
+from telemetry import stage, record_usage
+
+logger = get_logger(__name__)
+
+# role markers and separators the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_MAX_SUMMARIES = 1024
+# room kept for the summary message; matches max_tokens in summarize_conversation.prompty
+DEFAULT_SUMMARY_TOKENS = 300
+
+def count_tokens(messages: list[dict]) -> int:
+    # the chunker's counter, so window budgets and chunk sizes are in the same tokens
+    count = get_token_counter()
+    return sum(count(str(message["content"])) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+@dataclass
+class WindowReport:
+    turns: int
+    kept_turns: int
+    summarized_turns: int
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "tokens_saved": self.tokens_saved}
+
+def summarize_with_model(summary: str, messages: list[dict], model: str = "gpt-4o-mini") -> str:
+    prompt = get_prompt("summarize_conversation.prompty")
+    completion = get_chat_completions_client().complete(
+        model=model,
+        messages=prompt.create_messages(summary=summary or "(none)", conversation=messages),
+        **prompt.parameters,
+    )
+    record_usage(completion.usage)
+    return completion.choices[0].message.content.strip()
+
+class ContextWindow:
+    # A conversation that fits the token budget is passed through untouched. One that
+    # does not keeps its most recent turns verbatim and folds everything older into a
+    # rolling summary, then drops the oldest kept turns until it fits. The current (last)
+    # turn is always kept. Summaries are cached per prefix of the conversation, so each
+    # turn that falls out of the window is summarized once.
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_WINDOW_TOKENS,
+        recent_turns: int = CONTEXT_RECENT_TURNS,
+        summarizer: Callable[[str, list[dict]], str] | None = summarize_with_model,
+        summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        max_summaries: int = DEFAULT_MAX_SUMMARIES,
+    ):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self.max_summaries = max_summaries
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prefix_keys(self, messages: list[dict]) -> list[str]:
+        # chained hashes: keys[i] identifies messages[:i + 1] in one pass
+        keys = []
+        digest = b""
+        for message in messages:
+            digest = hashlib.sha256(digest + json.dumps([message["role"], message["content"]]).encode("utf-8")).digest()
+            keys.append(digest.hex())
+        return keys
+
+    def _summarize(self, messages: list[dict]) -> str:
+        keys = self._prefix_keys(messages)
+
+        summary, start = "", 0
+        with self._lock:
+            for i in range(len(keys) - 1, -1, -1):
+                if keys[i] in self._summaries:
+                    self._summaries.move_to_end(keys[i])
+                    summary, start = self._summaries[keys[i]], i + 1
+                    break
+
+        if start == len(messages):
+            return summary
+
+        summary = self.summarizer(summary, messages[start:])
+
+        with self._lock:
+            self._summaries[keys[-1]] = summary
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+
+        return summary
+
+    def fit(self, messages: list[dict], reserved_tokens: int = 0) -> tuple[list[dict], WindowReport]:
+        budget = self.max_tokens - reserved_tokens
+        tokens_before = count_tokens(messages)
+
+        # summarizing is a model call on the request path, so it only happens when the
+        # conversation would not fit otherwise
+        if tokens_before <= budget:
+            return messages, WindowReport(len(messages), len(messages), 0, tokens_before, tokens_before)
+
+        recent = messages[-max(self.recent_turns, 1):]
+        summary_tokens = self.summary_tokens if self.summarizer is not None else 0
+
+        # turns pushed out of the recent window go to the summary rather than being lost
+        while len(recent) > 1 and count_tokens(recent) + summary_tokens > budget:
+            recent = recent[1:]
+
+        older = messages[:len(messages) - len(recent)]
+
+        summary = []
+        if older and self.summarizer is not None:
+            summary = [{"role": "system", "content": f"Summary of the earlier conversation: {self._summarize(older)}"}]
+
+        if summary and count_tokens(summary + recent) > budget:
+            summary = []
+
+        window = summary + recent
+        report = WindowReport(
+            turns=len(messages),
+            kept_turns=len(recent),
+            summarized_turns=len(older) if summary else 0,
+            tokens_before=tokens_before,
+            tokens_after=count_tokens(window),
+        )
+
+        return window, report
+
+context_window = ContextWindow()
+
+def fit_context_window(messages: list[dict], context: dict) -> list[dict]:
+    with stage("context_window", context.setdefault("timings", {})) as window_stage:
+        messages, report = context_window.fit(messages)
+        window_stage.span.set_attributes({f"context_window.{name}": value for name, value in report.as_dict().items()})
+
+    context["context_window"] = report.as_dict()
+    if report.tokens_saved:
+        logger.info(f"Context window: {report.kept_turns} of {report.turns} turns kept, {report.tokens_saved} tokens saved")
+
+    return messages
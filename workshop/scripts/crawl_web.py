@@ -0,0 +1,665 @@
+import os
+import re
+import json
+import time
+import queue
+import codecs
+import asyncio
+import hashlib
+import argparse
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+import aiohttp
+from config import (
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    CONNECTOR_STATE_PATH,
+    DOCUMENTS_INDEX,
+    get_logger,
+    get_search_client,
+)
+from chunking import MarkdownChunker
+from create_search_index import embed_documents
+from ingest_pdfs import install_fakes
+from manifest import content_hash
+from pipeline import run_pipeline, DEFAULT_CHUNK_SIZE
+from sources import find_source
+from uploader import DocumentUploader
+
+logger = get_logger(__name__)
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_MAX_PAGES = 1000
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_PAGE_BYTES = 5 * 1024 * 1024
+USER_AGENT = "az-ai-mon-crawler/0.1"
+
+_READ_SIZE = 64 * 1024
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|mc_cid|mc_eid)$")
+_INDEXED_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+_DONE = object()
+
+def normalize_url(url: str, base: str = None) -> str | None:
+    # one spelling per page: absolute, no fragment, lower-case scheme and host, no
+    # default port, no tracking parameters, sorted query; None for non-HTTP links
+    url = urljoin(base, url.strip()) if base else url.strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if parts.port and parts.port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(key)))
+
+    return urlunsplit((scheme, host, _remove_dot_segments(parts.path) or "/", query, ""))
+
+def _remove_dot_segments(path: str) -> str:
+    # urljoin only resolves "." and ".." in relative links, not in absolute ones
+    if "." not in path:
+        return path
+    segments = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    return "/".join(segments) + ("/" if path.endswith(("/.", "/..")) else "")
+
+class SeenUrls:
+    # Membership set of 64-bit URL digests instead of the URL strings, so a frontier
+    # of millions of discovered links stays small. A false positive (about 1 in 10^10
+    # at a million URLs) only means one page is not crawled.
+
+    def __init__(self):
+        self._digests: set[int] = set()
+
+    @staticmethod
+    def _digest(url: str) -> int:
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def add(self, url: str) -> bool:
+        # True when the URL is new
+        digest = self._digest(url)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def __contains__(self, url: str) -> bool:
+        return self._digest(url) in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+class HtmlTextExtractor(HTMLParser):
+    # Incremental HTML -> markdown-ish text: headings become "#" lines and block
+    # elements paragraph breaks, so the chunker can split on them. Script, style and
+    # other non-content elements are dropped. Fed chunk by chunk as the body downloads.
+
+    BLOCK_TAGS = {
+        "p", "div", "section", "article", "main", "aside", "header", "footer", "li", "ul", "ol",
+        "table", "tr", "pre", "blockquote", "br", "hr", "dl", "dt", "dd", "figure", "figcaption", "form",
+    }
+    SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "iframe", "object"}
+    HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+    def __init__(self, url: str):
+        super().__init__(convert_charrefs=True)
+        self.base = url
+        self.title = ""
+        self.links: list[str] = []
+        self._parts: list[str] = []
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base = urljoin(self.base, href)
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href and not href.startswith(("#", "mailto:", "javascript:", "tel:")):
+                self.links.append(href)
+        elif tag in self.HEADINGS:
+            self._parts.append("\n\n" + "#" * self.HEADINGS[tag] + " ")
+        elif tag in self.BLOCK_TAGS:
+            self._parts.append("\n\n")
+        elif tag in ("td", "th"):
+            self._parts.append(" ")
+
+    def handle_endtag(self, tag: str):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in self.HEADINGS or tag in self.BLOCK_TAGS:
+            self._parts.append("\n\n")
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self.title += data
+        elif not self._skip:
+            text = " ".join(data.split())
+            if text:
+                self._parts.append((" " if data[0].isspace() else "") + text + (" " if data[-1].isspace() else ""))
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self._parts).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+@dataclass
+class Page:
+    url: str
+    depth: int
+    status: int
+    title: str = ""
+    text: str = None
+    links: list[str] = field(default_factory=list)
+    etag: str = None
+    last_modified: str = None
+
+class CrawlState:
+    # What was last indexed per page: url -> {etag, last_modified, hash, chunks, links}.
+    # ETag and Last-Modified make re-crawls conditional requests, and the stored links
+    # let the crawl keep going past pages that come back 304 Not Modified. Pages are
+    # stored under the URL they were served from; redirects maps each linked URL that
+    # redirected to that URL, so the next crawl still finds their validators.
+
+    def __init__(self, path: Path, start_url: str, pages: dict[str, dict] = None, redirects: dict[str, str] = None):
+        self.path = Path(path)
+        self.start_url = start_url
+        self.pages = pages or {}
+        self.redirects = redirects or {}
+
+    @classmethod
+    def load(cls, path: Path, start_url: str) -> "CrawlState":
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path, start_url)
+        if state.get("start_url") != start_url:
+            return cls(path, start_url)
+        return cls(path, start_url, state.get("pages", {}), state.get("redirects", {}))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"start_url": self.start_url, "pages": self.pages, "redirects": self.redirects}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+@dataclass
+class CrawlSummary:
+    fetched: int = 0
+    not_modified: int = 0
+    gone: int = 0
+    errors: int = 0
+    skipped: int = 0
+    truncated: bool = False
+    # robots.txt could not be read, so the pages it would have allowed were not crawled
+    robots_unreachable: bool = False
+    bytes: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return (self.fetched + self.not_modified) / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.fetched} fetched ({self.bytes / 1024:.0f} KiB), {self.not_modified} not modified, {self.gone} gone, {self.skipped} skipped, {self.errors} errors in {self.elapsed_seconds:.2f}s ({self.rate:.1f} pages/s)"
+
+class Crawler:
+    # Breadth-first crawl of start_url's host down to depth links away. concurrency
+    # workers share one pooled aiohttp session; each host gets at most per_host requests
+    # in flight and robots.txt is honoured. Pages are streamed through the text
+    # extractor as they download and handed to on_page one at a time.
+
+    def __init__(
+        self,
+        start_url: str,
+        depth: int,
+        state: CrawlState,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        per_host: int = DEFAULT_PER_HOST,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_page_bytes: int = DEFAULT_MAX_PAGE_BYTES,
+        user_agent: str = USER_AGENT,
+    ):
+        self.start_url = normalize_url(start_url)
+        if self.start_url is None:
+            raise ValueError(f"Not an http(s) URL: {start_url!r}")
+        self.host = urlsplit(self.start_url).netloc
+        self.depth = depth
+        self.state = state
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.max_page_bytes = max_page_bytes
+        self.user_agent = user_agent
+        self.seen = SeenUrls()
+        # pages fetched or attempted this run (their redirect sources too), as digests
+        # like the seen set; the sync checks unreached pages in the state against it
+        self.visited = SeenUrls()
+        self.summary = CrawlSummary()
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._next_request: dict[str, float] = {}
+        self._robots: dict[str, RobotFileParser | None] = {}
+        self._robots_locks: dict[str, asyncio.Lock] = {}
+
+    def _in_scope(self, url: str) -> bool:
+        return urlsplit(url).netloc == self.host
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str):
+        # at most per_host requests in flight, and when robots.txt asks for a crawl
+        # delay, request starts spaced that far apart
+        async with self._host_limit(host):
+            robots = self._robots.get(host)
+            delay = robots.crawl_delay(self.user_agent) if robots else None
+            if delay:
+                now = time.monotonic()
+                start = max(now, self._next_request.get(host, now))
+                self._next_request[host] = start + float(delay)
+                await asyncio.sleep(start - now)
+            yield
+
+    async def _allowed(self, session: aiohttp.ClientSession, url: str) -> bool:
+        parts = urlsplit(url)
+        host = parts.netloc
+        lock = self._robots_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            if host not in self._robots:
+                self._robots[host] = await self._fetch_robots(session, f"{parts.scheme}://{host}/robots.txt")
+        robots = self._robots[host]
+        return robots is None or robots.can_fetch(self.user_agent, url)
+
+    async def _fetch_robots(self, session: aiohttp.ClientSession, url: str) -> RobotFileParser | None:
+        # as RFC 9309 has it: a missing robots.txt (4xx) allows everything, while one that
+        # cannot be read (5xx, network error) disallows everything on that host
+        host = urlsplit(url).netloc
+        try:
+            async with self._host_limit(host), session.get(url) as response:
+                if 400 <= response.status < 500:
+                    return None
+                if response.status < 500:
+                    robots = RobotFileParser(url)
+                    robots.parse((await response.text(errors="replace")).splitlines())
+                    return robots
+                reason = f"returned {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            reason = f"could not be read ({e!r})"
+
+        logger.warning(f"{url} {reason}, not crawling {host}")
+        self.summary.robots_unreachable = True
+        robots = RobotFileParser(url)
+        robots.disallow_all = True
+        return robots
+
+    def _enqueue(self, frontier: asyncio.Queue, links: list[str], base: str, depth: int):
+        if depth > self.depth:
+            return
+        for link in links:
+            url = normalize_url(link, base)
+            if url is None or not self._in_scope(url) or not self.seen.add(url):
+                continue
+            if len(self.seen) > self.max_pages:
+                self.summary.truncated = True
+                return
+            frontier.put_nowait((url, depth))
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, depth: int) -> Page | None:
+        previous = self.state.pages.get(self.state.redirects.get(url, url)) or {}
+        headers = {}
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+        async with self._host_slot(urlsplit(url).netloc), session.get(url, headers=headers) as response:
+            final_url = normalize_url(str(response.url))
+            if final_url == url:
+                self.state.redirects.pop(url, None)
+            elif final_url is None or not self._in_scope(final_url):
+                self.summary.skipped += 1
+                return None
+            else:
+                self.state.redirects[url] = final_url
+                if not self.seen.add(final_url):
+                    # this crawl already has the page it redirects to
+                    self.summary.skipped += 1
+                    return None
+
+            if response.status == 304:
+                self.summary.not_modified += 1
+                previous = self.state.pages.get(final_url) or previous
+                return Page(final_url, depth, 304, links=previous.get("links", []), etag=previous.get("etag"), last_modified=previous.get("last_modified"))
+            if response.status >= 400:
+                return Page(final_url, depth, response.status)
+
+            content_type = response.content_type or ""
+            if content_type not in _INDEXED_TYPES:
+                self.summary.skipped += 1
+                return None
+
+            page = Page(final_url, depth, response.status, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            # the body is decoded and parsed as it arrives rather than read whole first
+            extractor = HtmlTextExtractor(final_url) if content_type != "text/plain" else None
+            parts = []
+            received = 0
+            async for data in response.content.iter_chunked(_READ_SIZE):
+                received += len(data)
+                text = decoder.decode(data)
+                extractor.feed(text) if extractor else parts.append(text)
+                if received > self.max_page_bytes:
+                    logger.warning(f"{final_url} is larger than {self.max_page_bytes} bytes, indexing the start of it")
+                    break
+            text = decoder.decode(b"", final=True)
+            self.summary.bytes += received
+
+            if extractor is None:
+                page.text = "".join(parts) + text
+                return page
+
+            extractor.feed(text)
+            extractor.close()
+            page.title = " ".join(extractor.title.split())
+            page.text = extractor.text()
+            page.links = [link for link in (normalize_url(link, extractor.base) for link in extractor.links) if link]
+            return page
+
+    async def run(self, on_page: Callable[[Page], Awaitable[None]]) -> CrawlSummary:
+        start = time.perf_counter()
+        frontier: asyncio.Queue = asyncio.Queue()
+        self.seen.add(self.start_url)
+        frontier.put_nowait((self.start_url, 0))
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": self.user_agent}) as session:
+
+            async def worker():
+                while True:
+                    url, depth = await frontier.get()
+                    try:
+                        if not await self._allowed(session, url):
+                            self.summary.skipped += 1
+                            continue
+                        page = await self._fetch(session, url, depth)
+                        self.visited.add(url)
+                        if page is None:
+                            continue
+                        self.visited.add(page.url)
+                        if page.status in (404, 410):
+                            self.summary.gone += 1
+                        elif page.status >= 400:
+                            self.summary.errors += 1
+                            logger.warning(f"{url} returned {page.status}")
+                        elif page.status != 304:
+                            self.summary.fetched += 1
+                        self._enqueue(frontier, page.links, page.url, depth + 1)
+                        await on_page(page)
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        self.visited.add(url)
+                        self.summary.errors += 1
+                        logger.warning(f"Could not fetch {url}: {e!r}")
+                    except Exception:
+                        # a bad page (or a failing on_page) costs that page, not the worker:
+                        # if every worker died, frontier.join() would never return
+                        self.visited.add(url)
+                        self.summary.errors += 1
+                        logger.exception(f"Could not process {url}")
+                    finally:
+                        frontier.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                await frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        self.summary.elapsed_seconds = time.perf_counter() - start
+        return self.summary
+
+def crawl_pages(crawler: Crawler, buffer: int = 64) -> Iterator[Page]:
+    # runs the crawl on its own event loop thread and hands pages to the (threaded)
+    # indexing pipeline through a bounded queue, so a slow embed or upload stage slows
+    # the crawl down instead of piling pages up in memory
+    pages = queue.Queue(maxsize=buffer)
+    errors = []
+
+    def run():
+        try:
+            asyncio.run(crawler.run(lambda page: asyncio.to_thread(pages.put, page)))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            pages.put(_DONE)
+
+    thread = threading.Thread(target=run, name="crawler", daemon=True)
+    thread.start()
+    while (page := pages.get()) is not _DONE:
+        yield page
+    thread.join()
+
+    if errors:
+        raise errors[0]
+
+def page_id(url: str) -> str:
+    return content_hash(url)[:32]
+
+def chunk_ids(url: str, start: int, stop: int) -> list[str]:
+    parent = page_id(url)
+    return [f"{parent}-{i}" for i in range(start, stop)]
+
+@dataclass
+class WebSyncSummary:
+    crawl: CrawlSummary
+    changed: int = 0
+    unchanged: int = 0
+    upserted: int = 0
+    deleted: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.crawl}; {self.changed} pages changed, {self.unchanged} unchanged, {self.upserted} chunks upserted, {self.deleted} deleted"
+
+def sync_web_crawl(
+    crawler: Crawler,
+    index_name: str = DOCUMENTS_INDEX,
+    embedding_model: str = "text-embedding-ada-002",
+    chunker: MarkdownChunker = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+) -> WebSyncSummary:
+    chunker = chunker or MarkdownChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    uploader = DocumentUploader(get_search_client(index_name))
+    state = crawler.state
+    summary = WebSyncSummary(crawler.summary)
+    gone = []
+
+    # a page's new state is recorded once all of its chunks have landed, so a failed
+    # upload leaves it to be fetched and indexed again next time
+    remaining = {}
+    completed = {}
+    lock = threading.Lock()
+
+    def record(url: str, entry: dict):
+        completed[url] = (state.pages.get(url), entry["chunks"])
+        state.pages[url] = entry
+
+    def batches() -> Iterator[list[dict]]:
+        batch = []
+        for page in crawl_pages(crawler):
+            if page.status in (404, 410):
+                gone.append(page.url)
+                continue
+            if page.status >= 400:
+                continue
+            if page.status == 304:
+                continue
+            previous = state.pages.get(page.url) or {}
+
+            entry = {"etag": page.etag, "last_modified": page.last_modified, "hash": content_hash(page.title, page.text), "links": page.links}
+            if previous.get("hash") == entry["hash"]:
+                # re-sent but unchanged (no validators, or they changed without the content)
+                summary.unchanged += 1
+                with lock:
+                    state.pages[page.url] = {**entry, "chunks": previous.get("chunks", 0)}
+                continue
+
+            summary.changed += 1
+            parent = page_id(page.url)
+            title = page.title or page.url
+            docs = [
+                {
+                    "id": f"{parent}-{chunk.index}",
+                    "title": f"{title} > {chunk.heading}" if chunk.heading else title,
+                    "content": chunk.text,
+                    "parentId": parent,
+                    "chunkIndex": chunk.index,
+                    "chunkOffset": chunk.offset,
+                    "chunkLength": chunk.length,
+                }
+                for chunk in chunker.chunks(page.text)
+            ]
+            with lock:
+                entry["chunks"] = len(docs)
+                if docs:
+                    remaining[parent] = (page.url, entry, len(docs))
+                else:
+                    record(page.url, entry)
+
+            batch.extend(docs)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+
+        if batch:
+            yield batch
+
+    def on_uploaded(docs: list[dict]):
+        with lock:
+            for doc in docs:
+                url, entry, left = remaining[doc["parentId"]]
+                remaining[doc["parentId"]] = (url, entry, left - 1)
+                if left == 1:
+                    record(url, entry)
+
+    def upload(docs: list[dict]):
+        result = uploader.upload(docs)
+        logger.debug(f"Uploaded documents: {result}")
+        return result
+
+    stats = run_pipeline(
+        batches(),
+        embed=lambda docs: embed_documents(docs, embedding_model),
+        upload=upload,
+        on_uploaded=on_uploaded,
+    )
+    summary.upserted = stats.upload.items
+
+    # pages that are gone, and when the crawl covered the whole site, pages it no longer
+    # reaches; pages that failed to fetch this time are kept
+    removed = set(gone)
+    if not crawler.summary.truncated and not crawler.summary.robots_unreachable:
+        removed.update(url for url in state.pages if url not in crawler.visited)
+        state.redirects = {url: target for url, target in state.redirects.items() if url in crawler.visited}
+
+    stale = []
+    for url in removed:
+        stale.extend(chunk_ids(url, 0, state.pages.get(url, {}).get("chunks", 0)))
+    for url, (previous, new_chunks) in completed.items():
+        stale.extend(chunk_ids(url, new_chunks, previous["chunks"] if previous else 0))
+    failed = set()
+    if stale:
+        result = uploader.delete(stale)
+        logger.info(f"Deleted documents: {result}")
+        summary.deleted = result.succeeded
+        failed = set(result.failed_keys)
+    for url in removed:
+        if url in state.pages and not failed.intersection(chunk_ids(url, 0, state.pages[url].get("chunks", 0))):
+            del state.pages[url]
+    # a page whose old tail could not be deleted keeps its previous state (and validators),
+    # so the next crawl downloads it, sees it changed and retries the delete
+    for url, (previous, new_chunks) in completed.items():
+        if previous and failed.intersection(chunk_ids(url, new_chunks, previous["chunks"])):
+            state.pages[url] = previous
+
+    state.save()
+    logger.info(f"Web crawl sync of {crawler.start_url}: {summary}")
+
+    return summary
+
+def state_path(start_url: str, fake: bool = False) -> Path:
+    # fake runs keep their own state, so they never mark pages as indexed for real
+    return CONNECTOR_STATE_PATH / f"web_crawl-{content_hash(start_url)[:16]}{'-fake' if fake else ''}.json"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl a Web Crawl source and index its new, changed and removed pages")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--source", help="name of a Web Crawl source configured in the frontend")
+    target.add_argument("--url", help="page to start from")
+    parser.add_argument("--depth", type=int, default=2, help="links to follow away from the start page (with --url)")
+    parser.add_argument("--index", default=DOCUMENTS_INDEX)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST)
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES)
+    parser.add_argument("--fake", action="store_true", help="use fake embeddings and search clients")
+    args = parser.parse_args()
+
+    if args.source:
+        source = find_source(args.source, "Web Crawl")
+        start_url, depth = source["start_url"], int(source.get("depth", 2))
+    else:
+        start_url, depth = args.url, args.depth
+
+    start_url = normalize_url(start_url)
+    if start_url is None:
+        parser.error("the start URL must be an http(s) URL")
+
+    if args.fake:
+        CONNECTOR_STATE_PATH.mkdir(parents=True, exist_ok=True)
+        install_fakes(args.index, CONNECTOR_STATE_PATH)
+    else:
+        from create_search_index import create_index
+
+        create_index(args.index)
+
+    crawler = Crawler(
+        start_url,
+        depth,
+        CrawlState.load(state_path(start_url, args.fake), start_url),
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        max_pages=args.max_pages,
+    )
+    sync_web_crawl(crawler, index_name=args.index)
@@ -1,10 +1,3 @@
-import os
-from azure.identity import DefaultAzureCredential
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.projects import AIProjectClient
-from azure.ai.projects.models import ConnectionType
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SemanticSearch,
     SearchIndex,
@@ -24,39 +17,47 @@ from azure.search.documents.indexes.models import (
     ExhaustiveKnnParameters,
     VectorSearchProfile,
 )
+import argparse
 import pandas as pd
-from config import get_logger
-
-logger = get_logger(__name__)
-
-project = AIProjectClient.from_connection_string(
-    conn_str="eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1", #os.environ["AIPROJECT_CONNECTION_STRING"],
-    credential=DefaultAzureCredential()
+from config import (
+    MANIFEST_PATH,
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    get_logger,
+    get_index_config,
+    get_embeddings_client,
+    get_search_client,
+    get_search_index_client,
+    memoize,
 )
+from embedding_cache import get_embedding_cache
+from manifest import IndexManifest, content_hash
+from uploader import DocumentUploader, UploadSummary
+from pipeline import read_csv_chunks, run_pipeline, PipelineStats, DEFAULT_CHUNK_SIZE
+from embedding import embed_texts, DEFAULT_BATCH_SIZE, DEFAULT_MAX_BATCH_TOKENS, DEFAULT_CONCURRENCY
+from chunking import MarkdownChunker
 
-embeddings = project.inference.get_embeddings_client()
-
-search_connection = project.connections.get_default(
-    connection_type=ConnectionType.AZURE_AI_SEARCH,
-    include_credentials=True
-)
+logger = get_logger(__name__)
 
-search_index_client = SearchIndexClient(
-    endpoint=search_connection.endpoint_url,
-    credential=AzureKeyCredential(key=search_connection.key)
-)
+def create_index(index_name: str = "products") -> SearchIndex:
+    index_config = get_index_config(index_name)
+    hnsw_config = index_config["hnsw"]
+    metric = VectorSearchAlgorithmMetric(index_config["metric"])
 
-def create_index() -> SearchIndex:
     fields = [
         SimpleField(name="id", type=SearchFieldDataType.String, key=True),
         SearchableField(name="title", type=SearchFieldDataType.String),
         SearchableField(name="content", type=SearchFieldDataType.String),
+        SimpleField(name="parentId", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="chunkIndex", type=SearchFieldDataType.Int32, filterable=True, sortable=True),
+        SimpleField(name="chunkOffset", type=SearchFieldDataType.Int32),
+        SimpleField(name="chunkLength", type=SearchFieldDataType.Int32),
         SearchField(
             name="contentVector",
             type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
             searchable=True,
             vector_search_dimensions=1536,
-            vector_search_profile_name="hnswProfile",
+            vector_search_profile_name=index_config["vector_profile"],
         )
     ]
 
@@ -66,17 +67,17 @@ def create_index() -> SearchIndex:
                 name="hnswConfig",
                 kind=VectorSearchAlgorithmKind.HNSW,
                 parameters=HnswParameters(
-                    m=4,
-                    ef_construction=1000,
-                    ef_search=1000,
-                    metric=VectorSearchAlgorithmMetric.COSINE,
+                    m=hnsw_config["m"],
+                    ef_construction=hnsw_config["ef_construction"],
+                    ef_search=hnsw_config["ef_search"],
+                    metric=metric,
                 ),
             ),
             ExhaustiveKnnAlgorithmConfiguration(
                 name="eknnConfig",
                 kind=VectorSearchAlgorithmKind.EXHAUSTIVE_KNN,
                 parameters=ExhaustiveKnnParameters(
-                    metric=VectorSearchAlgorithmMetric.COSINE,
+                    metric=metric,
                 ),
             ),
         ],
@@ -104,55 +105,163 @@ def create_index() -> SearchIndex:
     semantic_search = SemanticSearch(configurations=[semantic_config])
 
     search_index = SearchIndex(
-        name="products",
+        name=index_name,
         fields=fields,
         semantic_search=semantic_search,
         vector_search=vector_search,
     )
 
-    search_index_client.create_or_update_index(search_index)
+    get_search_index_client().create_or_update_index(search_index)
 
     return
 
-def load_docs(path: str, embedding_model: str):
-    products = pd.read_csv(path)
+def chunk_products(products: list[dict], chunker: MarkdownChunker = None) -> list[dict]:
+    # a description that fits in one chunk stays one document keyed on the product id,
+    # exactly as before chunking; longer ones become {id}-{n} passages of that product
+    chunker = chunker or MarkdownChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
     documents = []
 
-    for product in products.to_dict("records"):
-        id = product["id"]
-        title = product["name"]
-        content = product["description"]
-        contentVector = embeddings.embed(input=content, model=embedding_model).data[0].embedding
-        rec = {
-            "id": str(id),
-            "title": title,
-            "content": content,
-            "contentVector": contentVector
-        }
-        documents.append(rec)
+    for product in products:
+        id = str(product["id"])
+        description = product["description"]
+        if chunker.count_tokens(description) <= chunker.max_tokens:
+            chunks = [(description, 0, len(description))]
+        else:
+            chunks = [(chunk.text, chunk.offset, chunk.length) for chunk in chunker.chunks(description)]
+
+        for i, (content, offset, length) in enumerate(chunks):
+            documents.append({
+                "id": id if i == 0 else f"{id}-{i}",
+                "title": product["name"],
+                "content": content,
+                "parentId": id,
+                "chunkIndex": i,
+                "chunkOffset": offset,
+                "chunkLength": length,
+            })
 
     return documents
 
-def write_docs(docs: list[dict]):
-    search_client = SearchClient(
-        endpoint=search_connection.endpoint_url,
-        credential=AzureKeyCredential(key=search_connection.key),
-        index_name="products",
+def embedding_text(document: dict) -> str:
+    # the title carries the product name or the chunk's heading path, which a passage
+    # split out of a longer text no longer contains, so it is embedded with the content
+    return f"{document['title']}\n\n{document['content']}" if document.get("title") else document["content"]
+
+def embed_documents(
+    documents: list[dict],
+    embedding_model: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> list[dict]:
+    contentVectors = embed_texts(
+        get_embeddings_client(),
+        [embedding_text(document) for document in documents],
+        model=embedding_model,
+        batch_size=batch_size,
+        max_batch_tokens=max_batch_tokens,
+        concurrency=concurrency,
+        cache=get_embedding_cache(),
     )
 
-    search_client.upload_documents(documents=docs)
+    return [
+        {**document, "contentVector": contentVector}
+        for document, contentVector in zip(documents, contentVectors)
+    ]
+
+def embed_products(products: list[dict], embedding_model: str, **embed_options) -> list[dict]:
+    return embed_documents(chunk_products(products), embedding_model, **embed_options)
 
-    return
+def load_docs(path: str, embedding_model: str, **embed_options):
+    products = pd.read_csv(path).to_dict("records")
+
+    return embed_products(products, embedding_model, **embed_options)
+
+def document_hashes(docs: list[dict]) -> dict[str, str]:
+    return {doc["id"]: content_hash(doc["title"], doc["content"]) for doc in docs}
+
+@memoize
+def get_uploader() -> DocumentUploader:
+    return DocumentUploader(get_search_client("products"))
+
+def write_docs(docs: list[dict]) -> UploadSummary:
+    summary = get_uploader().upload(docs)
 
-def populate_index():
+    logger.info(f"Uploaded documents: {summary}")
+
+    return summary
+
+def delete_docs(ids: list[str]) -> UploadSummary:
+    summary = get_uploader().delete(ids)
+
+    logger.info(f"Deleted documents: {summary}")
+
+    return summary
+
+def stream_docs(
+    path: str,
+    embedding_model: str,
+    manifest: IndexManifest,
+    delta: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    **embed_options,
+) -> PipelineStats:
+    seen = set()
+    skipped = 0
+
+    def chunks():
+        nonlocal skipped
+        for products in read_csv_chunks(path, chunk_size):
+            docs = chunk_products(products)
+            hashes = document_hashes(docs)
+            seen.update(hashes)
+            if delta:
+                changed = set(manifest.changed(hashes, embedding_model))
+                skipped += len(docs) - len(changed)
+                docs = [doc for doc in docs if doc["id"] in changed]
+            yield docs
+
+    def on_uploaded(docs: list[dict]):
+        manifest.update(document_hashes(docs), embedding_model)
+
+    stats = run_pipeline(
+        chunks(),
+        embed=lambda docs: embed_documents(docs, embedding_model, **embed_options),
+        upload=write_docs,
+        on_uploaded=on_uploaded,
+    )
+
+    # every run, delta or full, deletes what the manifest has but the CSV no longer
+    # produces: removed products and the tail passages of shortened descriptions
+    deleted = manifest.missing(seen)
+    if deleted:
+        # keys whose delete failed stay in the manifest, so the next delta sync retries them
+        summary = delete_docs(deleted)
+        manifest.remove(sorted(set(deleted) - set(summary.failed_keys)))
+
+    manifest.save()
+
+    stats.log()
+    if delta:
+        logger.info(f"Delta sync: {stats.upload.items} upserted, {len(deleted)} deleted, {skipped} unchanged")
+    else:
+        logger.info(f"Full sync: {stats.upload.items} upserted, {len(deleted)} deleted")
+
+    return stats
+
+def populate_index(delta: bool = False):
     create_index()
 
     csv_file = "assets/products.csv"
 
-    docs = load_docs(csv_file, embedding_model="text-embedding-ada-002")
+    manifest = IndexManifest.load(MANIFEST_PATH)
 
-    write_docs(docs)
+    stream_docs(csv_file, embedding_model="text-embedding-ada-002", manifest=manifest, delta=delta)
 
 if __name__ == "__main__":
-    populate_index()
-    logger.info("Index populated successfully")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delta", action="store_true", help="only embed and upload new or changed products, and delete removed ones")
+    args = parser.parse_args()
+
+    populate_index(delta=args.delta)
+    logger.info("Index populated successfully")
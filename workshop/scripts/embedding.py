@@ -0,0 +1,103 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import HttpResponseError
+from config import RETRYABLE_STATUS_CODES, get_logger
+from telemetry import record_usage
+
+logger = get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_BATCH_TOKENS = 8000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 6
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; close enough for packing batches
+    return max(1, len(text) // 4)
+
+def make_batches(texts: list[str], batch_size: int, max_batch_tokens: int) -> list[list[int]]:
+    batches = []
+    batch = []
+    batch_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+def _retry_delay(error: HttpResponseError, attempt: int) -> float:
+    headers = getattr(error.response, "headers", None) or {}
+    retry_after = headers.get("retry-after-ms") or headers.get("x-ms-retry-after-ms")
+    if retry_after:
+        return float(retry_after) / 1000
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def embed_batch(client, texts: list[str], model: str, max_retries: int = DEFAULT_MAX_RETRIES) -> list[list[float]]:
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.embed(input=texts, model=model)
+            record_usage(response.usage)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except HttpResponseError as e:
+            if e.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"Embedding batch of {len(texts)} throttled ({e.status_code}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+def embed_texts(
+    client,
+    texts: list[str],
+    model: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    cache=None,
+) -> list[list[float]]:
+    vectors = cache.get_many(model, texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if not missing:
+        return vectors
+
+    missing_texts = [texts[i] for i in missing]
+    batches = make_batches(missing_texts, batch_size, max_batch_tokens)
+
+    def run(indexes: list[int]) -> list[list[float]]:
+        return embed_batch(client, [missing_texts[i] for i in indexes], model, max_retries)
+
+    if len(batches) == 1:
+        results = [run(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run, batches))
+
+    for indexes, embeddings in zip(batches, results):
+        for i, embedding in zip(indexes, embeddings):
+            vectors[missing[i]] = embedding
+
+    if cache is not None:
+        cache.put_many(model, missing_texts, [vectors[i] for i in missing])
+
+    logger.debug(f"Embedded {len(missing)} of {len(texts)} texts in {len(batches)} batches")
+
+    return vectors
+
+def embed_text(client, text: str, model: str, cache=None) -> list[float]:
+    return embed_texts(client, [text], model=model, cache=cache)[0]
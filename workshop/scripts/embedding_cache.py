@@ -0,0 +1,236 @@
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+import numpy as np
+from config import EMBEDDING_CACHE_PATH, get_logger, memoize
+
+logger = get_logger(__name__)
+
+DEFAULT_DIMENSIONS = 1536
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_FLUSH_INTERVAL = 30.0
+DEFAULT_SLOT_REUSE_DELAY = 1.0
+MAX_PENDING_TOUCHES = 256
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    # Vectors live in a memory-mapped float32 matrix (vectors.f32); the key -> slot
+    # index and LRU clock live in SQLite (index.db, in WAL mode, one connection per
+    # thread), so readers never wait for a writer and a write is one short IMMEDIATE
+    # transaction without an fsync per commit. A vector is only written to a slot no
+    # entry points at: one never used, or one evicted at least slot_reuse_delay seconds
+    # ago, long after any reader that looked it up has copied the row out. Hits are
+    # stamped on the LRU clock in batches, with the next write. The mapping is shared,
+    # so other processes see written rows at once; it is flushed to disk every
+    # flush_interval seconds and on close.
+
+    def __init__(
+        self,
+        path: Path,
+        dimensions: int = DEFAULT_DIMENSIONS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        slot_reuse_delay: float = DEFAULT_SLOT_REUSE_DELAY,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.slot_reuse_delay = slot_reuse_delay
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._touched = {}
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY, freed_at REAL NOT NULL);
+            """
+        )
+        db.execute("INSERT OR IGNORE INTO meta VALUES ('dimensions', ?), ('capacity', ?)", (dimensions, max_entries))
+        # caches written before the free list kept their slots dense from 0
+        db.execute("INSERT OR IGNORE INTO meta SELECT 'next_slot', COALESCE(MAX(slot) + 1, 0) FROM entries")
+        meta = dict(db.execute("SELECT name, value FROM meta"))
+        self.dimensions = meta["dimensions"]
+        self.capacity = meta["capacity"]
+        # evicting ahead in batches keeps evicted slots aging while earlier ones are used
+        self._evict_batch = max(1, self.capacity // 20)
+
+        matrix_path = self.path / "vectors.f32"
+        mode = "r+" if matrix_path.exists() else "w+"
+        self._matrix = np.memmap(matrix_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dimensions))
+        self._flushed_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path / "index.db", timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.append(db)
+        return db
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        keys = [cache_key(model, text) for text in texts]
+        vectors = {}
+
+        for key, slot in self._slots(self._db(), list(set(keys))):
+            vectors[key] = self._matrix[slot].tolist()
+
+        if vectors:
+            now = time.time()
+            with self._write_lock:
+                self._touched.update(dict.fromkeys(vectors, now))
+                if len(self._touched) >= MAX_PENDING_TOUCHES:
+                    self._write(lambda db: None)
+
+        results = [vectors.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+
+        return results
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        items = {}
+        for text, vector in zip(texts, vectors):
+            if len(vector) != self.dimensions:
+                logger.warning(f"Not caching {len(vector)}-dimension embedding from {model} in a {self.dimensions}-dimension cache")
+                continue
+            items[cache_key(model, text)] = vector
+        items = list(items.items())[-self.capacity:]
+        if not items:
+            return
+
+        def update(db: sqlite3.Connection):
+            left = self._insert(db, items)
+            room = self._room(db)
+            if left or room < self._evict_batch:
+                self._evict(db, max(len(left), self._evict_batch - room))
+                # usable now only without a reuse delay; otherwise what did not fit is
+                # not cached this time
+                left = self._insert(db, left)
+            if left:
+                logger.debug(f"Embedding cache full, {len(left)} vectors not cached")
+
+        with self._write_lock:
+            self._write(update)
+
+        if time.monotonic() - self._flushed_at > self.flush_interval:
+            self.flush()
+
+    def put(self, model: str, text: str, vector: list[float]):
+        self.put_many(model, [text], [vector])
+
+    def _write(self, update):
+        # one IMMEDIATE transaction, carrying the LRU stamps of hits since the last one
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._touched:
+                db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key, now in self._touched.items()])
+            update(db)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        self._touched.clear()
+
+    def _next_slot(self, db: sqlite3.Connection) -> int:
+        return db.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()[0]
+
+    def _room(self, db: sqlite3.Connection) -> int:
+        free = db.execute("SELECT COUNT(*) FROM free_slots").fetchone()[0]
+        return free + self.capacity - self._next_slot(db)
+
+    def _insert(self, db: sqlite3.Connection, items: list[tuple[str, list[float]]]) -> list[tuple[str, list[float]]]:
+        # places new keys in usable slots and returns the items that did not fit; an
+        # existing key keeps its vector, as overwriting it could tear a row being read
+        if not items:
+            return []
+        existing = {key for key, _ in self._slots(db, [key for key, _ in items])}
+        new_items = [(key, vector) for key, vector in items if key not in existing]
+
+        now = time.time()
+        slots = [
+            slot for (slot,) in db.execute(
+                "SELECT slot FROM free_slots WHERE freed_at <= ? ORDER BY slot LIMIT ?", (now - self.slot_reuse_delay, len(new_items))
+            )
+        ]
+        reused = len(slots)
+        next_slot = self._next_slot(db)
+        fresh = max(0, min(len(new_items) - reused, self.capacity - next_slot))
+        slots += range(next_slot, next_slot + fresh)
+        placed = new_items[:len(slots)]
+
+        for (key, vector), slot in zip(placed, slots):
+            self._matrix[slot] = vector
+
+        if reused:
+            db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots[:reused]])
+        if fresh:
+            db.execute("UPDATE meta SET value = ? WHERE name = 'next_slot'", (next_slot + fresh,))
+        db.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", [(key, slot, now) for (key, _), slot in zip(placed, slots)])
+        if existing:
+            db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in existing])
+
+        return new_items[len(slots):]
+
+    def _evict(self, db: sqlite3.Connection, count: int):
+        candidates = db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (count,)).fetchall()
+        now = time.time()
+        db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in candidates])
+        db.executemany("INSERT INTO free_slots (slot, freed_at) VALUES (?, ?)", [(slot, now) for _, slot in candidates])
+
+    def _slots(self, db: sqlite3.Connection, keys: list[str]):
+        for chunk in _chunks(keys, 500):
+            yield from db.execute(f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        self._matrix.flush()
+
+    def close(self):
+        with self._write_lock:
+            if self._touched:
+                self._write(lambda db: None)
+            self.flush()
+            with self._connections_lock:
+                for db in self._connections:
+                    db.close()
+                self._connections.clear()
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+@memoize
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(EMBEDDING_CACHE_PATH)
@@ -1,57 +1,78 @@
 import os
-import multiprocessing
-import contextlib
-import pandas as pd
+import argparse
 from pathlib import Path
-from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import ConnectionType
 from azure.ai.evaluation import evaluate, GroundednessEvaluator
-from azure.identity import DefaultAzureCredential
 from chat_with_products import chat_with_products
-from config import ASSET_PATH
+from config import ASSET_PATH, EVAL_CACHE_PATH, get_connection, get_logger, get_project_client, memoize
+from eval_runner import TargetOutputStore, run_target, write_eval_data, DEFAULT_CONCURRENCY
 
-from dotenv import load_dotenv
+logger = get_logger(__name__)
 
-load_dotenv()
+@memoize
+def get_groundedness_evaluator() -> GroundednessEvaluator:
+    connection = get_connection(ConnectionType.AZURE_OPEN_AI)
 
-project = AIProjectClient.from_connection_string(
-    conn_str=os.getenv("AIPROJECT_CONNECTION_STRING"),
-    credential=DefaultAzureCredential()
-)
-
-connection = project.connections.get_default(ConnectionType.AZURE_OPEN_AI, include_credentials=True)
-
-evaluator_model = {
-    "azure_endpoint": connection.endpoint_url,
-    "azure_deployment": os.environ["EVALUATION_MODEL"],
-    "api_version": "2024-06-01",
-    "api_key": connection.key,
-}
+    evaluator_model = {
+        "azure_endpoint": connection.endpoint_url,
+        "azure_deployment": os.environ["EVALUATION_MODEL"],
+        "api_version": "2024-06-01",
+        "api_key": connection.key,
+    }
 
-groundedness = GroundednessEvaluator(evaluator_model)
+    return GroundednessEvaluator(evaluator_model)
 
 def eval_chat_with_products(query):
-    response = chat_with_products(messages=[{"role": "user", "content": query}])
+    # every row is scored on a fresh answer, not one cached for a similar question
+    response = chat_with_products(messages=[{"role": "user", "content": query}], context={"semantic_cache": False})
     return {
         "response": response["message"].content, 
         "context": response["context"]["grounding_data"]
     }
 
-if __name__ == "__main__":
-    result = evaluate(
-        data = Path(ASSET_PATH)/"chat_eval_data.jsonl",
-        target = evaluate_chat_with_products,
+def run_eval(data_path: Path, outputs_path: Path, concurrency: int = DEFAULT_CONCURRENCY, skip_target: bool = False, fresh: bool = False):
+    if fresh and outputs_path.exists():
+        outputs_path.unlink()
+
+    store = TargetOutputStore(outputs_path)
+    try:
+        if not skip_target:
+            run_target(data_path, eval_chat_with_products, store, concurrency=concurrency)
+
+        eval_data_path = outputs_path.with_name(f"{data_path.stem}.eval.jsonl")
+        rows = write_eval_data(data_path, store, eval_data_path)
+    finally:
+        store.close()
+
+    logger.info(f"Evaluating {rows} rows from {eval_data_path}")
+
+    return evaluate(
+        data = eval_data_path,
         evaluation_name = "evaluate_chat_with_products",
         evaluators = {
-            "groundedness": groundedness
+            "groundedness": get_groundedness_evaluator()
         },
         evaluator_config={
             "default": {
-                "query": { "${data.query}"},
-                "context": { "${target.context}"},
-                "response": { "${target.response}"}
+                "query": "${data.query}",
+                "context": "${data.context}",
+                "response": "${data.response}"
             }
         },
-        azure_ai_project=project.scope,
+        azure_ai_project=get_project_client().scope,
         output_path="./myevalresults.json",
     )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default=str(Path(ASSET_PATH)/"chat_eval_data.jsonl"))
+    parser.add_argument("--outputs", help="target output checkpoint (defaults to one per dataset under the eval cache)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--skip-target", action="store_true", help="only run the evaluators on the checkpointed target outputs")
+    parser.add_argument("--fresh", action="store_true", help="discard checkpointed target outputs and call the target for every row")
+    args = parser.parse_args()
+
+    data_path = Path(args.data)
+    outputs_path = Path(args.outputs) if args.outputs else EVAL_CACHE_PATH / f"{data_path.stem}.outputs.jsonl"
+
+    run_eval(data_path, outputs_path, concurrency=args.concurrency, skip_target=args.skip_target, fresh=args.fresh)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+from config import get_logger
+from manifest import content_hash
+
+logger = get_logger(__name__)
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_MAX_RETRIES = 2
+
+def read_rows(path: Path) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def row_key(row: dict, query_field: str = "query") -> str:
+    return content_hash(row[query_field])
+
+class TargetOutputStore:
+    # Append-only JSON lines checkpoint of target outputs, keyed on the query hash.
+    # Every finished row is flushed as soon as it completes, so a crashed run loses at
+    # most the rows that were in flight; a truncated last line is ignored on load.
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.outputs = {}
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            valid_bytes = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Ignoring truncated checkpoint line in {self.path}")
+                        break
+                    self.outputs[record["key"]] = record["output"]
+                    valid_bytes += len(line)
+            # drop a partial last line so new records are not appended onto it
+            os.truncate(self.path, valid_bytes)
+
+        self._file = open(self.path, "a")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.outputs
+
+    def __len__(self) -> int:
+        return len(self.outputs)
+
+    def get(self, key: str) -> dict | None:
+        return self.outputs.get(key)
+
+    def put(self, key: str, output: dict):
+        line = json.dumps({"key": key, "output": output}) + "\n"
+        with self._lock:
+            self.outputs[key] = output
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+@dataclass
+class TargetRunSummary:
+    rows: int = 0
+    cached: int = 0
+    completed: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.completed / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.rows} rows: {self.cached} from checkpoint, {self.completed} run in {self.elapsed_seconds:.2f}s ({self.rate:.1f} rows/s), {self.failed} failed"
+
+def _call_target(target: Callable[[str], dict], query: str, max_retries: int) -> dict:
+    for attempt in range(max_retries + 1):
+        try:
+            return target(query)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Target failed for {query!r} ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+def run_target(
+    data_path: Path,
+    target: Callable[[str], dict],
+    store: TargetOutputStore,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    query_field: str = "query",
+) -> TargetRunSummary:
+    summary = TargetRunSummary()
+    start = time.perf_counter()
+    pending = {}
+    scheduled = set()
+
+    def collect(done):
+        for future in done:
+            key, query = pending.pop(future)
+            try:
+                store.put(key, future.result())
+                summary.completed += 1
+            except Exception as e:
+                # left out of the checkpoint so the next run picks the row up again
+                summary.failed += 1
+                logger.error(f"Target failed for {query!r}: {e}")
+        if summary.completed and summary.completed % 100 == 0:
+            logger.info(f"Target progress: {summary.completed} completed, {summary.failed} failed")
+
+    # rows are streamed with at most 2 * concurrency in flight, so the dataset is never
+    # held in memory as a whole
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for row in read_rows(data_path):
+            summary.rows += 1
+            key = row_key(row, query_field)
+            if key in store or key in scheduled:
+                summary.cached += 1
+                continue
+            scheduled.add(key)
+
+            while len(pending) >= 2 * concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            future = executor.submit(_call_target, target, row[query_field], max_retries)
+            pending[future] = (key, row[query_field])
+
+        collect(wait(pending).done)
+
+    summary.elapsed_seconds = time.perf_counter() - start
+    logger.info(f"Target run: {summary}")
+
+    return summary
+
+def write_eval_data(data_path: Path, store: TargetOutputStore, out_path: Path, query_field: str = "query") -> int:
+    # joins each dataset row with its cached target output, so evaluators can run on
+    # the result without calling the target again
+    out_path = Path(out_path)
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    written = 0
+
+    with open(tmp_path, "w") as f:
+        for row in read_rows(data_path):
+            output = store.get(row_key(row, query_field))
+            if output is None:
+                continue
+            f.write(json.dumps({**row, **output}) + "\n")
+            written += 1
+
+    os.replace(tmp_path, out_path)
+
+    return written
@@ -0,0 +1,288 @@
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+from azure.core.exceptions import HttpResponseError
+
+def _fake_vector(text: str, dimensions: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimensions)]
+
+class FakeEmbeddingsClient:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        per_item_latency: float = 0.001,
+        dimensions: int = 1536,
+        throttle_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.dimensions = dimensions
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def embed(self, input, model: str = None, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+
+        with self._lock:
+            self.calls += 1
+            throttle = self._rng.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+
+        if throttle:
+            error = HttpResponseError(message="Too Many Requests")
+            error.status_code = 429
+            raise error
+
+        time.sleep(self.latency + self.per_item_latency * len(texts))
+
+        return SimpleNamespace(
+            model=model,
+            data=[
+                SimpleNamespace(index=i, embedding=_fake_vector(text, self.dimensions))
+                for i, text in enumerate(texts)
+            ],
+            usage=SimpleNamespace(prompt_tokens=sum(len(text) // 4 for text in texts)),
+        )
+
+def _fake_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _unavailable() -> HttpResponseError:
+    error = HttpResponseError(message="Service unavailable")
+    error.status_code = 503
+    return error
+
+class _FakeStream:
+    def __init__(self, chunks: list[str], token_latency: float):
+        self._chunks = chunks
+        self._token_latency = token_latency
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            time.sleep(self._token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+
+    def close(self):
+        self.closed = True
+
+class FakeChatCompletionsClient:
+    # Answers with canned text after a fixed latency plus a per-output-token delay.
+    # Intent mapping requests (a system prompt asking for a search_query) get a JSON
+    # search query built from the last user turn, like the real model returns.
+
+    def __init__(
+        self,
+        latency: float = 0.3,
+        token_latency: float = 0.005,
+        answer_tokens: int = 120,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _answer(self, messages: list) -> str:
+        system = " ".join(str(message["content"]) for message in messages if message["role"] == "system")
+        user = next((str(message["content"]) for message in reversed(messages) if message["role"] == "user"), "")
+        if "search_query" in system:
+            turns = re.findall(r"- user: (.*)", user)
+            return json.dumps({"intent": "", "search_query": turns[-1] if turns else user})
+        words = (f"Based on the catalog, here is what I found about {user}. " * self.answer_tokens).split()
+        return " ".join(words[:self.answer_tokens])
+
+    def complete(self, messages: list, model: str = None, stream: bool = False, **kwargs):
+        messages = [message if isinstance(message, dict) else message.as_dict() for message in messages]
+        prompt_tokens = sum(_fake_tokens(str(message["content"])) for message in messages)
+        answer = self._answer(messages)
+        completion_tokens = len(answer.split())
+
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+            else:
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+
+        time.sleep(self.latency)
+        if fail:
+            raise _unavailable()
+
+        if stream:
+            return _FakeStream([word + " " for word in answer.split()], self.token_latency)
+
+        time.sleep(self.token_latency * completion_tokens)
+
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason="stop",
+                message=SimpleNamespace(role="assistant", content=answer),
+            )],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+class FakeSearchClient:
+    def __init__(self, latency: float = 0.02, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.documents = {}
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _index(self, documents: list[dict], apply):
+        time.sleep(self.latency)
+        results = []
+        with self._lock:
+            self.calls += 1
+            for doc in documents:
+                key = str(doc["id"])
+                if self._rng.random() < self.failure_rate:
+                    results.append(SimpleNamespace(key=key, succeeded=False, status_code=503, error_message="Service unavailable"))
+                    continue
+                if apply(key, doc) is False:
+                    results.append(SimpleNamespace(key=key, succeeded=False, status_code=404, error_message="Document not found"))
+                    continue
+                results.append(SimpleNamespace(key=key, succeeded=True, status_code=200, error_message=None))
+        return results
+
+    def upload_documents(self, documents: list[dict], **kwargs):
+        return self._index(documents, lambda key, doc: self.documents.__setitem__(key, doc))
+
+    def merge_documents(self, documents: list[dict], **kwargs):
+        # like the service, merging into a document that does not exist fails with 404
+        def merge(key: str, doc: dict):
+            if key not in self.documents:
+                return False
+            self.documents[key] = {**self.documents[key], **doc}
+
+        return self._index(documents, merge)
+
+    def merge_or_upload_documents(self, documents: list[dict], **kwargs):
+        return self._index(documents, lambda key, doc: self.documents.__setitem__(key, {**self.documents.get(key, {}), **doc}))
+
+    def delete_documents(self, documents: list[dict], **kwargs):
+        return self._index(documents, lambda key, doc: self.documents.pop(key, None))
+
+    def search(self, search_text: str = None, top: int = 50, select: list[str] = None, **kwargs):
+        # keyword overlap scoring is enough to return a plausible, stable top-k
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+            documents = list(self.documents.values())
+
+        time.sleep(self.latency)
+        if fail:
+            raise _unavailable()
+
+        terms = set(re.findall(r"\w+", (search_text or "").lower()))
+        scored = []
+        for doc in documents:
+            text = f"{doc.get('title', '')} {doc.get('content', '')}".lower()
+            scored.append((len(terms.intersection(re.findall(r"\w+", text))), doc))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+
+        return [
+            {
+                **{key: doc[key] for key in (select or doc) if key in doc},
+                "@search.score": float(score),
+            }
+            for score, doc in scored[:top]
+        ]
+
+_FILING_WORDS = (
+    "revenue operating income net sales segment fiscal year compared increase decrease "
+    "primarily driven cloud services advertising devices customers growth margin costs "
+    "expenses research development capital expenditures cash flows liquidity risk factors"
+).split()
+
+class FakeDocumentAnalyzer:
+    # Stands in for the layout model: returns deterministic markdown for the requested
+    # page range after a fixed latency plus a per-page delay, so the ingestion
+    # pipeline can be run and timed without a Document Intelligence resource.
+
+    model_id = "fake-layout"
+
+    def __init__(
+        self,
+        latency: float = 1.0,
+        per_page_latency: float = 0.05,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.per_page_latency = per_page_latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self.pages = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _page(self, document: str, page: int) -> str:
+        rng = random.Random(f"{document}-{page}")
+        sentences = [
+            " ".join(rng.choice(_FILING_WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(rng.randint(6, 12))
+        ]
+        table = "\n".join(
+            [f"| Item | {page - 1} | {page} |", "| --- | --- | --- |"]
+            + [f"| {rng.choice(_FILING_WORDS)} | {rng.randint(100, 9999)} | {rng.randint(100, 9999)} |" for _ in range(3)]
+        )
+        return "\n\n".join([
+            f"## Item {page}. {rng.choice(_FILING_WORDS).capitalize()}",
+            " ".join(sentences[:len(sentences) // 2]),
+            table,
+            " ".join(sentences[len(sentences) // 2:]),
+            "<!-- PageBreak -->",
+        ])
+
+    def analyze(self, data: bytes, pages: str) -> str:
+        first, last = (int(page) for page in pages.split("-"))
+        document = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+            else:
+                self.pages += last - first + 1
+
+        time.sleep(self.latency + self.per_page_latency * (last - first + 1))
+        if fail:
+            raise _unavailable()
+
+        return "\n\n".join(self._page(document, page) for page in range(first, last + 1))
@@ -0,0 +1,173 @@
+import re
+from dataclasses import dataclass, asdict
+from config import (
+    GROUNDING_TOKEN_BUDGET,
+    GROUNDING_DOCUMENT_TOKENS,
+    GROUNDING_MIN_SCORE,
+    GROUNDING_MIN_RELATIVE_SCORE,
+    GROUNDING_DEDUPE_SIMILARITY,
+    get_logger,
+)
+from chunking import get_token_counter
+from retrieval import tokenize
+from telemetry import stage
+
+logger = get_logger(__name__)
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+@dataclass
+class GroundingReport:
+    documents_in: int
+    documents_out: int
+    duplicates: int
+    below_threshold: int
+    trimmed: int
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "tokens_saved": self.tokens_saved}
+
+def document_tokens(document: dict) -> int:
+    count = get_token_counter()
+    return count(document["title"]) + count(document["content"])
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = tokenize(text)
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def trim_passages(content: str, query_terms: set[str], max_tokens: int) -> str:
+    # keeps the sentences that share the most terms with the search query, in their
+    # original order, until the document budget is spent
+    count = get_token_counter()
+    if count(content) <= max_tokens:
+        return content
+
+    sentences = [sentence for sentence in _SENTENCE.split(content) if sentence]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (len(query_terms.intersection(tokenize(sentences[i]))), -i),
+        reverse=True,
+    )
+
+    keep = []
+    used = 0
+    for i in ranked:
+        tokens = count(sentences[i])
+        if used + tokens > max_tokens:
+            if keep:
+                continue
+            # the best sentence alone is over budget (a table row, a spec dump without
+            # punctuation), so keep as many of its words as fit instead
+            return _truncate_words(sentences[i], max_tokens)
+        keep.append(i)
+        used += tokens
+
+    return " ".join(sentences[i] for i in sorted(keep))
+
+def _truncate_words(text: str, max_tokens: int) -> str:
+    # the longest word prefix within max_tokens; a binary search, as token counts do
+    # not add up word by word
+    count = get_token_counter()
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+class GroundingCompressor:
+    # Runs between retrieval and prompt rendering: drops near-duplicate and weak hits,
+    # cuts each remaining document down to its most query-relevant sentences and packs
+    # them, best first, into a fixed token budget.
+
+    def __init__(
+        self,
+        max_tokens: int = GROUNDING_TOKEN_BUDGET,
+        max_document_tokens: int = GROUNDING_DOCUMENT_TOKENS,
+        min_score: float = GROUNDING_MIN_SCORE,
+        min_relative_score: float = GROUNDING_MIN_RELATIVE_SCORE,
+        dedupe_similarity: float = GROUNDING_DEDUPE_SIMILARITY,
+    ):
+        self.max_tokens = max_tokens
+        self.max_document_tokens = max_document_tokens
+        self.min_score = min_score
+        self.min_relative_score = min_relative_score
+        self.dedupe_similarity = dedupe_similarity
+
+    def compress(self, documents: list[dict], query: str, overrides: dict = None) -> tuple[list[dict], GroundingReport]:
+        overrides = overrides or {}
+        max_tokens = overrides.get("grounding_tokens", self.max_tokens)
+        min_score = overrides.get("min_score", self.min_score)
+
+        ranked = sorted(documents, key=lambda document: document.get("score") or 0.0, reverse=True)
+        top_score = (ranked[0].get("score") or 0.0) if ranked else 0.0
+        threshold = max(min_score, self.min_relative_score * top_score)
+
+        # the best hit is always kept so a low-scoring result set still grounds the answer
+        relevant = [document for i, document in enumerate(ranked) if i == 0 or (document.get("score") or 0.0) >= threshold]
+        below_threshold = len(ranked) - len(relevant)
+
+        unique = []
+        seen = []
+        for document in relevant:
+            shingles = _shingles(f"{document['title']} {document['content']}")
+            if any(_similarity(shingles, other) >= self.dedupe_similarity for other in seen):
+                continue
+            unique.append(document)
+            seen.append(shingles)
+        duplicates = len(relevant) - len(unique)
+
+        query_terms = set(tokenize(query))
+        count = get_token_counter()
+        packed = []
+        used = 0
+        trimmed = 0
+        for document in unique:
+            remaining = max_tokens - used - count(document["title"])
+            content = trim_passages(document["content"], query_terms, min(self.max_document_tokens, remaining))
+            tokens = document_tokens({**document, "content": content})
+            if packed and used + tokens > max_tokens:
+                continue
+            if content != document["content"]:
+                trimmed += 1
+            packed.append({**document, "content": content})
+            used += tokens
+
+        report = GroundingReport(
+            documents_in=len(documents),
+            documents_out=len(packed),
+            duplicates=duplicates,
+            below_threshold=below_threshold,
+            trimmed=trimmed,
+            tokens_before=sum(document_tokens(document) for document in documents),
+            tokens_after=used,
+        )
+
+        return packed, report
+
+grounding_compressor = GroundingCompressor()
+
+def compress_grounding(documents: list[dict], query: str, context: dict) -> list[dict]:
+    with stage("compress", context.setdefault("timings", {})) as compress_stage:
+        documents, report = grounding_compressor.compress(documents, query, context.get("overrides"))
+        compress_stage.documents(report.documents_out)
+        compress_stage.span.set_attributes({f"grounding.{name}": value for name, value in report.as_dict().items()})
+
+    context["grounding_compression"] = report.as_dict()
+    logger.debug(f"Grounding compression: {report.as_dict()}")
+
+    return documents
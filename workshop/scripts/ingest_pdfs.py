@@ -0,0 +1,380 @@
+import os
+import re
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.core.exceptions import HttpResponseError
+import config
+from config import (
+    ASSET_PATH,
+    DATASETS_PATH,
+    ANALYSIS_CACHE_PATH,
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    RETRYABLE_STATUS_CODES,
+    get_logger,
+    get_search_client,
+    get_document_intelligence_client,
+)
+from chunking import MarkdownChunker
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from create_search_index import document_hashes, embed_documents
+from manifest import IndexManifest
+from pipeline import run_pipeline, PipelineStats
+from uploader import DocumentUploader
+
+logger = get_logger(__name__)
+
+DEFAULT_PAGES_PER_RANGE = 20
+DEFAULT_ANALYSIS_CONCURRENCY = 4
+DEFAULT_ANALYSIS_RETRIES = 4
+DEFAULT_INDEX = "filings"
+
+_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_OBJECT_STREAM = re.compile(rb"/Type\s*/ObjStm")
+_INVALID_KEY = re.compile(r"[^A-Za-z0-9_\-=]")
+_CHUNK_ID = re.compile(r"^(.*)-p(?:\d+-\d+|all)-\d+$")
+
+def count_pages(data: bytes) -> int:
+    # Counts page objects without a PDF library. Page dictionaries are either plain
+    # text in the file or packed into compressed object streams (PDF 1.5+), so the
+    # object streams are inflated and scanned as well.
+    pages = len(_PAGE.findall(data))
+    for match in _OBJECT_STREAM.finditer(data):
+        start = data.find(b"stream", match.end())
+        if start < 0 or data.find(b"endobj", match.end(), start) >= 0:
+            continue
+        start += len(b"stream")
+        start += 2 if data[start:start + 2] == b"\r\n" else 1
+        try:
+            pages += len(_PAGE.findall(zlib.decompressobj().decompress(data[start:])))
+        except zlib.error:
+            continue
+    return pages
+
+def page_ranges(page_count: int, pages_per_range: int = DEFAULT_PAGES_PER_RANGE) -> list[str]:
+    return [
+        f"{first}-{min(first + pages_per_range - 1, page_count)}"
+        for first in range(1, page_count + 1, pages_per_range)
+    ]
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class AnalysisCache:
+    # Markdown results of each analyzed page range, one file per (file hash, model,
+    # range), so re-running the ingestion only sends new or changed PDFs to the service.
+
+    def __init__(self, path: Path = ANALYSIS_CACHE_PATH):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, document_hash: str, model_id: str, pages: str) -> Path:
+        return self.path / f"{document_hash}-{_INVALID_KEY.sub('_', model_id)}-{pages}.md"
+
+    def get(self, document_hash: str, model_id: str, pages: str) -> str | None:
+        try:
+            return self._file(document_hash, model_id, pages).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, document_hash: str, model_id: str, pages: str, markdown: str):
+        file = self._file(document_hash, model_id, pages)
+        tmp_file = file.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_file.write_text(markdown, encoding="utf-8")
+        os.replace(tmp_file, file)
+
+class DocumentIntelligenceAnalyzer:
+    def __init__(self, client, model_id: str = "prebuilt-layout"):
+        self.client = client
+        self.model_id = model_id
+
+    def analyze(self, data: bytes, pages: str) -> str:
+        from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat
+
+        poller = self.client.begin_analyze_document(
+            self.model_id,
+            AnalyzeDocumentRequest(bytes_source=data),
+            pages=pages,
+            output_content_format=DocumentContentFormat.MARKDOWN,
+        )
+        return poller.result().content
+
+@dataclass
+class PdfSource:
+    path: Path
+    data: bytes
+    hash: str
+    ranges: list[str]
+    name: str
+
+@dataclass
+class RangeResult:
+    source: PdfSource
+    pages: str
+    markdown: str | None
+    cached: bool = False
+    seconds: float = 0.0
+
+@dataclass
+class AnalysisStats:
+    ranges: int = 0
+    cached: int = 0
+    failed: int = 0
+    retries: int = 0
+    busy_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return f"analyze: {self.ranges} page ranges, {self.cached} from cache, {self.failed} failed, {self.retries} retries, {self.busy_seconds:.2f}s busy"
+
+def source_name(path: Path, root: Path = DATASETS_PATH) -> str:
+    # chunk ids start with the file's path under root (its absolute path outside root),
+    # so same-named PDFs in different folders do not overwrite each other; the digest
+    # keeps apart paths that differ only in characters a document key cannot hold
+    path = Path(path).resolve()
+    try:
+        relative = path.relative_to(Path(root).resolve()).as_posix()
+    except ValueError:
+        relative = path.as_posix()
+    readable = _INVALID_KEY.sub("_", relative.removesuffix(path.suffix).strip("/"))
+    return f"{readable}-{hashlib.sha1(relative.encode()).hexdigest()[:8]}"
+
+def load_source(path: Path, pages_per_range: int = DEFAULT_PAGES_PER_RANGE, root: Path = DATASETS_PATH) -> PdfSource:
+    data = Path(path).read_bytes()
+    page_count = count_pages(data)
+    if not page_count:
+        logger.warning(f"Could not count the pages of {path}, analyzing it as a single range")
+    ranges = page_ranges(page_count, pages_per_range) if page_count else [""]
+    return PdfSource(Path(path), data, file_hash(data), ranges, source_name(path, root))
+
+def _analyze_with_retry(analyzer, source: PdfSource, pages: str, stats: AnalysisStats, max_retries: int) -> str:
+    for attempt in range(max_retries + 1):
+        try:
+            return analyzer.analyze(source.data, pages or None)
+        except HttpResponseError as e:
+            if e.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                raise
+            stats.retries += 1
+            delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Analysis of {source.path.name} pages {pages} failed ({e.status_code}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+def analyze_sources(
+    sources: list[PdfSource],
+    analyzer,
+    cache: AnalysisCache,
+    stats: AnalysisStats,
+    concurrency: int = DEFAULT_ANALYSIS_CONCURRENCY,
+    max_retries: int = DEFAULT_ANALYSIS_RETRIES,
+) -> Iterator[RangeResult]:
+    # Every page range of every file is its own analyze operation; up to concurrency
+    # of them run at once and results are yielded as they finish, so chunking and
+    # embedding start while the later ranges are still being analyzed.
+
+    def analyze(source: PdfSource, pages: str) -> RangeResult:
+        start = time.perf_counter()
+        markdown = _analyze_with_retry(analyzer, source, pages, stats, max_retries)
+        cache.put(source.hash, analyzer.model_id, pages, markdown)
+        return RangeResult(source, pages, markdown, seconds=time.perf_counter() - start)
+
+    cached = []
+    pending = []
+    for source in sources:
+        for pages in source.ranges:
+            markdown = cache.get(source.hash, analyzer.model_id, pages)
+            if markdown is None:
+                pending.append((source, pages))
+            else:
+                cached.append(RangeResult(source, pages, markdown, cached=True))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analyze") as pool:
+        futures = {pool.submit(analyze, source, pages): (source, pages) for source, pages in pending}
+
+        # cached ranges go through while the new ones are being analyzed
+        for result in cached:
+            stats.ranges += 1
+            stats.cached += 1
+            yield result
+
+        for future in as_completed(futures):
+            source, pages = futures[future]
+            stats.ranges += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Analysis of {source.path.name} pages {pages} failed: {e}")
+                stats.failed += 1
+                yield RangeResult(source, pages, None)
+                continue
+            stats.busy_seconds += result.seconds
+            yield result
+
+def extract_markdown(
+    path: Path,
+    analyzer,
+    cache: AnalysisCache = None,
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+    concurrency: int = DEFAULT_ANALYSIS_CONCURRENCY,
+) -> str:
+    # the whole document's markdown in page order, for connectors that index a PDF as
+    # one parent document; ranges are still analyzed in parallel and cached
+    source = load_source(path, pages_per_range)
+    results = list(analyze_sources([source], analyzer, cache or AnalysisCache(), AnalysisStats(), concurrency))
+
+    failed = [result.pages for result in results if result.markdown is None]
+    if failed:
+        raise RuntimeError(f"Analysis of {Path(path).name} failed for pages {', '.join(failed)}")
+
+    order = {pages: i for i, pages in enumerate(source.ranges)}
+    return "\n\n".join(result.markdown for result in sorted(results, key=lambda result: order[result.pages]))
+
+def range_documents(result: RangeResult, chunker: MarkdownChunker) -> list[dict]:
+    # the analyzed page range is the parent document; chunk offsets point into its markdown
+    source, pages = result.source, result.pages or "all"
+    parent_id = f"{source.name}-p{pages}"
+    return [
+        {
+            "id": f"{parent_id}-{chunk.index}",
+            "title": f"{source.path.stem} {chunk.heading}" if chunk.heading else f"{source.path.stem} pages {pages}",
+            "content": chunk.text,
+            "parentId": parent_id,
+            "chunkIndex": chunk.index,
+            "chunkOffset": chunk.offset,
+            "chunkLength": chunk.length,
+        }
+        for chunk in chunker.chunks(result.markdown)
+    ]
+
+def _source_name(id: str) -> str | None:
+    match = _CHUNK_ID.match(id)
+    return match.group(1) if match else None
+
+def ingest_pdfs(
+    paths: list[Path],
+    analyzer,
+    manifest: IndexManifest,
+    index_name: str = DEFAULT_INDEX,
+    embedding_model: str = "text-embedding-ada-002",
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+    concurrency: int = DEFAULT_ANALYSIS_CONCURRENCY,
+    chunker: MarkdownChunker = None,
+    cache: AnalysisCache = None,
+    root: Path = DATASETS_PATH,
+    prune: bool = False,
+) -> PipelineStats:
+    cache = cache or AnalysisCache()
+    chunker = chunker or MarkdownChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    uploader = DocumentUploader(get_search_client(index_name))
+    analysis = AnalysisStats()
+
+    sources = [load_source(path, pages_per_range, root) for path in paths]
+    for source in sources:
+        logger.info(f"{source.path.name}: {len(source.ranges)} page ranges")
+
+    seen = set()
+    incomplete = set()
+    skipped = 0
+
+    def chunks():
+        nonlocal skipped
+        for result in analyze_sources(sources, analyzer, cache, analysis, concurrency):
+            if result.markdown is None:
+                # keep this file's existing chunks rather than deleting what could not be re-read
+                incomplete.add(result.source.name)
+                continue
+            docs = range_documents(result, chunker)
+            hashes = document_hashes(docs)
+            seen.update(hashes)
+            changed = set(manifest.changed(hashes, embedding_model))
+            skipped += len(docs) - len(changed)
+            yield [doc for doc in docs if doc["id"] in changed]
+
+    def upload(docs: list[dict]):
+        summary = uploader.upload(docs)
+        logger.info(f"Uploaded documents: {summary}")
+        return summary
+
+    stats = run_pipeline(
+        chunks(),
+        embed=lambda docs: embed_documents(docs, embedding_model),
+        upload=upload,
+        on_uploaded=lambda docs: manifest.update(document_hashes(docs), embedding_model),
+    )
+
+    # chunks of the ingested files that no longer exist, e.g. after a file changed
+    # or pages_per_range did. With prune, paths is the whole corpus and the chunks of
+    # files no longer in it go too; otherwise other files in the manifest are left alone.
+    # Files that could not be fully analyzed keep their chunks either way.
+    names = {source.name for source in sources} - incomplete
+    deleted = [
+        id for id in manifest.missing(seen)
+        if (_source_name(id) not in incomplete if prune else _source_name(id) in names)
+    ]
+    if deleted:
+        summary = uploader.delete(deleted)
+        logger.info(f"Deleted documents: {summary}")
+        manifest.remove(sorted(set(deleted) - set(summary.failed_keys)))
+
+    manifest.save()
+
+    logger.info(str(analysis))
+    stats.log()
+    logger.info(f"Ingested {len(sources)} PDFs: {stats.upload.items} chunks upserted, {len(deleted)} deleted, {skipped} unchanged")
+
+    return stats
+
+def install_fakes(index_name: str, cache_dir: Path):
+    # same approach as bench_rag: pin fakes in the memoized client factories and keep
+    # their fake vectors out of the real embedding cache
+    from fakes import FakeDocumentAnalyzer, FakeEmbeddingsClient, FakeSearchClient
+
+    config.get_embeddings_client.override(FakeEmbeddingsClient())
+    config.get_search_client.override(FakeSearchClient(), index_name)
+    get_embedding_cache.override(EmbeddingCache(tempfile.mkdtemp(dir=cache_dir)))
+
+    return FakeDocumentAnalyzer()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", type=Path, help="PDFs to ingest, defaults to every PDF in the datasets folder")
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--pages-per-range", type=int, default=DEFAULT_PAGES_PER_RANGE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_ANALYSIS_CONCURRENCY, help="analyze operations in flight at once")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS, help="tokens repeated from the end of the previous chunk")
+    parser.add_argument("--fake", action="store_true", help="use fake analysis, embeddings and search clients")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(DATASETS_PATH.rglob("*.pdf"))
+    manifest_path = ASSET_PATH / f"{args.index}.manifest.json"
+
+    if args.fake:
+        ANALYSIS_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+        analyzer = install_fakes(args.index, ANALYSIS_CACHE_PATH.parent)
+        manifest_path = Path(tempfile.mkdtemp(dir=ANALYSIS_CACHE_PATH.parent)) / manifest_path.name
+    else:
+        from create_search_index import create_index
+
+        create_index(args.index)
+        analyzer = DocumentIntelligenceAnalyzer(get_document_intelligence_client())
+
+    ingest_pdfs(
+        paths,
+        analyzer,
+        IndexManifest.load(manifest_path),
+        index_name=args.index,
+        pages_per_range=args.pages_per_range,
+        concurrency=args.concurrency,
+        chunker=MarkdownChunker(args.chunk_tokens, args.chunk_overlap),
+        # the default is every PDF under the datasets folder, so one that was removed
+        # from it is removed from the index too
+        prune=not args.paths,
+    )
@@ -0,0 +1,164 @@
+from dataclasses import dataclass, field
+import numpy as np
+
+# Document Intelligence polygons are four x, y points
+POLYGON_SIZE = 8
+
+def _polygons(items, size: int = POLYGON_SIZE) -> np.ndarray:
+    polygons = np.full((len(items), size), np.nan, dtype=np.float32)
+    for i, item in enumerate(items):
+        polygon = (getattr(item, "polygon", None) or [])[:size]
+        polygons[i, :len(polygon)] = polygon
+    return polygons
+
+def _on_page(item, page_number: int) -> bool:
+    return any(region.page_number == page_number for region in getattr(item, "bounding_regions", None) or ())
+
+def _group(owners: np.ndarray, count: int) -> tuple[np.ndarray, np.ndarray]:
+    # CSR layout of word indices per owner: order[ptr[i]:ptr[i + 1]] are owner i's
+    # words, still in offset order because the sort is stable
+    order = np.argsort(owners, kind="stable").astype(np.int32)
+    counts = np.bincount(owners[owners >= 0], minlength=count)
+    ptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(counts, out=ptr[1:])
+    return order[len(owners) - int(ptr[-1]):], ptr
+
+class SpanIndex:
+    # Disjoint [offset, offset + length) spans sorted by offset, each tagged with the
+    # index of the element (line, cell, paragraph) it belongs to. Looking up which
+    # element contains a word is a binary search on the span starts.
+
+    def __init__(self, spans: list[tuple[int, int, int]]):
+        spans = sorted(spans)
+        self.starts = np.array([offset for offset, _, _ in spans], dtype=np.int64)
+        self.ends = np.array([offset + length for offset, length, _ in spans], dtype=np.int64)
+        self.owners = np.array([owner for _, _, owner in spans], dtype=np.int32)
+
+    @classmethod
+    def of(cls, elements) -> "SpanIndex":
+        return cls([
+            (span.offset, span.length, i)
+            for i, element in enumerate(elements)
+            for span in element.spans or ()
+        ])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def owner_of(self, offsets: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        # index of the element whose span fully contains each [offset, end), or -1
+        if not len(self.starts):
+            return np.full(len(offsets), -1, dtype=np.int32)
+        positions = np.searchsorted(self.starts, offsets, side="right") - 1
+        clipped = np.maximum(positions, 0)
+        inside = (positions >= 0) & (ends <= self.ends[clipped])
+        return np.where(inside, self.owners[clipped], -1).astype(np.int32)
+
+@dataclass
+class PageLayout:
+    # One page of an analyze result as flat arrays, words sorted by span offset.
+    # word_line, word_cell and word_paragraph give the owning element of each word
+    # (-1 for none); line_words, cell_words and paragraph_words go the other way.
+    page_number: int
+    width: float
+    height: float
+    unit: str
+    words: list[str]
+    offsets: np.ndarray
+    lengths: np.ndarray
+    polygons: np.ndarray
+    confidences: np.ndarray
+    lines: list[str]
+    line_polygons: np.ndarray
+    word_line: np.ndarray
+    cells: list[tuple[int, int, int]] = field(default_factory=list)
+    word_cell: np.ndarray = None
+    paragraphs: list[int] = field(default_factory=list)
+    word_paragraph: np.ndarray = None
+
+    def __post_init__(self):
+        if self.word_cell is None:
+            self.word_cell = np.full(len(self.words), -1, dtype=np.int32)
+        if self.word_paragraph is None:
+            self.word_paragraph = np.full(len(self.words), -1, dtype=np.int32)
+        self._lines = _group(self.word_line, len(self.lines))
+        self._cells = _group(self.word_cell, len(self.cells))
+        self._paragraphs = _group(self.word_paragraph, len(self.paragraphs))
+
+    @staticmethod
+    def _members(groups: tuple[np.ndarray, np.ndarray], i: int) -> np.ndarray:
+        order, ptr = groups
+        return order[ptr[i]:ptr[i + 1]]
+
+    def line_words(self, line: int) -> np.ndarray:
+        return self._members(self._lines, line)
+
+    def cell_words(self, cell: int) -> np.ndarray:
+        return self._members(self._cells, cell)
+
+    def paragraph_words(self, paragraph: int) -> np.ndarray:
+        return self._members(self._paragraphs, paragraph)
+
+    def as_dict(self) -> dict:
+        return {
+            "page_number": self.page_number,
+            "width": self.width,
+            "height": self.height,
+            "unit": self.unit,
+            "words": self.words,
+            "offsets": self.offsets.tolist(),
+            "lengths": self.lengths.tolist(),
+            "polygons": np.round(self.polygons, 4).tolist(),
+            "confidences": np.round(self.confidences, 3).tolist(),
+            "lines": self.lines,
+            "line_polygons": np.round(self.line_polygons, 4).tolist(),
+            "word_line": self.word_line.tolist(),
+            "cells": [list(cell) for cell in self.cells],
+            "word_cell": self.word_cell.tolist(),
+            "paragraphs": self.paragraphs,
+            "word_paragraph": self.word_paragraph.tolist(),
+        }
+
+def index_page(page, tables=None, paragraphs=None) -> PageLayout:
+    # Sorts the page's words by offset once and resolves line, table cell and
+    # paragraph membership with SpanIndex lookups: O((words + spans) log spans)
+    # instead of testing every word against every span of every line.
+    words = sorted(page.words or (), key=lambda word: word.span.offset)
+    offsets = np.array([word.span.offset for word in words], dtype=np.int64)
+    lengths = np.array([word.span.length for word in words], dtype=np.int64)
+    ends = offsets + lengths
+    lines = page.lines or []
+
+    cell_elements = [
+        ((table_index, cell.row_index, cell.column_index), cell)
+        for table_index, table in enumerate(tables or ())
+        for cell in table.cells
+        if _on_page(cell, page.page_number)
+    ]
+    paragraph_elements = [
+        (paragraph_index, paragraph)
+        for paragraph_index, paragraph in enumerate(paragraphs or ())
+        if _on_page(paragraph, page.page_number)
+    ]
+
+    return PageLayout(
+        page_number=page.page_number,
+        width=page.width,
+        height=page.height,
+        unit=page.unit,
+        words=[word.content for word in words],
+        offsets=offsets,
+        lengths=lengths,
+        polygons=_polygons(words),
+        confidences=np.array([word.confidence for word in words], dtype=np.float32),
+        lines=[line.content for line in lines],
+        line_polygons=_polygons(lines),
+        word_line=SpanIndex.of(lines).owner_of(offsets, ends),
+        cells=[key for key, _ in cell_elements],
+        word_cell=SpanIndex.of([cell for _, cell in cell_elements]).owner_of(offsets, ends),
+        paragraphs=[key for key, _ in paragraph_elements],
+        word_paragraph=SpanIndex.of([paragraph for _, paragraph in paragraph_elements]).owner_of(offsets, ends),
+    )
+
+def index_layout(result) -> list[PageLayout]:
+    return [index_page(page, result.tables, result.paragraphs) for page in result.pages or ()]
@@ -0,0 +1,50 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+def content_hash(*fields: str) -> str:
+    digest = hashlib.sha256()
+    for field in fields:
+        digest.update(str(field).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class IndexManifest:
+    def __init__(self, path: Path, documents: dict[str, dict] = None):
+        self.path = Path(path)
+        self.documents = documents or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexManifest":
+        try:
+            with open(path, "r") as f:
+                return cls(path, json.load(f).get("documents", {}))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path)
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+
+    def changed(self, hashes: dict[str, str], model: str) -> list[str]:
+        return [
+            id for id, hash in hashes.items()
+            if self.documents.get(id) != {"hash": hash, "model": model}
+        ]
+
+    def missing(self, ids: set[str]) -> list[str]:
+        return [id for id in self.documents if id not in ids]
+
+    def diff(self, hashes: dict[str, str], model: str) -> tuple[list[str], list[str]]:
+        return self.changed(hashes, model), self.missing(hashes.keys())
+
+    def update(self, hashes: dict[str, str], model: str):
+        for id, hash in hashes.items():
+            self.documents[id] = {"hash": hash, "model": model}
+
+    def remove(self, ids: list[str]):
+        for id in ids:
+            self.documents.pop(id, None)
@@ -0,0 +1,169 @@
+import time
+import queue
+import random
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator
+import pandas as pd
+from config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_QUEUE_SIZE = 2
+DEFAULT_UPLOAD_RETRIES = 3
+
+_DONE = object()
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+    failed_items: int = 0
+    retries: int = 0
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.items} items in {self.batches} batches, {self.busy_seconds:.2f}s busy, {self.rate:.1f} items/s, {self.retries} retries, {self.failed_items} failed"
+
+@dataclass
+class PipelineStats:
+    read: StageStats = field(default_factory=lambda: StageStats("read"))
+    embed: StageStats = field(default_factory=lambda: StageStats("embed"))
+    upload: StageStats = field(default_factory=lambda: StageStats("upload"))
+    elapsed_seconds: float = 0.0
+
+    def log(self):
+        for stage in (self.read, self.embed, self.upload):
+            logger.info(str(stage))
+        logger.info(f"pipeline: {self.upload.items} documents in {self.elapsed_seconds:.2f}s")
+
+def read_csv_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    with pd.read_csv(path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield chunk.to_dict("records")
+
+class _Stopped(Exception):
+    pass
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise _Stopped()
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    raise _Stopped()
+
+def _upload_with_retry(upload: Callable[[list[dict]], object], docs: list[dict], stats: StageStats, max_retries: int) -> tuple[bool, object]:
+    for attempt in range(max_retries + 1):
+        try:
+            return True, upload(docs)
+        except Exception as e:
+            if attempt == max_retries:
+                logger.error(f"Upload of {len(docs)} documents failed after {attempt + 1} attempts: {e}")
+                return False, None
+            stats.retries += 1
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Upload of {len(docs)} documents failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+def run_pipeline(
+    chunks: Iterable[list[dict]],
+    embed: Callable[[list[dict]], list[dict]],
+    upload: Callable[[list[dict]], object],
+    on_uploaded: Callable[[list[dict]], None] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    max_upload_retries: int = DEFAULT_UPLOAD_RETRIES,
+) -> PipelineStats:
+    # read -> embed -> upload run on their own threads joined by bounded queues, so a
+    # slow stage blocks the ones before it and at most ~2 * (queue_size + 1) chunks
+    # are alive at once regardless of input size.
+    stats = PipelineStats()
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_upload = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(iterator, _DONE)
+            stats.read.busy_seconds += time.perf_counter() - start
+            if chunk is _DONE:
+                break
+            if not chunk:
+                continue
+            stats.read.items += len(chunk)
+            stats.read.batches += 1
+            _put(to_embed, chunk, stop)
+        _put(to_embed, _DONE, stop)
+
+    def embedder():
+        while (chunk := _get(to_embed, stop)) is not _DONE:
+            start = time.perf_counter()
+            docs = embed(chunk)
+            stats.embed.busy_seconds += time.perf_counter() - start
+            stats.embed.items += len(docs)
+            stats.embed.batches += 1
+            if docs:
+                _put(to_upload, docs, stop)
+        _put(to_upload, _DONE, stop)
+
+    def uploader():
+        while (docs := _get(to_upload, stop)) is not _DONE:
+            start = time.perf_counter()
+            uploaded, result = _upload_with_retry(upload, docs, stats.upload, max_upload_retries)
+            stats.upload.busy_seconds += time.perf_counter() - start
+            stats.upload.batches += 1
+            if not uploaded:
+                stats.upload.failed_items += len(docs)
+                continue
+            # uploaders that report per-document results (see uploader.UploadSummary)
+            # only hand the documents that actually landed to on_uploaded
+            failed_keys = set(getattr(result, "failed_keys", None) or ())
+            if failed_keys:
+                docs = [doc for doc in docs if doc["id"] not in failed_keys]
+                stats.upload.failed_items += len(failed_keys)
+            stats.upload.items += len(docs)
+            if on_uploaded:
+                on_uploaded(docs)
+
+    def run_stage(target):
+        try:
+            target()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_stage, args=(target,), name=f"pipeline-{target.__name__}", daemon=True)
+        for target in (reader, embedder, uploader)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.elapsed_seconds = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    return stats
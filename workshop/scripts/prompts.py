@@ -0,0 +1,51 @@
+import threading
+from pathlib import Path
+from azure.ai.inference.prompts import PromptTemplate
+from config import ASSET_PATH, get_logger
+from embedding import estimate_tokens
+from telemetry import stage
+
+logger = get_logger(__name__)
+
+class PromptRegistry:
+    # Loads each prompty once and keeps the parsed PromptTemplate in memory, reloading
+    # only when the file's mtime changes, so each request skips reading and parsing it.
+
+    def __init__(self, root: Path = ASSET_PATH):
+        self.root = Path(root)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> PromptTemplate:
+        path = self.root / name
+        mtime = path.stat().st_mtime_ns
+
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] != mtime:
+                logger.debug(f"Loading prompt {path}")
+                entry = (mtime, PromptTemplate.from_prompty(str(path)))
+                self._entries[name] = entry
+
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+prompts = PromptRegistry()
+
+def get_prompt(name: str) -> PromptTemplate:
+    return prompts.get(name)
+
+def render_grounded_prompt(documents: list[dict], timings: dict = None) -> tuple[list[dict], PromptTemplate]:
+    with stage("render", timings) as render_stage:
+        grounded_chat_prompt = get_prompt("grounded_chat.prompty")
+        system_message = grounded_chat_prompt.create_messages(documents=documents)
+        render_stage.documents(len(documents))
+        render_stage.tokens(input_tokens=sum(estimate_tokens(str(message["content"])) for message in system_message))
+    return system_message, grounded_chat_prompt
@@ -0,0 +1,125 @@
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from prompts import get_prompt
+from config import get_logger
+from telemetry import record_usage
+
+logger = get_logger(__name__)
+
+DEFAULT_HISTORY_TURNS = 6
+DEFAULT_MAX_ENTRIES = 4096
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+def parse_search_query(content: str) -> str:
+    text = _FENCE.sub("", content.strip())
+    for candidate in (text, *_OBJECT.findall(text)):
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict) and parsed.get("search_query"):
+            return str(parsed["search_query"]).strip()
+    logger.warning(f"Intent completion had no search_query field, searching on raw text: {content!r}")
+    return text
+
+class QueryRewriter:
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        prompt_name: str = "intent_mapping.prompty",
+        history_turns: int = DEFAULT_HISTORY_TURNS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.model = model
+        self.prompt_name = prompt_name
+        self.history_turns = history_turns
+        self.max_entries = max_entries
+        self.rewrites = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tail(self, messages: list[dict]) -> list[dict]:
+        return messages[-self.history_turns:]
+
+    def _key(self, messages: list[dict]) -> str:
+        tail = [(message["role"], " ".join(message["content"].split())) for message in self._tail(messages)]
+        return hashlib.sha256(json.dumps(tail).encode("utf-8")).hexdigest()
+
+    def _lookup(self, messages: list[dict]) -> tuple[str | None, str | None]:
+        # a lone message has no history to resolve, so it is already the search query;
+        # anything before it, including a summary of trimmed turns, goes to the rewrite
+        if len(messages) <= 1:
+            with self._lock:
+                self.skipped += 1
+            return messages[-1]["content"], None
+
+        key = self._key(messages)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key], key
+
+        return None, key
+
+    def _store(self, key: str, content: str) -> str:
+        search_query = parse_search_query(content)
+        with self._lock:
+            self.rewrites += 1
+            self._cache[key] = search_query
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return search_query
+
+    def _request(self, messages: list[dict]) -> dict:
+        prompt = get_prompt(self.prompt_name)
+        return {
+            "model": self.model,
+            "messages": prompt.create_messages(conversation=self._tail(messages)),
+            **prompt.parameters,
+        }
+
+    def rewrite(self, completions_client, messages: list[dict]) -> str:
+        search_query, key = self._lookup(messages)
+        if search_query is not None:
+            return search_query
+
+        completion = completions_client.complete(**self._request(messages))
+        record_usage(completion.usage)
+
+        return self._store(key, completion.choices[0].message.content)
+
+    async def rewrite_async(self, completions_client, messages: list[dict]) -> str:
+        search_query, key = self._lookup(messages)
+        if search_query is not None:
+            return search_query
+
+        completion = await completions_client.complete(**self._request(messages))
+        record_usage(completion.usage)
+
+        return self._store(key, completion.choices[0].message.content)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.rewrites + self.skipped + self.cache_hits
+            return {
+                "requests": requests,
+                "rewrites": self.rewrites,
+                "skipped": self.skipped,
+                "cache_hits": self.cache_hits,
+                "cache_size": len(self._cache),
+            }
+
+query_rewriter = QueryRewriter()
@@ -1,74 +1,73 @@
-import os
-from pathlib import Path
 from opentelemetry import trace
-from azure.ai.projects import AIProjectClient
-from azure.ai.projects.models import ConnectionType
-from azure.identity import DefaultAzureCredential
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.ai.inference.prompts import PromptTemplate
-from azure.search.documents.models import VectorizedQuery
-from config import ASSET_PATH, get_logger
+from query_rewrite import query_rewriter
+from config import (
+    LOCAL_INDEX_PATH,
+    RETRIEVAL_BACKEND,
+    get_logger,
+    get_chat_completions_client,
+    get_embeddings_client,
+    get_search_client,
+    memoize,
+)
+from retrieval import AzureSearchBackend, LocalSearchBackend, RetrievalBackend, passage
+from embedding import embed_text
+from embedding_cache import get_embedding_cache
+from telemetry import stage
 
 logger = get_logger(__name__)
 tracer = trace.get_tracer(__name__)
 
-project = AIProjectClient.from_connection_string(
-    conn_str="eastus.api.azureml.ms;c33784d2-77cc-4280-b6b4-7846df73349f;gaimon;gaimon1",
-    credential=DefaultAzureCredential()
-)
+@memoize
+def get_retrieval_backend() -> RetrievalBackend:
+    if RETRIEVAL_BACKEND == "local":
+        return LocalSearchBackend.load(LOCAL_INDEX_PATH)
+    return AzureSearchBackend(get_search_client("products"))
 
-search_connection = project.connections.get_default(
-    connection_type=ConnectionType.AZURE_AI_SEARCH,
-    include_credentials=True
-)
+def get_search_query(messages: list) -> str:
+    search_query = query_rewriter.rewrite(get_chat_completions_client(), messages)
 
-search_client = SearchClient(
-    index_name="products",
-    endpoint=search_connection.endpoint_url,
-    credential=AzureKeyCredential(search_connection.key)
-)
+    logger.debug(f"Search query: {search_query} ({query_rewriter.stats()})")
 
-completions_client = project.inference.get_chat_completions_client()
-embeddings_client = project.inference.get_embeddings_client()
+    return search_query
+
+def embed_search_query(search_query: str) -> list[float]:
+    return embed_text(
+        get_embeddings_client(),
+        search_query,
+        model="text-embedding-ada-002",
+        cache=get_embedding_cache(),
+    )
 
 @tracer.start_as_current_span(name="get_product_documents")
-def get_product_documents(messages: list, context: dict = {}) -> dict:
+def get_product_documents(
+    messages: list,
+    context: dict = None,
+    search_query: str = None,
+    search_query_embedding: list[float] = None,
+) -> list[dict]:
+    if context is None:
+        context = {}
+
     overrides = context.get("overrides", {})
     top = overrides.get("top", 5)
 
-    query_intent_prompt = PromptTemplate.from_prompty(Path(ASSET_PATH)/"intent_mapping.prompty")
+    if search_query is None:
+        search_query = get_search_query(messages)
 
-    query_intent_completion = completions_client.complete(
-        model="gpt-4o-mini",
-        messages=query_intent_prompt.create_messages(conversation=messages),
-        **query_intent_prompt.parameters,
-    )
-
-    search_query = query_intent_completion.choices[0].message.content
+    if search_query_embedding is None:
+        search_query_embedding = embed_search_query(search_query)
 
-    logger.debug(f"Search query: {search_query}")
-
-    search_query_embedding = embeddings_client.embed(
-        model="text-embedding-ada-002",
-        input = search_query
-    )
-    search_query_vectorized = VectorizedQuery(
-        vector=search_query_embedding.data[0].embedding,
-        k_nearest_neighbors=top,
-        fields="contentVector",
-    )
-    search_results = search_client.search(
-        search_text=search_query,
-        vector_queries=[search_query_vectorized],
-        select=["id", "title", "content"]
-    )
+    with stage("search", context.setdefault("timings", {}), top=top) as search_stage:
+        search_results = get_retrieval_backend().search(search_query, search_query_embedding, top)
+        search_stage.documents(len(search_results))
 
     grounding = [
         {
             "id": result["id"],
             "title": result["title"],
-            "content": result["content"]
+            "content": result["content"],
+            **passage(result),
+            "score": result["score"],
         }
         for result in search_results
     ]
@@ -88,6 +87,8 @@ def get_product_documents(messages: list, context: dict = {}) -> dict:
 
     logger.info(f"Grounding: {grounding}")
 
+    return grounding
+
 if __name__ == "__main__":
     messages = [
         {"role": "user", "content": "nature lover"},
@@ -0,0 +1,226 @@
+import asyncio
+import weakref
+from contextlib import AsyncExitStack
+from opentelemetry import trace
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.projects.models import ConnectionType
+from azure.identity.aio import DefaultAzureCredential
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient
+import config
+from query_rewrite import query_rewriter
+from query_search_index import get_retrieval_backend
+from config import AIPROJECT_CONNECTION_STRING, RETRIEVAL_BACKEND, get_logger
+from embedding_cache import get_embedding_cache
+from retrieval import AsyncAzureSearchBackend, AsyncRetrievalBackend, ThreadedBackend, reciprocal_rank_fusion
+from telemetry import stage, record_usage
+
+logger = get_logger(__name__)
+tracer = trace.get_tracer(__name__)
+
+class ThreadedClient:
+    # async facade over a sync client pinned with .override (the fakes); each call runs
+    # in a worker thread. The client is shared with the sync path, so close() leaves it open.
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name: str):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+    async def close(self):
+        pass
+
+class AsyncClients:
+    # The aio counterparts of the config factories. aio clients are bound to the event
+    # loop that opened them, so there is one set per loop (see get_clients). A factory
+    # pinned with .override, and the local retrieval backend, are used through worker
+    # threads instead, so the async path runs against the same clients as the sync one.
+
+    def __init__(self, stack: AsyncExitStack, completions_client, embeddings_client, retrieval_backend: AsyncRetrievalBackend):
+        self.stack = stack
+        self.completions_client = completions_client
+        self.embeddings_client = embeddings_client
+        self.retrieval_backend = retrieval_backend
+
+    @classmethod
+    async def create(cls, conn_str: str = AIPROJECT_CONNECTION_STRING) -> "AsyncClients":
+        completions_pinned = config.get_chat_completions_client.is_overridden()
+        embeddings_pinned = config.get_embeddings_client.is_overridden()
+        backend_pinned = (
+            RETRIEVAL_BACKEND == "local"
+            or get_retrieval_backend.is_overridden()
+            or config.get_search_client.is_overridden("products")
+        )
+
+        stack = AsyncExitStack()
+        try:
+            if not (completions_pinned and embeddings_pinned and backend_pinned):
+                credential = await stack.enter_async_context(DefaultAzureCredential())
+                project = await stack.enter_async_context(AIProjectClient.from_connection_string(conn_str=conn_str, credential=credential))
+
+            if completions_pinned:
+                completions_client = ThreadedClient(config.get_chat_completions_client())
+            else:
+                completions_client = await stack.enter_async_context(await project.inference.get_chat_completions_client())
+
+            if embeddings_pinned:
+                embeddings_client = ThreadedClient(config.get_embeddings_client())
+            else:
+                embeddings_client = await stack.enter_async_context(await project.inference.get_embeddings_client())
+
+            if backend_pinned:
+                retrieval_backend = ThreadedBackend(get_retrieval_backend())
+            else:
+                search_connection = await project.connections.get_default(
+                    connection_type=ConnectionType.AZURE_AI_SEARCH,
+                    include_credentials=True
+                )
+                search_client = await stack.enter_async_context(SearchClient(
+                    index_name="products",
+                    endpoint=search_connection.endpoint_url,
+                    credential=AzureKeyCredential(search_connection.key)
+                ))
+                retrieval_backend = AsyncAzureSearchBackend(search_client)
+        except BaseException:
+            await stack.aclose()
+            raise
+
+        return cls(stack, completions_client, embeddings_client, retrieval_backend)
+
+    async def close(self):
+        await self.stack.aclose()
+
+# keyed on the event loop, so a new loop (another asyncio.run, a Streamlit rerun) opens
+# its own clients and lock instead of using ones bound to a closed loop
+_clients = weakref.WeakKeyDictionary()
+_clients_locks = weakref.WeakKeyDictionary()
+
+def _clients_lock() -> asyncio.Lock:
+    loop = asyncio.get_running_loop()
+    lock = _clients_locks.get(loop)
+    if lock is None:
+        lock = _clients_locks[loop] = asyncio.Lock()
+    return lock
+
+async def get_clients() -> AsyncClients:
+    loop = asyncio.get_running_loop()
+    async with _clients_lock():
+        if loop not in _clients:
+            _clients[loop] = await AsyncClients.create()
+        return _clients[loop]
+
+async def close_clients():
+    loop = asyncio.get_running_loop()
+    async with _clients_lock():
+        clients = _clients.pop(loop, None)
+        if clients is not None:
+            await clients.close()
+
+async def _embed(embeddings_client, text: str, model: str) -> list[float]:
+    cached = await asyncio.to_thread(get_embedding_cache().get, model, text)
+    if cached is not None:
+        return cached
+
+    response = await embeddings_client.embed(model=model, input=text)
+    record_usage(response.usage)
+    vector = response.data[0].embedding
+    await asyncio.to_thread(get_embedding_cache().put, model, text, vector)
+
+    return vector
+
+async def _rewrite(completions_client, messages: list, timings: dict) -> str:
+    # runs as its own task, so the stage has to be opened inside it
+    with stage("rewrite", timings):
+        return await query_rewriter.rewrite_async(completions_client, messages)
+
+async def get_search_query_async(messages: list, timings: dict) -> str:
+    clients = await get_clients()
+    search_query = await _rewrite(clients.completions_client, messages, timings)
+
+    logger.debug(f"Search query: {search_query} ({query_rewriter.stats()})")
+
+    return search_query
+
+async def embed_search_query_async(search_query: str) -> list[float]:
+    clients = await get_clients()
+    return await _embed(clients.embeddings_client, search_query, model="text-embedding-ada-002")
+
+@tracer.start_as_current_span(name="get_product_documents_async")
+async def get_product_documents_async(
+    messages: list,
+    context: dict = None,
+    search_query: str = None,
+    search_query_embedding: list[float] = None,
+) -> list[dict]:
+    if context is None:
+        context = {}
+
+    overrides = context.get("overrides", {})
+    top = overrides.get("top", 5)
+
+    timings = context.setdefault("timings", {})
+
+    clients = await get_clients()
+    backend = clients.retrieval_backend
+
+    rewrite = None
+    raw_search = None
+    if search_query is None:
+        rewrite = asyncio.create_task(get_search_query_async(messages, timings))
+
+        # let the rewrite task run up to its first await: single-turn conversations and
+        # cache hits finish without one, and then the raw-turn search would be redundant
+        await asyncio.sleep(0)
+
+        # otherwise the keyword search on the raw user turn does not depend on the intent
+        # rewrite, so it runs while the rewrite completion is still in flight
+        if not rewrite.done():
+            raw_search = asyncio.create_task(backend.search(messages[-1]["content"], None, top))
+
+    try:
+        if rewrite is not None:
+            search_query = await rewrite
+
+        if search_query_embedding is None:
+            with stage("embed", timings):
+                search_query_embedding = await embed_search_query_async(search_query)
+
+        with stage("search", timings, top=top) as search_stage:
+            hybrid_results = await backend.search(search_query, search_query_embedding, top)
+            search_stage.documents(len(hybrid_results))
+    except BaseException:
+        if rewrite is not None:
+            rewrite.cancel()
+        if raw_search is not None:
+            raw_search.cancel()
+        raise
+
+    if raw_search is not None:
+        grounding = reciprocal_rank_fusion([hybrid_results, await raw_search], top)
+    else:
+        grounding = hybrid_results
+
+    context.setdefault("thoughts", []).append({
+        "title": "Generated Search Query",
+        "description": search_query,
+    })
+    context.setdefault("grounding", []).append(grounding)
+
+    logger.info(f"Grounding: {grounding}")
+
+    return grounding
+
+if __name__ == "__main__":
+    async def main():
+        try:
+            await get_product_documents_async([{"role": "user", "content": "nature lover"}])
+        finally:
+            await close_clients()
+
+    asyncio.run(main())
@@ -0,0 +1,261 @@
+import re
+import json
+import asyncio
+import math
+import argparse
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Protocol
+import numpy as np
+import pandas as pd
+from azure.search.documents.models import VectorizedQuery
+from config import (
+    ASSET_PATH,
+    LOCAL_EXACT_MAX_VECTORS,
+    LOCAL_HNSW_EF_CONSTRUCTION,
+    LOCAL_HNSW_EF_SEARCH,
+    LOCAL_HNSW_M,
+    get_logger,
+)
+from embedding import embed_texts
+from vector_index import ExactIndex, HnswIndex, normalize_rows
+
+logger = get_logger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# where a chunk sits in its parent document (see chunking.py); empty for documents
+# indexed whole
+CHUNK_FIELDS = ["parentId", "chunkIndex", "chunkOffset", "chunkLength"]
+
+def passage(result: dict) -> dict:
+    return {field: result[field] for field in CHUNK_FIELDS if result.get(field) is not None}
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], top: int, k: int = 60) -> list[dict]:
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            scores[result["id"]] = scores.get(result["id"], 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(result["id"], result)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [{**documents[id], "score": scores[id]} for id in ranked[:top]]
+
+class RetrievalBackend(Protocol):
+    def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        ...
+
+class AsyncRetrievalBackend(Protocol):
+    async def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        ...
+
+class AzureSearchBackend:
+    def __init__(self, search_client, vector_field: str = "contentVector"):
+        self.search_client = search_client
+        self.vector_field = vector_field
+
+    def _request(self, search_text: str, vector: list[float] | None, top: int) -> dict:
+        vector_queries = []
+        if vector is not None:
+            vector_queries.append(VectorizedQuery(vector=vector, k_nearest_neighbors=top, fields=self.vector_field))
+
+        return {
+            "search_text": search_text,
+            "vector_queries": vector_queries,
+            "select": ["id", "title", "content", *CHUNK_FIELDS],
+            "top": top,
+        }
+
+    @staticmethod
+    def _result(result: dict) -> dict:
+        return {
+            "id": result["id"],
+            "title": result["title"],
+            "content": result["content"],
+            **passage(result),
+            "score": result["@search.score"],
+        }
+
+    def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        search_results = self.search_client.search(**self._request(search_text, vector, top))
+        return [self._result(result) for result in search_results]
+
+class AsyncAzureSearchBackend(AzureSearchBackend):
+    # the same queries on an azure.search.documents.aio SearchClient
+
+    async def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        search_results = await self.search_client.search(**self._request(search_text, vector, top))
+        return [self._result(result) async for result in search_results]
+
+class ThreadedBackend:
+    # async facade over a sync backend (the local index, or one built on a client pinned
+    # with .override); each search runs in a worker thread
+
+    def __init__(self, backend: RetrievalBackend):
+        self.backend = backend
+
+    async def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        return await asyncio.to_thread(self.backend.search, search_text, vector, top)
+
+class Bm25Index:
+    def __init__(self, texts: list[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for doc, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths[doc] = len(terms)
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((doc, frequency))
+
+        self.average_length = float(self.lengths.mean()) if len(texts) else 0.0
+        self.idf = {
+            term: math.log(1 + (len(texts) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        if not self.average_length:
+            return scores
+        norms = self.k1 * (1 - self.b + self.b * self.lengths / self.average_length)
+        for term in set(tokenize(query)):
+            for doc, frequency in self.postings.get(term, ()):
+                scores[doc] += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norms[doc])
+        return scores
+
+class LocalSearchBackend:
+    # In-process hybrid retrieval for small catalogs: an exact (or, past
+    # LOCAL_EXACT_MAX_VECTORS, HNSW) index over a memory-mapped float32 matrix plus BM25
+    # over title and content, fused with RRF the way Azure AI Search fuses hybrid queries.
+    # The HNSW graph is saved next to the vectors so loading never rebuilds it.
+
+    def __init__(
+        self,
+        documents: list[dict],
+        vectors: np.ndarray,
+        exhaustive: bool = None,
+        m: int = LOCAL_HNSW_M,
+        ef_construction: int = LOCAL_HNSW_EF_CONSTRUCTION,
+        ef_search: int = LOCAL_HNSW_EF_SEARCH,
+        title_weight: float = 2.0,
+        vector_index: ExactIndex | HnswIndex = None,
+    ):
+        self.documents = documents
+        self.vectors = vectors
+        self.title_weight = title_weight
+        if exhaustive is None:
+            exhaustive = len(vectors) <= LOCAL_EXACT_MAX_VECTORS
+        if vector_index is not None:
+            self.vector_index = vector_index
+        elif exhaustive:
+            self.vector_index = ExactIndex(vectors)
+        else:
+            self.vector_index = HnswIndex(vectors, m=m, ef_construction=ef_construction, ef_search=ef_search)
+        self.title_index = Bm25Index([doc["title"] for doc in documents])
+        self.content_index = Bm25Index([doc["content"] for doc in documents])
+
+    @classmethod
+    def from_documents(cls, documents: list[dict], **options) -> "LocalSearchBackend":
+        vectors = normalize_rows([doc["contentVector"] for doc in documents])
+        documents = [{**{key: doc[key] for key in ("id", "title", "content")}, **passage(doc)} for doc in documents]
+        return cls(documents, vectors, **options)
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        matrix = np.memmap(path / "vectors.f32", dtype=np.float32, mode="w+", shape=self.vectors.shape)
+        matrix[:] = self.vectors
+        matrix.flush()
+
+        with open(path / "documents.jsonl", "w") as f:
+            for doc in self.documents:
+                f.write(json.dumps(doc) + "\n")
+
+        meta = {"count": self.vectors.shape[0], "dimensions": self.vectors.shape[1]}
+        if isinstance(self.vector_index, HnswIndex):
+            self.vector_index.save(path / "graph.npz")
+            meta["hnsw"] = {"m": self.vector_index.m, "ef_construction": self.vector_index.ef_construction}
+
+        with open(path / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: Path, ef_search: int = LOCAL_HNSW_EF_SEARCH, **options) -> "LocalSearchBackend":
+        path = Path(path)
+
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+
+        vectors = np.memmap(path / "vectors.f32", dtype=np.float32, mode="r", shape=(meta["count"], meta["dimensions"]))
+
+        with open(path / "documents.jsonl") as f:
+            documents = [json.loads(line) for line in f]
+
+        if "hnsw" in meta:
+            options["vector_index"] = HnswIndex.load(path / "graph.npz", vectors, ef_search=ef_search, **meta["hnsw"])
+        else:
+            options.setdefault("exhaustive", True)
+
+        return cls(documents, vectors, ef_search=ef_search, **options)
+
+    def _keyword_hits(self, search_text: str, top: int) -> list[tuple[int, float]]:
+        scores = self.title_weight * self.title_index.scores(search_text) + self.content_index.scores(search_text)
+        top = min(top, len(scores))
+        if not top:
+            return []
+        ids = np.argpartition(-scores, top - 1)[:top]
+        ids = ids[np.argsort(-scores[ids])]
+        return [(int(i), float(scores[i])) for i in ids if scores[i] > 0]
+
+    def search(self, search_text: str, vector: list[float] | None, top: int) -> list[dict]:
+        result_lists = []
+
+        if vector is not None:
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            result_lists.append([
+                {**self.documents[i], "score": score}
+                for i, score in self.vector_index.search(query, top)
+            ])
+
+        if search_text:
+            result_lists.append([
+                {**self.documents[i], "score": score}
+                for i, score in self._keyword_hits(search_text, top)
+            ])
+
+        if len(result_lists) == 1:
+            return result_lists[0][:top]
+
+        return reciprocal_rank_fusion(result_lists, top)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local search index from the products CSV")
+    parser.add_argument("--csv", default=str(ASSET_PATH / "products.csv"))
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use deterministic local embeddings instead of the service")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        from fakes import FakeEmbeddingsClient
+
+        products = pd.read_csv(args.csv).to_dict("records")
+        vectors = embed_texts(FakeEmbeddingsClient(latency=0), [p["description"] for p in products], model="fake")
+        docs = [
+            {"id": str(p["id"]), "title": p["name"], "content": p["description"], "contentVector": v}
+            for p, v in zip(products, vectors)
+        ]
+    else:
+        from create_search_index import load_docs
+
+        docs = load_docs(args.csv, embedding_model="text-embedding-ada-002")
+
+    LocalSearchBackend.from_documents(docs).save(args.out)
+    logger.info(f"Local index with {len(docs)} documents written to {args.out}")
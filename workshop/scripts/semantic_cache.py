@@ -0,0 +1,176 @@
+import time
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from config import MANIFEST_PATH, get_logger
+from manifest import IndexManifest
+
+logger = get_logger(__name__)
+meter = metrics.get_meter(__name__)
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    documents: list[dict]
+    document_hashes: dict[str, str | None]
+    created_at: float = field(default_factory=time.time)
+    last_hit: float = field(default_factory=time.time)
+
+class SemanticCache:
+    # Answers are keyed on the normalized query embedding; a lookup is one matrix-vector
+    # product over the cached embeddings. Each answer remembers the manifest hash of the
+    # documents it was grounded on and is dropped once any of them is re-indexed.
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        manifest_path: Path = MANIFEST_PATH,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.manifest_path = Path(manifest_path)
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._lookups = meter.create_counter("semantic_cache.lookups", description="Semantic cache lookups by outcome")
+        self._latency = meter.create_histogram("semantic_cache.lookup_duration", unit="ms", description="Semantic cache lookup latency")
+        meter.create_observable_gauge(
+            "semantic_cache.hit_rate",
+            callbacks=[lambda options: [Observation(self.hit_rate)]],
+            description="Fraction of semantic cache lookups that returned an answer",
+        )
+
+    def _document_hashes(self) -> dict[str, dict]:
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._manifest_mtime:
+            self._manifest = IndexManifest.load(self.manifest_path).documents
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _current_hash(self, documents: dict[str, dict], id: str) -> str | None:
+        entry = documents.get(id)
+        return entry["hash"] if entry else None
+
+    def _valid(self, entry: CachedAnswer, documents: dict[str, dict], now: float) -> bool:
+        if now - entry.created_at > self.ttl_seconds:
+            return False
+        return all(self._current_hash(documents, id) == hash for id, hash in entry.document_hashes.items())
+
+    def lookup(self, query_vector: list[float]) -> CachedAnswer | None:
+        start = time.perf_counter()
+        result = None
+        # read once per lookup and outside the lock, so concurrent lookups do not queue
+        # behind a manifest reload
+        documents = self._document_hashes() if self._vectors is not None else {}
+
+        with self._lock:
+            if self._vectors is not None:
+                vector = _normalize(query_vector)
+                similarities = self._vectors @ vector
+                now = time.time()
+                for slot in np.argsort(similarities)[::-1]:
+                    if similarities[slot] < self.threshold:
+                        break
+                    entry = self._entries[slot]
+                    if entry is None:
+                        continue
+                    if not self._valid(entry, documents, now):
+                        self._evict(slot)
+                        continue
+                    entry.last_hit = now
+                    result = entry
+                    break
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        self._lookups.add(1, {"hit": result is not None})
+        self._latency.record((time.perf_counter() - start) * 1000)
+
+        return result
+
+    def store(self, query: str, query_vector: list[float], answer: str, documents: list[dict]):
+        manifest = self._document_hashes()
+        with self._lock:
+            vector = _normalize(query_vector)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+
+            entry = CachedAnswer(
+                query=query,
+                answer=answer,
+                documents=documents,
+                document_hashes={doc["id"]: self._current_hash(manifest, doc["id"]) for doc in documents},
+            )
+
+            slot = self._free_slot()
+            self._vectors[slot] = vector
+            self._entries[slot] = entry
+
+    def _free_slot(self) -> int:
+        free = next((slot for slot, entry in enumerate(self._entries) if entry is None), None)
+        if free is not None:
+            return free
+        return min(range(self.max_entries), key=lambda slot: self._entries[slot].last_hit)
+
+    def _evict(self, slot: int):
+        self._entries[slot] = None
+        self._vectors[slot] = 0.0
+
+    def invalidate_documents(self, ids: list[str]):
+        ids = set(ids)
+        with self._lock:
+            for slot, entry in enumerate(self._entries):
+                if entry is not None and ids.intersection(entry.document_hashes):
+                    self._evict(slot)
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._vectors = None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "entries": sum(entry is not None for entry in self._entries),
+            }
+
+def use_semantic_cache(messages: list[dict], context: dict) -> bool:
+    # cached answers are keyed on the query alone, so only a conversation's first turn
+    # can share one; callers that measure the pipeline (eval, benchmarks) turn it off
+    return context.get("semantic_cache", True) and len(messages) == 1
+
+def _normalize(vector: list[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,28 @@
+import json
+import sqlite3
+from pathlib import Path
+from config import SOURCES_DB, SOURCES_JSON
+
+def load_sources(db_file: Path = SOURCES_DB, json_file: Path = SOURCES_JSON) -> list[dict]:
+    # reads the sources the frontend saved, from its SQLite store when present and its
+    # JSON file otherwise; read-only, the frontend stays the only writer
+    if Path(db_file).exists():
+        db = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            return [json.loads(data) for (data,) in db.execute("SELECT data FROM sources ORDER BY rowid")]
+        finally:
+            db.close()
+    try:
+        with open(json_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def find_source(name: str, type: str) -> dict:
+    matches = [source for source in load_sources() if source.get("name") == name and source.get("type") == type]
+    if not matches:
+        raise ValueError(f"No {type} source named {name!r}")
+    source = matches[0]
+    if not source.get("is_active", True):
+        raise ValueError(f"{type} source {name!r} is not active")
+    return source
@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    CONNECTOR_STATE_PATH,
+    DOCUMENTS_INDEX,
+    get_logger,
+    get_search_client,
+    get_document_intelligence_client,
+)
+from chunking import MarkdownChunker
+from create_search_index import embed_documents
+from ingest_pdfs import AnalysisCache, DocumentIntelligenceAnalyzer, extract_markdown, install_fakes
+from manifest import content_hash
+from pipeline import run_pipeline, DEFAULT_CHUNK_SIZE
+from sources import find_source
+from uploader import DocumentUploader
+
+logger = get_logger(__name__)
+
+DEFAULT_WORKERS = 16
+TEXT_EXTENSIONS = (".md", ".markdown", ".txt")
+EXTENSIONS = (*TEXT_EXTENSIONS, ".pdf")
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_tree(root: Path, extensions: tuple[str, ...] = EXTENSIONS, workers: int = DEFAULT_WORKERS) -> tuple[dict[str, tuple[int, int]], list[str]]:
+    # Lists every directory on its own worker, so a share with many folders (or high
+    # per-call latency, like SMB) is walked in parallel. Returns relative path ->
+    # (mtime_ns, size) for matching files, plus the directories that could not be read.
+    root = os.path.abspath(root)
+    prefix = len(root) + 1
+    files = {}
+    unreadable = []
+
+    def list_directory(directory: str):
+        found, subdirectories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                            stat = entry.stat()
+                            found.append((entry.path[prefix:].replace(os.sep, "/"), stat.st_mtime_ns, stat.st_size))
+                    except OSError:
+                        # removed while we were listing; the next sync sees it gone
+                        continue
+        except OSError as e:
+            logger.warning(f"Could not list {directory}: {e}")
+            return found, subdirectories, directory[prefix:].replace(os.sep, "/")
+        return found, subdirectories, None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        pending = {pool.submit(list_directory, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirectories, error = future.result()
+                if error is not None:
+                    unreadable.append(error)
+                for path, mtime_ns, size in found:
+                    files[path] = (mtime_ns, size)
+                pending.update(pool.submit(list_directory, directory) for directory in subdirectories)
+
+    return files, unreadable
+
+class FileShareState:
+    # What was last indexed for each file: relative path -> [mtime_ns, size, sha256,
+    # chunk count]. A file whose mtime and size match is not read at all; one whose
+    # mtime changed but content did not is only re-stamped.
+
+    def __init__(self, path: Path, root: str, files: dict[str, list] = None):
+        self.path = Path(path)
+        self.root = root
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path: Path, root: str) -> "FileShareState":
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(path, root)
+        if state.get("root") != root:
+            logger.warning(f"Sync state {path} belongs to {state.get('root')}, starting over for {root}")
+            return cls(path, root)
+        return cls(path, root, state.get("files", {}))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"root": self.root, "files": self.files}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+@dataclass
+class ChangeSet:
+    added: list[str]
+    modified: list[str]
+    deleted: list[str]
+    touched: list[str]
+    hashes: dict[str, str]
+    unchanged: int = 0
+
+    def __str__(self) -> str:
+        return f"{len(self.added)} added, {len(self.modified)} modified, {len(self.deleted)} deleted, {len(self.touched)} touched, {self.unchanged} unchanged"
+
+def detect_changes(
+    root: Path,
+    scanned: dict[str, tuple[int, int]],
+    state: FileShareState,
+    unreadable: list[str] = (),
+    workers: int = DEFAULT_WORKERS,
+) -> ChangeSet:
+    candidates = [
+        path for path, (mtime_ns, size) in scanned.items()
+        if (entry := state.files.get(path)) is None or entry[0] != mtime_ns or entry[1] != size
+    ]
+
+    def hash_one(path: str) -> tuple[str, str | None]:
+        try:
+            return path, hash_file(os.path.join(root, path))
+        except OSError as e:
+            logger.warning(f"Could not read {path}: {e}")
+            return path, None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as pool:
+        hashes = {path: hash for path, hash in pool.map(hash_one, candidates) if hash is not None}
+
+    added, modified, touched = [], [], []
+    for path, hash in hashes.items():
+        entry = state.files.get(path)
+        if entry is None:
+            added.append(path)
+        elif entry[2] != hash:
+            modified.append(path)
+        else:
+            touched.append(path)
+
+    # files under a directory we could not list are not known to be gone
+    hidden = tuple(f"{directory}/" if directory else "" for directory in unreadable)
+    deleted = [
+        path for path in state.files
+        if path not in scanned and not (hidden and path.startswith(hidden))
+    ]
+
+    return ChangeSet(added, modified, deleted, touched, hashes, unchanged=len(scanned) - len(candidates))
+
+def parent_id(root: str, path: str) -> str:
+    # stable, key-safe id for a file: paths may contain characters index keys can't
+    return content_hash(root, path)[:32]
+
+def chunk_ids(root: str, path: str, start: int, stop: int) -> list[str]:
+    parent = parent_id(root, path)
+    return [f"{parent}-{i}" for i in range(start, stop)]
+
+class TextExtractor:
+    # markdown and text files are read as they are; PDFs go through the layout model
+    # (and its analysis cache) the same way ingest_pdfs does
+
+    def __init__(self, analyzer_factory: Callable[[], object], cache: AnalysisCache = None):
+        self.analyzer_factory = analyzer_factory
+        self.cache = cache
+        self._analyzer = None
+        self._lock = threading.Lock()
+
+    def _get_analyzer(self):
+        with self._lock:
+            if self._analyzer is None:
+                self._analyzer = self.analyzer_factory()
+            return self._analyzer
+
+    def __call__(self, path: Path) -> str:
+        if path.suffix.lower() == ".pdf":
+            return extract_markdown(path, self._get_analyzer(), self.cache or AnalysisCache())
+        return path.read_text(encoding="utf-8", errors="replace")
+
+@dataclass
+class SyncSummary:
+    scanned: int = 0
+    changes: ChangeSet = None
+    failed: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    scan_seconds: float = 0.0
+    detect_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return f"{self.scanned} files scanned in {self.scan_seconds:.2f}s, changes detected in {self.detect_seconds:.2f}s ({self.changes}), {self.upserted} chunks upserted, {self.deleted} deleted, {self.failed} files failed, {self.elapsed_seconds:.2f}s total"
+
+def sync_file_share(
+    root: Path,
+    state: FileShareState,
+    extract: Callable[[Path], str],
+    index_name: str = DOCUMENTS_INDEX,
+    embedding_model: str = "text-embedding-ada-002",
+    chunker: MarkdownChunker = None,
+    workers: int = DEFAULT_WORKERS,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+) -> SyncSummary:
+    root = Path(root)
+    chunker = chunker or MarkdownChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    uploader = DocumentUploader(get_search_client(index_name))
+    summary = SyncSummary()
+    start = time.perf_counter()
+
+    scanned, unreadable = scan_tree(root, workers=workers)
+    summary.scanned = len(scanned)
+    summary.scan_seconds = time.perf_counter() - start
+
+    changes = detect_changes(root, scanned, state, unreadable, workers)
+    summary.changes = changes
+    summary.detect_seconds = time.perf_counter() - start - summary.scan_seconds
+    logger.info(f"{root}: {len(scanned)} files, {changes}")
+
+    for path in changes.touched:
+        mtime_ns, size = scanned[path]
+        state.files[path] = [mtime_ns, size, *state.files[path][2:]]
+
+    # a file's new state is recorded once every one of its chunks has landed, so a
+    # failed upload leaves it looking changed and the next sync retries it
+    remaining = {}
+    completed = {}
+    lock = threading.Lock()
+
+    def record(path: str, chunks: int):
+        mtime_ns, size = scanned[path]
+        completed[path] = (state.files.get(path), chunks)
+        state.files[path] = [mtime_ns, size, changes.hashes[path], chunks]
+
+    def extract_documents(path: str) -> list[dict]:
+        parent = parent_id(state.root, path)
+        return [
+            {
+                "id": f"{parent}-{chunk.index}",
+                "title": f"{path} > {chunk.heading}" if chunk.heading else path,
+                "content": chunk.text,
+                "parentId": parent,
+                "chunkIndex": chunk.index,
+                "chunkOffset": chunk.offset,
+                "chunkLength": chunk.length,
+            }
+            for chunk in chunker.chunks(extract(root / path))
+        ]
+
+    def batches() -> Iterator[list[dict]]:
+        # files are extracted on a pool with at most 2 * workers in flight and their
+        # chunks packed into batches of up to batch_size for the embed and upload stages
+        batch = []
+        pending = {}
+
+        def collect(done):
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    docs = future.result()
+                except Exception as e:
+                    summary.failed += 1
+                    logger.error(f"Could not extract {path}: {e}")
+                    continue
+                with lock:
+                    if docs:
+                        remaining[docs[0]["parentId"]] = (path, len(docs), len(docs))
+                    else:
+                        record(path, 0)
+                batch.extend(docs)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") as pool:
+            for path in changes.added + changes.modified:
+                while len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    while len(batch) >= batch_size:
+                        yield batch[:batch_size]
+                        batch = batch[batch_size:]
+                pending[pool.submit(extract_documents, path)] = path
+
+            collect(wait(pending).done)
+
+        while batch:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+
+    def on_uploaded(docs: list[dict]):
+        with lock:
+            for doc in docs:
+                path, chunks, left = remaining[doc["parentId"]]
+                remaining[doc["parentId"]] = (path, chunks, left - 1)
+                if left == 1:
+                    record(path, chunks)
+
+    def upload(docs: list[dict]):
+        result = uploader.upload(docs)
+        logger.debug(f"Uploaded documents: {result}")
+        return result
+
+    stats = run_pipeline(
+        batches(),
+        embed=lambda docs: embed_documents(docs, embedding_model),
+        upload=upload,
+        on_uploaded=on_uploaded,
+    )
+    summary.upserted = stats.upload.items
+
+    # chunks that no longer exist: all of a deleted file's, and the tail of a file
+    # that now has fewer chunks than before
+    stale = []
+    for path in changes.deleted:
+        stale.extend(chunk_ids(state.root, path, 0, state.files[path][3]))
+    for path, (previous, new_chunks) in completed.items():
+        stale.extend(chunk_ids(state.root, path, new_chunks, previous[3] if previous else 0))
+    if stale:
+        result = uploader.delete(stale)
+        logger.info(f"Deleted documents: {result}")
+        summary.deleted = result.succeeded
+        failed = set(result.failed_keys)
+        for path in changes.deleted:
+            if not failed.intersection(chunk_ids(state.root, path, 0, state.files[path][3])):
+                del state.files[path]
+        # a file whose old tail could not be deleted keeps its previous state, so the
+        # next sync sees it as modified again and retries the delete
+        for path, (previous, new_chunks) in completed.items():
+            if previous and failed.intersection(chunk_ids(state.root, path, new_chunks, previous[3])):
+                state.files[path] = previous
+    else:
+        for path in changes.deleted:
+            del state.files[path]
+
+    state.save()
+
+    summary.elapsed_seconds = time.perf_counter() - start
+    logger.info(f"File share sync: {summary}")
+
+    return summary
+
+def state_path(root: str, fake: bool = False) -> Path:
+    # fake runs keep their own state, so they never mark files as indexed for real
+    return CONNECTOR_STATE_PATH / f"file_share-{content_hash(root)[:16]}{'-fake' if fake else ''}.json"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the new, changed and removed files of a File Share source")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--source", help="name of a File Share source configured in the frontend")
+    target.add_argument("--path", type=Path, help="directory to sync")
+    parser.add_argument("--index", default=DOCUMENTS_INDEX)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--fake", action="store_true", help="use fake analysis, embeddings and search clients")
+    args = parser.parse_args()
+
+    root = Path(args.path or find_source(args.source, "File Share")["file_path"]).resolve()
+    if not root.is_dir():
+        parser.error(f"{root} is not a directory")
+
+    if args.fake:
+        CONNECTOR_STATE_PATH.mkdir(parents=True, exist_ok=True)
+        analyzer = install_fakes(args.index, CONNECTOR_STATE_PATH)
+        extract = TextExtractor(lambda: analyzer)
+    else:
+        from create_search_index import create_index
+
+        create_index(args.index)
+        extract = TextExtractor(lambda: DocumentIntelligenceAnalyzer(get_document_intelligence_client()))
+
+    sync_file_share(
+        root,
+        FileShareState.load(state_path(str(root), args.fake), str(root)),
+        extract,
+        index_name=args.index,
+        workers=args.workers,
+    )
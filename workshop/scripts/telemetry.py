@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from opentelemetry import metrics, trace
+
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+
+stage_duration = meter.create_histogram("rag.stage.duration", unit="ms", description="Duration of each RAG pipeline stage")
+stage_tokens = meter.create_histogram("rag.stage.tokens", unit="{token}", description="Tokens sent or received by each RAG pipeline stage")
+stage_documents = meter.create_histogram("rag.stage.documents", unit="{document}", description="Documents returned or rendered by each RAG pipeline stage")
+
+_current_stage = ContextVar("current_stage", default=None)
+
+class Stage:
+    def __init__(self, name: str, span: trace.Span):
+        self.name = name
+        self.span = span
+
+    def tokens(self, input_tokens: int = None, output_tokens: int = None):
+        for token_type, count in (("input", input_tokens), ("output", output_tokens)):
+            if count is None:
+                continue
+            self.span.set_attribute(f"gen_ai.usage.{token_type}_tokens", count)
+            stage_tokens.record(count, {"rag.stage": self.name, "gen_ai.token.type": token_type})
+
+    def documents(self, count: int):
+        self.span.set_attribute("rag.documents.count", count)
+        stage_documents.record(count, {"rag.stage": self.name})
+
+@contextmanager
+def stage(name: str, timings: dict = None, **attributes) -> Iterator[Stage]:
+    # one child span and one duration sample per pipeline stage; spans follow the
+    # configured sampler, the histograms are always recorded
+    start = time.perf_counter()
+    outcome = "error"
+    with tracer.start_as_current_span(name, attributes={"rag.stage": name, **attributes}) as span:
+        current = Stage(name, span)
+        token = _current_stage.set(current)
+        try:
+            yield current
+            outcome = "ok"
+        finally:
+            _current_stage.reset(token)
+            elapsed = time.perf_counter() - start
+            if timings is not None:
+                timings[name] = elapsed
+            stage_duration.record(elapsed * 1000, {"rag.stage": name, "rag.stage.outcome": outcome})
+
+def record_usage(usage):
+    # lets client wrappers deep in the call stack report token usage to whichever
+    # stage is running, without threading the stage through every signature
+    current = _current_stage.get()
+    if current is None or usage is None:
+        return
+    current.tokens(
+        input_tokens=getattr(usage, "prompt_tokens", None),
+        output_tokens=getattr(usage, "completion_tokens", None),
+    )
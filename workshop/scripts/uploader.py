@@ -0,0 +1,156 @@
+import json
+import time
+import random
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import HttpResponseError
+from config import RETRYABLE_STATUS_CODES as SERVICE_RETRYABLE_STATUS_CODES, get_logger
+
+logger = get_logger(__name__)
+
+# Azure AI Search accepts at most 1000 actions and 16 MB per indexing request
+DEFAULT_MAX_BATCH_DOCS = 1000
+DEFAULT_MAX_BATCH_BYTES = 14 * 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+
+# the service's transient errors, plus 409/422: transient per-document conflicts
+RETRYABLE_STATUS_CODES = (409, 422, *SERVICE_RETRYABLE_STATUS_CODES)
+
+@dataclass
+class UploadSummary:
+    succeeded: int = 0
+    failed: int = 0
+    retried: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+    batch_seconds: list[float] = field(default_factory=list)
+    failed_keys: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        slowest = max(self.batch_seconds, default=0.0)
+        return f"{self.succeeded} succeeded, {self.failed} failed, {self.retried} retried in {self.batches} batches, {self.elapsed_seconds:.2f}s (slowest batch {slowest:.2f}s)"
+
+def split_batches(docs: list[dict], max_docs: int = DEFAULT_MAX_BATCH_DOCS, max_bytes: int = DEFAULT_MAX_BATCH_BYTES) -> list[list[dict]]:
+    batches = []
+    batch = []
+    batch_bytes = 0
+
+    for doc in docs:
+        size = len(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+        if batch and (len(batch) >= max_docs or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(doc)
+        batch_bytes += size
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+def _backoff(attempt: int) -> float:
+    return min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class DocumentUploader:
+    def __init__(
+        self,
+        search_client,
+        key_field: str = "id",
+        max_batch_docs: int = DEFAULT_MAX_BATCH_DOCS,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.search_client = search_client
+        self.key_field = key_field
+        self.max_batch_docs = max_batch_docs
+        self.max_batch_bytes = max_batch_bytes
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+    def _send(self, action: str, docs: list[dict]):
+        if action == "delete":
+            return self.search_client.delete_documents(documents=docs)
+        if action == "merge":
+            return self.search_client.merge_documents(documents=docs)
+        if action == "mergeOrUpload":
+            return self.search_client.merge_or_upload_documents(documents=docs)
+        return self.search_client.upload_documents(documents=docs)
+
+    def _upload_batch(self, action: str, batch: list[dict], summary: UploadSummary, lock: threading.Lock):
+        start = time.perf_counter()
+        pending = batch
+        failed_keys = []
+        retried = 0
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                results = self._send(action, pending)
+            except HttpResponseError as e:
+                if e.status_code == 413 and len(pending) > 1:
+                    half = len(pending) // 2
+                    logger.warning(f"Batch of {len(pending)} too large, splitting")
+                    self._upload_batch(action, pending[:half], summary, lock)
+                    self._upload_batch(action, pending[half:], summary, lock)
+                    pending = []
+                    break
+                if e.status_code in RETRYABLE_STATUS_CODES and not last_attempt:
+                    retried += len(pending)
+                    time.sleep(_backoff(attempt))
+                    continue
+                logger.error(f"Batch of {len(pending)} documents failed: {e}")
+                failed_keys.extend(str(doc[self.key_field]) for doc in pending)
+                pending = []
+                break
+
+            by_key = {str(doc[self.key_field]): doc for doc in pending}
+            retry = []
+            for result in results:
+                if result.succeeded:
+                    continue
+                if result.status_code in RETRYABLE_STATUS_CODES and not last_attempt:
+                    retry.append(by_key[result.key])
+                else:
+                    logger.warning(f"Document {result.key} failed ({result.status_code}): {result.error_message}")
+                    failed_keys.append(result.key)
+
+            with lock:
+                summary.succeeded += sum(1 for result in results if result.succeeded)
+
+            pending = retry
+            if not pending:
+                break
+            retried += len(pending)
+            time.sleep(_backoff(attempt))
+
+        with lock:
+            summary.failed += len(failed_keys)
+            summary.failed_keys.extend(failed_keys)
+            summary.retried += retried
+            summary.batches += 1
+            summary.batch_seconds.append(time.perf_counter() - start)
+
+    def upload(self, docs: list[dict], action: str = "upload") -> UploadSummary:
+        summary = UploadSummary()
+        lock = threading.Lock()
+        batches = split_batches(docs, self.max_batch_docs, self.max_batch_bytes)
+
+        start = time.perf_counter()
+        if len(batches) == 1:
+            self._upload_batch(action, batches[0], summary, lock)
+        elif batches:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for _ in pool.map(lambda batch: self._upload_batch(action, batch, summary, lock), batches):
+                    pass
+        summary.elapsed_seconds = time.perf_counter() - start
+
+        logger.debug(f"Upload ({action}): {summary}")
+
+        return summary
+
+    def delete(self, keys: list[str]) -> UploadSummary:
+        return self.upload([{self.key_field: key} for key in keys], action="delete")
@@ -0,0 +1,194 @@
+import math
+import heapq
+import random
+import numpy as np
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class ExactIndex:
+    def __init__(self, vectors: np.ndarray):
+        # vectors are expected to be L2-normalized so a dot product is cosine similarity
+        self.vectors = vectors
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+        if len(self.vectors) == 0:
+            return []
+        similarities = self.vectors @ query
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(int(i), float(similarities[i])) for i in top]
+
+class HnswIndex:
+    # Hierarchical navigable small world graph (Malkov & Yashunin) over cosine distance.
+    # Layer 0 keeps up to 2 * m neighbours per node, upper layers up to m.
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        seed: int = 0,
+        graph: tuple[list[dict[int, list[int]]], int] = None,
+    ):
+        self.vectors = vectors
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1 / math.log(max(m, 2))
+        self._rng = random.Random(seed)
+        self.layers: list[dict[int, list[int]]] = []
+        self.entry_point = None
+
+        if graph is not None:
+            # restore a graph written by save() instead of building it again
+            self.layers, self.entry_point = graph
+            return
+
+        for i in range(len(vectors)):
+            self._insert(i)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def save(self, path):
+        # each layer as its node ids plus their neighbour lists flattened with offsets
+        arrays = {"entry_point": np.asarray([-1 if self.entry_point is None else self.entry_point])}
+        for level, layer in enumerate(self.layers):
+            nodes = np.fromiter(layer, dtype=np.int64, count=len(layer))
+            lengths = np.fromiter((len(layer[node]) for node in nodes), dtype=np.int64, count=len(nodes))
+            arrays[f"nodes_{level}"] = nodes
+            arrays[f"offsets_{level}"] = np.concatenate(([0], np.cumsum(lengths)))
+            arrays[f"neighbors_{level}"] = np.fromiter(
+                (n for node in nodes for n in layer[node]), dtype=np.int64, count=int(lengths.sum())
+            )
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path, vectors: np.ndarray, m: int, ef_construction: int, ef_search: int = 64) -> "HnswIndex":
+        with np.load(path) as arrays:
+            entry_point = int(arrays["entry_point"][0])
+            layers = []
+            for level in range(sum(1 for name in arrays.files if name.startswith("nodes_"))):
+                nodes = arrays[f"nodes_{level}"].tolist()
+                offsets = arrays[f"offsets_{level}"].tolist()
+                neighbors = arrays[f"neighbors_{level}"].tolist()
+                layers.append({node: neighbors[offsets[j]:offsets[j + 1]] for j, node in enumerate(nodes)})
+        graph = (layers, None if entry_point < 0 else entry_point)
+        return cls(vectors, m=m, ef_construction=ef_construction, ef_search=ef_search, graph=graph)
+
+    def _distances(self, ids: list[int], query: np.ndarray) -> np.ndarray:
+        return 1.0 - self.vectors[ids] @ query
+
+    def _search_layer(self, query: np.ndarray, entry_points: list[int], ef: int, level: int) -> list[tuple[float, int]]:
+        layer = self.layers[level]
+        visited = set(entry_points)
+        distances = self._distances(entry_points, query)
+        candidates = [(float(d), i) for d, i in zip(distances, entry_points)]
+        heapq.heapify(candidates)
+        results = [(-d, i) for d, i in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            distance, current = heapq.heappop(candidates)
+            if distance > -results[0][0] and len(results) >= ef:
+                break
+            neighbors = [n for n in layer.get(current, ()) if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for neighbor, neighbor_distance in zip(neighbors, self._distances(neighbors, query)):
+                neighbor_distance = float(neighbor_distance)
+                if len(results) < ef or neighbor_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbor_distance, neighbor))
+                    heapq.heappush(results, (-neighbor_distance, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, i) for d, i in results)
+
+    def _select_neighbors(self, candidates: list[tuple[float, int]], m: int) -> list[int]:
+        # neighbour selection heuristic: prefer candidates that are closer to the new
+        # node than to any already selected neighbour, then backfill with the pruned ones
+        selected = []
+        pruned = []
+        for distance, candidate in candidates:
+            if len(selected) >= m:
+                break
+            if selected:
+                to_selected = self._distances(selected, self.vectors[candidate])
+                if np.any(to_selected < distance):
+                    pruned.append(candidate)
+                    continue
+            selected.append(candidate)
+        for candidate in pruned:
+            if len(selected) >= m:
+                break
+            selected.append(candidate)
+        return selected
+
+    def _insert(self, node: int):
+        query = self.vectors[node]
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+
+        if self.entry_point is None:
+            self.layers = [{} for _ in range(level + 1)]
+            for lc in range(level + 1):
+                self.layers[lc][node] = []
+            self.entry_point = node
+            return
+
+        top_level = len(self.layers) - 1
+        entry_points = [self.entry_point]
+
+        for lc in range(top_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, lc)[0][1]]
+
+        for lc in range(min(level, top_level), -1, -1):
+            max_neighbors = self.m0 if lc == 0 else self.m
+            candidates = self._search_layer(query, entry_points, self.ef_construction, lc)
+            neighbors = self._select_neighbors(candidates, self.m)
+            layer = self.layers[lc]
+            layer[node] = neighbors
+
+            for neighbor in neighbors:
+                links = layer[neighbor]
+                links.append(node)
+                if len(links) > max_neighbors:
+                    distances = self._distances(links, self.vectors[neighbor])
+                    layer[neighbor] = self._select_neighbors(sorted(zip(distances.tolist(), links)), max_neighbors)
+
+            entry_points = [i for _, i in candidates]
+
+        for lc in range(top_level + 1, level + 1):
+            self.layers.append({node: []})
+
+        if level > top_level:
+            self.entry_point = node
+
+    def search(self, query: np.ndarray, k: int, ef_search: int = None) -> list[tuple[int, float]]:
+        if self.entry_point is None:
+            return []
+
+        ef = max(ef_search or self.ef_search, k)
+        top_level = len(self.layers) - 1
+        entry_points = [self.entry_point]
+
+        for lc in range(top_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, lc)[0][1]]
+
+        results = self._search_layer(query, entry_points, ef, 0)[:k]
+
+        return [(i, 1.0 - d) for d, i in results]